@@ -5,9 +5,15 @@
 
 from typing import Dict, List, Optional
 from enum import Enum
-from llm_service.deepseek_adapter import DeepSeekAdapter
+from agent.memory import ConversationMemory, extractive_summarizer, llm_summarizer
+from agent.session_store import AgentSession, agent_session_store
+from config import settings
+from llm_service.deepseek_adapter import DeepSeekAdapter, get_deepseek_adapter
 from rag_service.retriever import RAGRetriever
 from knowledge_base.manager import KnowledgeBaseManager
+from knowledge_base.catalog import card_catalog
+from knowledge_base.search_index import card_search_index
+from knowledge_base.summaries import card_brief
 
 class AgentState(Enum):
     """智能体状态枚举"""
@@ -21,24 +27,49 @@ class AgentState(Enum):
 class CreditCardAgent:
     """信用卡智能体类"""
     
-    def __init__(self):
+    def __init__(self, llm_adapter: Optional[DeepSeekAdapter] = None,
+                 retriever: Optional[RAGRetriever] = None):
         self.state = AgentState.INITIAL
-        self.llm_adapter = DeepSeekAdapter()
-        self.retriever = RAGRetriever()
+        # 未注入时使用进程共享的适配器和 HTTP 客户端，创建智能体不会新建连接
+        self.llm_adapter = llm_adapter if llm_adapter is not None else get_deepseek_adapter()
+        self.retriever = retriever if retriever is not None else RAGRetriever()
         self.kb_manager = KnowledgeBaseManager()
         self.user_profile = {}
-        self.conversation_history = []
+        # 最近几轮原样保留，更早的对话并入滚动摘要
+        self.memory = ConversationMemory(
+            max_turns=settings.AGENT_MEMORY_TURNS,
+            max_tokens=settings.AGENT_MEMORY_TOKENS,
+            summary_tokens=settings.AGENT_SUMMARY_TOKENS,
+            fold_batch=settings.AGENT_MEMORY_FOLD_BATCH,
+            summarizer=llm_summarizer(self.llm_adapter) if settings.AGENT_MEMORY_LLM_SUMMARY else extractive_summarizer
+        )
+    
+    @property
+    def conversation_history(self) -> List[Dict[str, str]]:
+        """保留的原始对话消息，更早的对话见 memory.summary"""
+        return self.memory.messages()
+    
+    def export_session(self, conversation_id: int) -> AgentSession:
+        """导出可持久化的状态"""
+        return AgentSession(conversation_id, self.state.value, self.user_profile, self.memory.export_state())
+    
+    def restore_session(self, session: AgentSession):
+        """从会话存储恢复状态"""
+        self.state = AgentState(session.state)
+        self.user_profile = session.user_profile
+        self.memory.restore_state(session.memory)
     
     async def process_message(self, message: str) -> str:
         """处理用户消息"""
         # 更新对话历史
-        self.conversation_history.append({"role": "user", "content": message})
+        self.memory.add_user(message)
         
         # 根据当前状态处理消息
         response = await self._handle_state(message)
         
-        # 更新对话历史
-        self.conversation_history.append({"role": "assistant", "content": response})
+        # 更新对话历史，超出的旧对话并入摘要
+        self.memory.add_assistant(response)
+        await self.memory.compact()
         
         return response
     
@@ -97,13 +128,15 @@ class CreditCardAgent:
     
     async def _handle_explaining(self, message: str) -> str:
         """处理解释状态"""
-        # 检索相关文档
+        # 检索相关文档，向量检索没有结果时使用卡片摘要
         docs = await self.retriever.retrieve(message)
+        context = docs[0]['content'] if docs else "\n\n".join(await self._card_context(message))
         
         # 生成解释
         response = await self.llm_adapter.chat_completion([
             {"role": "system", "content": "你是一个专业的信用卡顾问"},
-            {"role": "user", "content": f"请根据以下信息解释这张信用卡：\n{docs[0]['content']}"}
+            *self.memory.context(),
+            {"role": "user", "content": f"请根据以下信息解释这张信用卡：\n{context}"}
         ])
         
         return response
@@ -118,16 +151,25 @@ class CreditCardAgent:
         for card_name in card_names:
             card_docs = await self.retriever.retrieve(card_name)
             if card_docs:
-                docs.append(card_docs[0])
+                docs.append(card_docs[0]['content'])
+            else:
+                docs.extend(await self._card_context(card_name))
         
         # 生成比较结果
         response = await self.llm_adapter.chat_completion([
             {"role": "system", "content": "你是一个专业的信用卡比较专家"},
-            {"role": "user", "content": f"请比较以下信用卡：\n{chr(10).join(doc['content'] for doc in docs)}"}
+            *self.memory.context(),
+            {"role": "user", "content": f"请比较以下信用卡：\n{chr(10).join(docs)}"}
         ])
         
         return response
     
+    async def _card_context(self, query: str, k: int = 1) -> List[str]:
+        """从卡片索引检索，每张卡片使用导入时生成的概要和要点"""
+        cards = await card_search_index.top_k(query, k)
+        summaries = card_catalog.summaries()
+        return [card_brief(card, summaries.get(card["id"])) for card in cards]
+    
     async def _extract_user_info(self, message: str) -> Dict:
         """提取用户信息"""
         response = await self.llm_adapter.chat_completion([
@@ -161,4 +203,15 @@ class CreditCardAgent:
     def _extract_card_names(self, message: str) -> List[str]:
         """提取信用卡名称"""
         # 这里需要实现具体的提取逻辑
-        return [] 
\ No newline at end of file
+        return []
+
+
+async def process_conversation_message(conversation_id: int, message: str) -> str:
+    """按会话ID恢复智能体并处理一条消息，处理完成后保存状态；智能体实例不跨请求保留"""
+    async with agent_session_store.checkout(conversation_id) as session:
+        agent = CreditCardAgent()
+        if session is not None:
+            agent.restore_session(session)
+        response = await agent.process_message(message)
+        await agent_session_store.save(agent.export_session(conversation_id))
+    return response
@@ -0,0 +1,221 @@
+"""
+智能体对话记忆
+最近 max_turns 轮对话原样保留，更早的对话并入滚动摘要；
+发给模型的上下文（摘要 + 最近对话）不超过 max_tokens，长对话的提示词大小不再随轮数增长
+"""
+
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, NamedTuple, Optional
+
+from knowledge_base.card_text import SENTENCE_PATTERN, estimate_tokens, truncate_tokens
+from utils.logger import setup_logger
+
+# 设置日志记录器
+logger = setup_logger('agent_memory')
+
+# 每条消息的格式开销（角色标记等）
+MESSAGE_OVERHEAD_TOKENS = 4
+# 抽取式摘要中每轮对话的问题和回答各保留的 token 数
+SUMMARY_LINE_TOKENS = 40
+SUMMARY_PREFIX = "此前对话摘要：\n"
+
+
+class Turn(NamedTuple):
+    user: str
+    assistant: str
+    tokens: int
+
+
+# 摘要函数：(已有摘要, 需要并入的对话, 摘要 token 上限) -> 新摘要
+Summarizer = Callable[[str, List[Turn], int], Awaitable[str]]
+
+
+def _message_tokens(content: str) -> int:
+    return estimate_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+
+
+def _first_sentence(text: str) -> str:
+    match = SENTENCE_PATTERN.search(text.strip())
+    return match.group(0).strip() if match else text.strip()
+
+
+def fold_extractive(summary: str, turns: List[Turn], max_tokens: int) -> str:
+    """不调用模型的摘要：每轮保留用户问题和回答的第一句，超出上限时丢弃最早的条目"""
+    lines = summary.splitlines() if summary else []
+    for turn in turns:
+        question = truncate_tokens(" ".join(turn.user.split()), SUMMARY_LINE_TOKENS)
+        answer = truncate_tokens(_first_sentence(turn.assistant), SUMMARY_LINE_TOKENS)
+        lines.append(f"用户问：{question}；回答：{answer}")
+    while len(lines) > 1 and estimate_tokens("\n".join(lines)) > max_tokens:
+        lines.pop(0)
+    return truncate_tokens("\n".join(lines), max_tokens)
+
+
+async def extractive_summarizer(summary: str, turns: List[Turn], max_tokens: int) -> str:
+    return fold_extractive(summary, turns, max_tokens)
+
+
+def llm_summarizer(llm_adapter) -> Summarizer:
+    """用模型把已有摘要和新并入的对话合并成新摘要，调用失败时退回抽取式摘要"""
+
+    async def summarize(summary: str, turns: List[Turn], max_tokens: int) -> str:
+        dialogue = "\n".join(f"用户：{turn.user}\n助手：{turn.assistant}" for turn in turns)
+        prompt = (
+            f"以下是此前对话的摘要和之后的几轮对话，请合并成一份不超过{int(max_tokens / 0.6)}字的新摘要，"
+            f"保留用户的年龄、收入、消费习惯、需求，以及已经讨论过的信用卡和结论。\n\n"
+            f"已有摘要：\n{summary or '无'}\n\n新的对话：\n{dialogue}"
+        )
+        try:
+            result = await llm_adapter.chat_completion([
+                {"role": "system", "content": "你是一个对话摘要助手，只输出摘要内容"},
+                {"role": "user", "content": prompt}
+            ], temperature=0.3)
+        except Exception as e:
+            logger.warning(f"生成对话摘要失败，改用抽取式摘要: {str(e)}")
+            return fold_extractive(summary, turns, max_tokens)
+        return truncate_tokens(result.strip(), max_tokens)
+
+    return summarize
+
+
+class ConversationMemory:
+    """有界对话记忆
+
+    - 最近 max_turns 轮对话原样保留；超出 fold_batch 轮后把多出的对话一次并入摘要，
+      使用模型摘要时减少调用次数
+    - 摘要不超过 summary_tokens
+    - context() 返回的上下文不超过 max_tokens，超出时先并入摘要（compact），
+      仍超出时只发送能放下的最近几轮
+    """
+
+    def __init__(self, max_turns: int = 6, max_tokens: int = 1500, summary_tokens: int = 300,
+                 fold_batch: int = 2, summarizer: Optional[Summarizer] = None):
+        self.max_turns = max_turns
+        self.max_tokens = max_tokens
+        self.summary_tokens = summary_tokens
+        self.fold_batch = max(1, fold_batch)
+        self.summarizer = summarizer or extractive_summarizer
+
+        self.summary = ""
+        self._turns: Deque[Turn] = deque()
+        self._turn_tokens = 0
+        self._pending_user: Optional[str] = None
+
+        self._total_turns = 0
+        self._folded_turns = 0
+        self._summarizations = 0
+
+    def add_user(self, content: str):
+        """记录用户消息，收到回复后组成一轮对话"""
+        if self._pending_user is not None:
+            # 上一条用户消息没有回复（处理失败），单独保留
+            self._append(self._pending_user, "")
+        self._pending_user = content
+
+    def add_assistant(self, content: str):
+        """记录回复"""
+        self._append(self._pending_user or "", content)
+        self._pending_user = None
+
+    def _append(self, user: str, assistant: str):
+        tokens = _message_tokens(user) + _message_tokens(assistant)
+        self._turns.append(Turn(user, assistant, tokens))
+        self._turn_tokens += tokens
+        self._total_turns += 1
+
+    def _summary_tokens(self) -> int:
+        return _message_tokens(SUMMARY_PREFIX + self.summary) if self.summary else 0
+
+    def context_tokens(self) -> int:
+        """完整上下文（摘要 + 保留的对话）的 token 数"""
+        return self._summary_tokens() + self._turn_tokens
+
+    def _fold_count(self) -> int:
+        """需要并入摘要的最早对话轮数"""
+        excess = len(self._turns) - self.max_turns
+        if excess >= self.fold_batch:
+            return excess
+        # 轮数未超但上下文超出上限时，逐轮并入直到放得下，至少保留最近一轮
+        count, tokens = 0, self.context_tokens()
+        while tokens > self.max_tokens and count < len(self._turns) - 1:
+            tokens -= self._turns[count].tokens
+            count += 1
+        return count
+
+    async def compact(self):
+        """把超出的旧对话并入摘要"""
+        count = self._fold_count()
+        if not count:
+            return
+        folded = [self._turns.popleft() for _ in range(count)]
+        self._turn_tokens -= sum(turn.tokens for turn in folded)
+        self.summary = await self.summarizer(self.summary, folded, self.summary_tokens)
+        self._folded_turns += count
+        self._summarizations += 1
+
+    def context(self) -> List[Dict[str, str]]:
+        """发给模型的历史消息：摘要（系统消息）加上预算内的最近几轮，不含尚未回复的用户消息"""
+        messages: List[Dict[str, str]] = []
+        budget = self.max_tokens - self._summary_tokens()
+        recent: List[Turn] = []
+        for turn in reversed(self._turns):
+            if turn.tokens > budget:
+                break
+            recent.append(turn)
+            budget -= turn.tokens
+        if self.summary:
+            messages.append({"role": "system", "content": SUMMARY_PREFIX + self.summary})
+        for turn in reversed(recent):
+            if turn.user:
+                messages.append({"role": "user", "content": turn.user})
+            if turn.assistant:
+                messages.append({"role": "assistant", "content": turn.assistant})
+        return messages
+
+    def messages(self) -> List[Dict[str, str]]:
+        """保留的全部原始消息（包括尚未回复的用户消息）"""
+        messages = []
+        for turn in self._turns:
+            if turn.user:
+                messages.append({"role": "user", "content": turn.user})
+            if turn.assistant:
+                messages.append({"role": "assistant", "content": turn.assistant})
+        if self._pending_user is not None:
+            messages.append({"role": "user", "content": self._pending_user})
+        return messages
+
+    def export_state(self) -> List:
+        """导出可序列化的状态（只含基本类型），用于会话存储"""
+        return [
+            self.summary,
+            [[turn.user, turn.assistant] for turn in self._turns],
+            self._pending_user,
+            self._total_turns,
+            self._folded_turns,
+            self._summarizations,
+        ]
+
+    def restore_state(self, state: List):
+        """从 export_state() 的结果恢复"""
+        summary, turns, pending_user, total_turns, folded_turns, summarizations = state
+        self.summary = summary or ""
+        self._turns.clear()
+        self._turn_tokens = 0
+        for user, assistant in turns:
+            self._append(user, assistant)
+        self._pending_user = pending_user
+        self._total_turns = total_turns
+        self._folded_turns = folded_turns
+        self._summarizations = summarizations
+
+    def stats(self) -> Dict:
+        """记忆大小指标"""
+        return {
+            "turns_total": self._total_turns,
+            "turns_kept": len(self._turns),
+            "turns_folded": self._folded_turns,
+            "summarizations": self._summarizations,
+            "summary_tokens": self._summary_tokens(),
+            "context_tokens": self.context_tokens(),
+            "max_tokens": self.max_tokens,
+        }
@@ -0,0 +1,254 @@
+"""
+智能体会话存储
+按会话ID保存智能体的状态、用户画像和对话记忆。每次保存都紧凑序列化（安装 msgpack 时使用 msgpack，
+否则使用 JSON）后写入 agent_sessions 表，进程内只缓存序列化后的字节，按条数和总字节数 LRU 淘汰；
+淘汰不需要再写数据库，多个 worker 通过版本号读取到最新状态，冷会话在首次访问时才从数据库加载
+"""
+
+import asyncio
+import json
+import time
+import weakref
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, NamedTuple, Optional
+
+from config import settings
+from database.async_db import run_db
+from database.pool import db_pool
+from utils.logger import setup_logger
+from utils.metrics import Histogram
+
+try:
+    import msgpack
+except ImportError:  # 未安装时使用 JSON
+    msgpack = None
+
+# 设置日志记录器
+logger = setup_logger('agent_sessions')
+
+# 序列化数据的第一个字节标记编码格式，不同 worker 的编码方式不同时也能互相读取
+FORMAT_JSON = 0
+FORMAT_MSGPACK = 1
+# 会话内容的结构版本，字段变化时加一，旧版本的数据视为不存在
+SESSION_SCHEMA_VERSION = 1
+
+SIZE_BUCKETS = (256, 512, 1024, 2048, 4096, 8192, 16384, 32768, 65536)
+
+SELECT_SQL = """
+SELECT version, IF(version = %s, NULL, data) AS data
+FROM agent_sessions WHERE conversation_id = %s
+"""
+UPSERT_SQL = """
+INSERT INTO agent_sessions (conversation_id, data, version) VALUES (%s, %s, 1)
+ON DUPLICATE KEY UPDATE data = VALUES(data), version = version + 1
+"""
+
+
+class AgentSession:
+    """智能体的可持久化状态"""
+
+    __slots__ = ("conversation_id", "state", "user_profile", "memory")
+
+    def __init__(self, conversation_id: int, state: str, user_profile: Dict, memory: List):
+        self.conversation_id = conversation_id
+        self.state = state
+        self.user_profile = user_profile
+        # ConversationMemory.export_state() 的结果
+        self.memory = memory
+
+    def to_list(self) -> List:
+        # 按位置而不是字段名编码，序列化结果更小
+        return [SESSION_SCHEMA_VERSION, self.state, self.user_profile, self.memory]
+
+    @classmethod
+    def from_list(cls, conversation_id: int, data: List) -> Optional["AgentSession"]:
+        if not data or data[0] != SESSION_SCHEMA_VERSION:
+            return None
+        _, state, user_profile, memory = data
+        return cls(conversation_id, state, user_profile, memory)
+
+
+def encode_session(session: AgentSession) -> bytes:
+    payload = session.to_list()
+    if msgpack is not None:
+        return bytes((FORMAT_MSGPACK,)) + msgpack.packb(payload, use_bin_type=True)
+    return bytes((FORMAT_JSON,)) + json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def decode_session(conversation_id: int, data: bytes) -> Optional[AgentSession]:
+    """解码会话，格式无法识别或结构版本不同时返回None"""
+    if not data:
+        return None
+    fmt, body = data[0], data[1:]
+    try:
+        if fmt == FORMAT_MSGPACK:
+            if msgpack is None:
+                logger.warning(f"会话 {conversation_id} 为 msgpack 格式，但当前进程未安装 msgpack")
+                return None
+            payload = msgpack.unpackb(body, raw=False)
+        elif fmt == FORMAT_JSON:
+            payload = json.loads(body.decode("utf-8"))
+        else:
+            return None
+    except (ValueError, TypeError) as e:
+        logger.warning(f"会话 {conversation_id} 解码失败: {str(e)}")
+        return None
+    return AgentSession.from_list(conversation_id, payload)
+
+
+class _Entry(NamedTuple):
+    data: bytes
+    version: int
+
+
+def _load(conversation_id: int, cached_version: Optional[int]):
+    """读取版本号，版本与缓存不同时一并读取数据（在数据库线程池中执行）"""
+    with db_pool.connection() as conn:
+        cursor = conn.cursor(dictionary=True)
+        try:
+            cursor.execute(SELECT_SQL, (cached_version if cached_version is not None else -1, conversation_id))
+            return cursor.fetchone()
+        finally:
+            cursor.close()
+
+
+def _store(conversation_id: int, data: bytes) -> int:
+    """写入会话并返回新版本号（在数据库线程池中执行）"""
+    with db_pool.connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(UPSERT_SQL, (conversation_id, data))
+            cursor.execute("SELECT version FROM agent_sessions WHERE conversation_id = %s", (conversation_id,))
+            version = cursor.fetchone()[0]
+            conn.commit()
+            return version
+        finally:
+            cursor.close()
+
+
+class AgentSessionStore:
+    """智能体会话存储
+
+    - save() 写穿到数据库，同时把序列化结果放入进程内 LRU
+    - load() 先用一条只读版本号的主键查询确认缓存是否最新，版本不同（其他 worker 更新过）时才读取数据
+    - 缓存按条数 max_sessions 和总字节数 max_bytes 淘汰，单个会话超过 max_session_bytes 时
+      丢弃最早的原样对话，摘要和用户画像保留
+    - 同一进程内同一会话的处理串行执行（checkout），避免并发的两轮互相覆盖
+    """
+
+    def __init__(self, max_sessions: int = 1000, max_bytes: int = 16 * 1024 * 1024,
+                 max_session_bytes: int = 32 * 1024):
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.max_session_bytes = max_session_bytes
+        self._cache: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._locks: "weakref.WeakValueDictionary[int, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+        self._hits = 0
+        self._stale = 0
+        self._db_loads = 0
+        self._misses = 0
+        self._saves = 0
+        self._evictions = 0
+        self._trimmed = 0
+        self._save_time_total = 0.0
+        self._session_bytes = Histogram(buckets=SIZE_BUCKETS, unit="bytes")
+
+    def _put(self, conversation_id: int, entry: _Entry):
+        previous = self._cache.pop(conversation_id, None)
+        if previous is not None:
+            self._bytes -= len(previous.data)
+        self._cache[conversation_id] = entry
+        self._bytes += len(entry.data)
+        while self._cache and (len(self._cache) > self.max_sessions or self._bytes > self.max_bytes):
+            _, evicted = self._cache.popitem(last=False)
+            self._bytes -= len(evicted.data)
+            self._evictions += 1
+
+    def _encode(self, session: AgentSession) -> bytes:
+        data = encode_session(session)
+        turns = session.memory[1]
+        while len(data) > self.max_session_bytes and turns:
+            turns.pop(0)
+            data = encode_session(session)
+            self._trimmed += 1
+        return data
+
+    async def load(self, conversation_id: int) -> Optional[AgentSession]:
+        """读取会话，不存在时返回None"""
+        cached = self._cache.get(conversation_id)
+        row = await run_db(_load, conversation_id, cached.version if cached else None)
+        if row is None:
+            if cached is not None:
+                # 会话已删除（外键级联）
+                self._bytes -= len(self._cache.pop(conversation_id).data)
+            self._misses += 1
+            return None
+        if cached is not None and row["data"] is None:
+            self._hits += 1
+            self._cache.move_to_end(conversation_id)
+            return decode_session(conversation_id, cached.data)
+
+        if cached is not None:
+            self._stale += 1
+        self._db_loads += 1
+        data = bytes(row["data"])
+        self._put(conversation_id, _Entry(data, row["version"]))
+        return decode_session(conversation_id, data)
+
+    async def save(self, session: AgentSession):
+        """序列化并写入数据库和缓存"""
+        data = self._encode(session)
+        start = time.monotonic()
+        version = await run_db(_store, session.conversation_id, data)
+        self._save_time_total += time.monotonic() - start
+        self._saves += 1
+        self._session_bytes.observe(len(data))
+        self._put(session.conversation_id, _Entry(data, version))
+
+    def discard(self, conversation_id: int):
+        """从进程内缓存移除，数据库中的记录随会话删除"""
+        entry = self._cache.pop(conversation_id, None)
+        if entry is not None:
+            self._bytes -= len(entry.data)
+
+    @asynccontextmanager
+    async def checkout(self, conversation_id: int) -> AsyncIterator[Optional[AgentSession]]:
+        """串行处理同一会话：读取会话，调用方处理完后自行 save()"""
+        lock = self._locks.get(conversation_id)
+        if lock is None:
+            lock = self._locks[conversation_id] = asyncio.Lock()
+        async with lock:
+            yield await self.load(conversation_id)
+
+    def stats(self) -> Dict:
+        """会话存储指标"""
+        lookups = self._hits + self._db_loads + self._misses
+        return {
+            "encoding": "msgpack" if msgpack is not None else "json",
+            "cached_sessions": len(self._cache),
+            "max_sessions": self.max_sessions,
+            "cached_bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "avg_session_bytes": round(self._bytes / len(self._cache)) if self._cache else 0,
+            "max_session_bytes": self.max_session_bytes,
+            "hits": self._hits,
+            "stale": self._stale,
+            "db_loads": self._db_loads,
+            "misses": self._misses,
+            "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+            "saves": self._saves,
+            "avg_save_ms": round(self._save_time_total / self._saves * 1000, 2) if self._saves else 0.0,
+            "evictions": self._evictions,
+            "trimmed_turns": self._trimmed,
+            "session_bytes": self._session_bytes.stats(),
+        }
+
+
+agent_session_store = AgentSessionStore(
+    max_sessions=settings.AGENT_SESSION_CACHE_SIZE,
+    max_bytes=settings.AGENT_SESSION_CACHE_BYTES,
+    max_session_bytes=settings.AGENT_SESSION_MAX_BYTES
+)
@@ -1,7 +1,6 @@
 import os
 import jwt
 from jwt.exceptions import PyJWTError, ExpiredSignatureError
-import bcrypt
 import logging
 from datetime import datetime, timedelta
 from fastapi import APIRouter, HTTPException, Depends, status
@@ -9,7 +8,10 @@ from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from pydantic import BaseModel
 from typing import Optional
 from config import settings
-from database.db import get_db_connection
+from database.pool import db_pool
+from database.async_db import run_db, fetch_one
+from utils.cache import TTLCache
+from utils.password import password_hasher, PasswordHasherBusy
 
 # 设置日志
 logging.basicConfig(level=logging.DEBUG)
@@ -17,13 +19,8 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-# 测试账号
-TEST_USER = {
-    "username": "test",
-    "email": "test@example.com",
-    "password": bcrypt.hashpw("123456".encode(), bcrypt.gensalt()).decode(),
-    "id": 1
-}
+# 测试账号的用户名保留，不允许注册
+TEST_USERNAME = "test"
 
 # JWT配置
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here")
@@ -48,6 +45,19 @@ class TokenData(BaseModel):
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
+# 已认证用户缓存：用户名 -> users表行，稳态下受保护接口无需查库
+user_cache = TTLCache(maxsize=settings.USER_CACHE_SIZE, ttl=settings.USER_CACHE_TTL)
+
+def invalidate_user(username: str):
+    """用户资料变更后使缓存失效"""
+    user_cache.pop(username)
+
+def update_cached_user(username: str, **fields):
+    """就地更新缓存中的用户字段（如活动会话指针），未缓存时忽略"""
+    user = user_cache.get(username)
+    if user is not None:
+        user.update(fields)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -58,7 +68,8 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme)):
+async def authenticate_token(token: str) -> dict:
+    """校验访问令牌并返回用户行（供 HTTP 依赖和 WebSocket 握手共用）"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -79,57 +90,74 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     except PyJWTError:
         raise credentials_exception
     
-    db = get_db_connection()
-    cursor = db.cursor(dictionary=True)
-    
-    try:
-        cursor.execute("SELECT * FROM users WHERE username = %s", (token_data.username,))
-        user = cursor.fetchone()
+    user = user_cache.get(token_data.username)
+    if user is None:
+        user = await fetch_one("SELECT * FROM users WHERE username = %s", (token_data.username,))
         if user is None:
             raise credentials_exception
-        return user
-    finally:
-        cursor.close()
-        db.close()
+        user_cache.set(token_data.username, user)
+    return dict(user)
+
+async def get_current_user(token: str = Depends(oauth2_scheme)):
+    return await authenticate_token(token)
+
+def _ensure_available(cursor, username: str, email: str):
+    """用户名或邮箱已被注册时抛出400"""
+    # 检查用户名是否已存在
+    cursor.execute("SELECT id FROM users WHERE username = %s", (username,))
+    if cursor.fetchone():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Username already registered"
+        )
+
+    # 检查邮箱是否已存在
+    cursor.execute("SELECT id FROM users WHERE email = %s", (email,))
+    if cursor.fetchone():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Email already registered"
+        )
+
+def _check_available(username: str, email: str):
+    """计算密码哈希前检查唯一性，重复注册不占用哈希线程（在数据库线程池中执行）"""
+    with db_pool.connection() as db:
+        cursor = db.cursor(dictionary=True)
+        try:
+            _ensure_available(cursor, username, email)
+        finally:
+            cursor.close()
+
+def _create_user(username: str, email: str, password_hash: str):
+    """再次检查唯一性（哈希期间可能有并发注册）并写入新用户（在数据库线程池中执行）"""
+    with db_pool.connection() as db:
+        cursor = db.cursor(dictionary=True)
+        try:
+            _ensure_available(cursor, username, email)
+
+            # 插入新用户
+            cursor.execute(
+                "INSERT INTO users (username, email, password_hash) VALUES (%s, %s, %s)",
+                (username, email, password_hash)
+            )
+            db.commit()
+        finally:
+            cursor.close()
 
 @router.post("/register", response_model=Token)
 async def register(user: UserRegister):
-    if user.username == TEST_USER["username"]:
+    if user.username == TEST_USERNAME:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Username already registered"
         )
     
     try:
-        # 连接数据库
-        db = get_db_connection()
-        cursor = db.cursor(dictionary=True)
-        
-        # 检查用户名是否已存在
-        cursor.execute("SELECT id FROM users WHERE username = %s", (user.username,))
-        if cursor.fetchone():
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Username already registered"
-            )
-            
-        # 检查邮箱是否已存在
-        cursor.execute("SELECT id FROM users WHERE email = %s", (user.email,))
-        if cursor.fetchone():
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Email already registered"
-            )
-        
-        # 对密码进行哈希处理
-        password_hash = bcrypt.hashpw(user.password.encode(), bcrypt.gensalt()).decode()
+        # 用户名和邮箱可用时才计算密码哈希
+        await run_db(_check_available, user.username, user.email)
+        password_hash = await password_hasher.hash(user.password)
         
-        # 插入新用户
-        cursor.execute(
-            "INSERT INTO users (username, email, password_hash) VALUES (%s, %s, %s)",
-            (user.username, user.email, password_hash)
-        )
-        db.commit()
+        await run_db(_create_user, user.username, user.email, password_hash)
         
         # 生成访问令牌
         access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -139,47 +167,28 @@ async def register(user: UserRegister):
         
         return {"access_token": access_token, "token_type": "bearer"}
         
+    except (HTTPException, PasswordHasherBusy):
+        raise
     except Exception as e:
         logger.error(f"注册失败: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Registration failed: {str(e)}"
         )
-    finally:
-        if 'cursor' in locals():
-            cursor.close()
-        if 'db' in locals():
-            db.close()
 
 @router.post("/login")
 async def login(form_data: OAuth2PasswordRequestForm = Depends()):
     logger.debug(f"尝试登录用户: {form_data.username}")
-    db = None
-    cursor = None
     
     try:
-        # 连接数据库
-        try:
-            db = get_db_connection()
-            cursor = db.cursor(dictionary=True)
-            logger.debug("数据库连接成功")
-        except Exception as e:
-            logger.error(f"数据库连接失败: {str(e)}")
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"Database connection error: {str(e)}"
-            )
-
         # 查询用户
         try:
             if "@" in form_data.username:
                 logger.debug(f"使用邮箱登录: {form_data.username}")
-                cursor.execute("SELECT * FROM users WHERE email = %s", (form_data.username,))
+                user = await fetch_one("SELECT * FROM users WHERE email = %s", (form_data.username,))
             else:
                 logger.debug(f"使用用户名登录: {form_data.username}")
-                cursor.execute("SELECT * FROM users WHERE username = %s", (form_data.username,))
-            
-            user = cursor.fetchone()
+                user = await fetch_one("SELECT * FROM users WHERE username = %s", (form_data.username,))
             logger.debug(f"查询到的用户信息: {user}")
         except Exception as e:
             logger.error(f"查询用户失败: {str(e)}")
@@ -199,29 +208,28 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
         # 验证密码
         try:
             logger.debug("开始验证密码")
-            password_bytes = form_data.password.encode()
             stored_hash = user["password_hash"]
-            stored_hash_bytes = stored_hash.encode()
-            
-            logger.debug(f"输入的密码: {form_data.password}")
             logger.debug(f"存储的密码哈希: {stored_hash}")
             
-            password_matches = bcrypt.checkpw(password_bytes, stored_hash_bytes)
+            password_matches = await password_hasher.verify(form_data.password, stored_hash)
             logger.debug(f"密码验证结果: {password_matches}")
-            
-            if not password_matches:
-                logger.warning(f"密码错误: {form_data.username}")
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="Incorrect username/email or password",
-                    headers={"WWW-Authenticate": "Bearer"},
-                )
+        except PasswordHasherBusy:
+            logger.warning(f"密码校验排队已满，拒绝登录请求: {form_data.username}")
+            raise
         except Exception as e:
             logger.error(f"密码验证失败: {str(e)}")
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=f"Password verification error: {str(e)}"
             )
+        
+        if not password_matches:
+            logger.warning(f"密码错误: {form_data.username}")
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Incorrect username/email or password",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
 
         # 生成访问令牌
         try:
@@ -249,7 +257,7 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=f"Token generation error: {str(e)}"
             )
-    except HTTPException:
+    except (HTTPException, PasswordHasherBusy):
         raise
     except Exception as e:
         logger.error(f"登录过程出现未知错误: {str(e)}")
@@ -257,12 +265,6 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Unknown error during login: {str(e)}"
         )
-    finally:
-        if cursor:
-            cursor.close()
-        if db:
-            db.close()
-        logger.debug("数据库连接已关闭")
 
 @router.get("/me")
 async def read_users_me(token: str = Depends(oauth2_scheme)):
@@ -280,16 +282,7 @@ async def read_users_me(token: str = Depends(oauth2_scheme)):
     except PyJWTError:
         raise HTTPException(status_code=401, detail="Could not validate credentials")
     
-    db = get_db_connection()
-    cursor = db.cursor(dictionary=True)
-    
-    try:
-        cursor.execute("SELECT id, username, email, full_name FROM users WHERE username = %s", (username,))
-        user = cursor.fetchone()
-        
-        if user is None:
-            raise HTTPException(status_code=404, detail="User not found")
-        return user
-    finally:
-        cursor.close()
-        db.close() 
\ No newline at end of file
+    user = await fetch_one("SELECT id, username, email, full_name FROM users WHERE username = %s", (username,))
+    if user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return user
@@ -1,20 +1,82 @@
 import os
-import logging
-from fastapi import APIRouter, HTTPException, Depends
+import json
+import time
+import asyncio
+from fastapi import APIRouter, HTTPException, Depends, Query, Response, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Optional, List, Dict
+from typing import AsyncIterator, Optional, List, Dict, Set, Tuple
 from datetime import datetime
-from agent.core import CreditCardAgent
-from llm_service.deepseek_adapter import DeepSeekAdapter
-from config import DB_CONFIG
+from llm_service.deepseek_adapter import DeepSeekAdapter, get_deepseek_adapter
+from agent.core import process_conversation_message
+from agent.session_store import agent_session_store
+from database.pool import db_pool, PoolExhaustedError
+from database.async_db import run_db
+from database.write_behind import message_writer
+from knowledge_base.fulltext import search_cards as fulltext_search
+from knowledge_base.catalog import card_catalog
+from knowledge_base.search_index import card_search_index
+from llm_service.answer_cache import AnswerKey, answer_cache
+from llm_service.limiter import LimiterRejected, llm_deadline, llm_user
+from llm_service.prompt_builder import prompt_builder
+from services.chat_service import ChatService
+from config import settings
 from utils.logger import setup_logger
-from api.auth import get_current_user
-import mysql.connector
+from utils.cache import TTLCache
+from utils.metrics import Histogram
+from api.auth import get_current_user, authenticate_token, invalidate_user
 
 # 设置日志记录器
 logger = setup_logger('chat')
 
 router = APIRouter()
+# WebSocket 在连接内自行认证，不挂载 OAuth2 依赖
+ws_router = APIRouter()
+
+# 活动会话指针：用户名 -> 会话ID。users 表中的指针是准确值，这里只短时缓存，
+# 不使用用户缓存中随 users 行一起缓存的旧值，其他 worker 切换会话后很快跟随
+active_conversations = TTLCache(maxsize=settings.USER_CACHE_SIZE, ttl=settings.ACTIVE_CONVERSATION_TTL)
+
+def remember_active_conversation(username: str, conversation_id: int):
+    """本进程切换了活动会话"""
+    active_conversations.set(username, conversation_id)
+
+def forget_active_conversation(username: str):
+    """丢弃该用户缓存的活动会话指针和用户行"""
+    active_conversations.pop(username)
+    invalidate_user(username)
+
+# 批量写入时发现会话已被删除（在其他进程中清空了历史），丢弃该用户缓存中的活动会话指针
+message_writer.on_orphaned = forget_active_conversation
+
+SYSTEM_PROMPT = """你是一个专业的信用卡助手，请基于提供的知识库信息回答用户的问题。
+如果知识库中没有相关信息，请明确告知用户。
+请用专业、友好的语气回答，并确保回答准确、完整。"""
+
+# 流式对话指标
+ttft_histogram = Histogram()
+stream_duration_histogram = Histogram()
+_stream_counts = {"started": 0, "completed": 0, "aborted": 0, "errors": 0, "cached": 0}
+_ws_counts = {"connections": 0, "active": 0, "turns": 0, "auth_failures": 0}
+# /chat 降级指标
+_deadline_counts = {
+    "requests": 0, "degraded_timeout": 0, "degraded_busy": 0, "degraded_error": 0,
+    "late_delivered": 0, "late_failed": 0,
+}
+# 超过截止时间后仍在后台执行的任务（迟到的模型回复、积压的写入）
+_background_tasks: Set[asyncio.Task] = set()
+
+# WebSocket 建立后等待认证消息的时间（秒）
+WS_AUTH_TIMEOUT = 10.0
+
+HISTORY_PAGE_SIZE = 50
+MAX_HISTORY_PAGE_SIZE = 200
+
+WELCOME_MESSAGE = """您好！我是AI信用卡助手，我可以帮您：
+1. 推荐最适合您的信用卡
+2. 解答信用卡相关问题
+3. 对比不同信用卡的权益
+请告诉我您的需求。"""
 
 class ChatMessage(BaseModel):
     message: str
@@ -26,15 +88,6 @@ class MessageResponse(BaseModel):
     content: str
     created_at: Optional[datetime]
 
-def get_db_connection():
-    """获取数据库连接"""
-    try:
-        conn = mysql.connector.connect(**DB_CONFIG)
-        return conn
-    except Exception as e:
-        logger.error(f"数据库连接失败: {str(e)}")
-        raise HTTPException(status_code=500, detail="数据库连接失败")
-
 def get_active_conversation(user_id: int, conn) -> int:
     """获取或创建活动会话"""
     cursor = conn.cursor(dictionary=True)
@@ -60,6 +113,29 @@ def get_active_conversation(user_id: int, conn) -> int:
     cursor.close()
     return conversation_id
 
+def set_active_conversation(conn, user_id: int, conversation_id: int):
+    """更新用户的活动会话指针"""
+    cursor = conn.cursor()
+    cursor.execute(
+        "UPDATE users SET active_conversation_id = %s WHERE id = %s",
+        (conversation_id, user_id)
+    )
+    conn.commit()
+    cursor.close()
+
+def resolve_active_conversation(user_id: int, conn) -> int:
+    """从数据库读取活动会话指针，指针为空时沿用最新会话或创建新会话并回填指针"""
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute("SELECT active_conversation_id FROM users WHERE id = %s", (user_id,))
+    result = cursor.fetchone()
+    cursor.close()
+    if result and result['active_conversation_id']:
+        return result['active_conversation_id']
+
+    conversation_id = get_active_conversation(user_id, conn)
+    set_active_conversation(conn, user_id, conversation_id)
+    return conversation_id
+
 def save_message(conn, conversation_id: int, role: str, content: str) -> int:
     """保存消息"""
     cursor = conn.cursor()
@@ -75,205 +151,656 @@ def save_message(conn, conversation_id: int, role: str, content: str) -> int:
 def save_chat_history(user_id: int, message: str, response: str):
     """保存聊天记录"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO chat_history (user_id, message, response) VALUES (%s, %s, %s)",
-            (user_id, message, response)
-        )
-        conn.commit()
-        cursor.close()
-        conn.close()
+        with db_pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "INSERT INTO chat_history (user_id, message, response) VALUES (%s, %s, %s)",
+                (user_id, message, response)
+            )
+            conn.commit()
+            cursor.close()
     except Exception as e:
         logger.error(f"保存聊天记录失败: {str(e)}")
 
 def get_chat_history(user_id: int, limit: int = 10) -> List[Dict]:
     """获取聊天历史记录"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute(
-            "SELECT * FROM chat_history WHERE user_id = %s ORDER BY created_at DESC LIMIT %s",
-            (user_id, limit)
-        )
-        history = cursor.fetchall()
-        cursor.close()
-        conn.close()
+        with db_pool.connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute(
+                "SELECT * FROM chat_history WHERE user_id = %s ORDER BY created_at DESC LIMIT %s",
+                (user_id, limit)
+            )
+            history = cursor.fetchall()
+            cursor.close()
         return history
     except Exception as e:
         logger.error(f"获取聊天记录失败: {str(e)}")
         return []
 
 def search_credit_cards(keyword: str) -> List[Dict]:
-    """从知识库搜索信用卡信息"""
+    """从知识库搜索信用卡信息，使用全文索引按相关度排序"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        
-        # 构建搜索SQL
-        sql = """
-        SELECT * FROM credit_cards 
-        WHERE bank_name LIKE %s 
-        OR card_name LIKE %s 
-        OR card_level LIKE %s 
-        OR benefits LIKE %s
-        LIMIT 5
-        """
-        search_term = f"%{keyword}%"
-        cursor.execute(sql, (search_term, search_term, search_term, search_term))
-        
-        results = cursor.fetchall()
-        cursor.close()
-        conn.close()
-        
+        results = fulltext_search(keyword, limit=5)
         logger.info(f"搜索到 {len(results)} 条信用卡信息")
         return results
     except Exception as e:
         logger.error(f"搜索信用卡失败: {str(e)}")
         return []
 
-def format_knowledge_base(cards: List[Dict]) -> str:
-    """格式化知识库信息"""
-    if not cards:
-        return ""
-    
-    knowledge = "信用卡知识库：\n\n"
-    for card in cards:
-        knowledge += f"【{card['bank_name']} - {card['card_name']}】\n"
-        knowledge += f"卡片等级：{card['card_level']}\n"
-        if card['annual_fee']:
-            knowledge += f"年费政策：{card['annual_fee']}\n"
-        if card['credit_limit']:
-            knowledge += f"信用额度：{card['credit_limit']}\n"
-        if card['benefits']:
-            knowledge += f"主要权益：{card['benefits']}\n"
-        if card['requirements']:
-            knowledge += f"申请条件：{card['requirements']}\n"
-        knowledge += "\n"
+async def retrieve_cards(message: str, k: int = 5) -> List[Dict]:
+    """用进程内倒排索引检索相关卡片，索引不可用时退回到数据库全文检索"""
+    try:
+        return await card_search_index.top_k(message, k)
+    except Exception as e:
+        logger.error(f"倒排索引检索失败，改用数据库检索: {str(e)}")
+        return await run_db(search_credit_cards, message)
+
+def format_knowledge_base(cards: List[Dict], question: str = "") -> str:
+    """格式化知识库信息，按与问题的相关度在 token 预算（PROMPT_KNOWLEDGE_TOKENS）内选取字段片段，
+    有导入时生成的摘要的卡片使用概要和要点"""
+    return prompt_builder.build(question, cards, summaries=card_catalog.summaries()).text
+
+def activate_conversation(user_id: int) -> int:
+    """读取或回填用户的活动会话指针（在数据库线程池中执行）"""
+    with db_pool.connection() as conn:
+        return resolve_active_conversation(user_id, conn)
+
+async def get_active_conversation_id(current_user: dict) -> int:
+    """返回活动会话ID，指针缓存过期（ACTIVE_CONVERSATION_TTL）后重新从数据库读取"""
+    conversation_id = active_conversations.get(current_user['username'])
+    if conversation_id is None:
+        conversation_id = await run_db(activate_conversation, current_user['id'])
+        remember_active_conversation(current_user['username'], conversation_id)
+    return conversation_id
+
+def clear_conversations(user_id: int) -> List[int]:
+    """删除用户的所有会话（会级联删除消息和智能体会话），返回被删除的会话ID（在数据库线程池中执行）"""
+    with db_pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT id FROM conversations WHERE user_id = %s", (user_id,))
+        conversation_ids = [row[0] for row in cursor.fetchall()]
+        cursor.execute(
+            "DELETE FROM conversations WHERE user_id = %s",
+            (user_id,)
+        )
+        conn.commit()
+        cursor.close()
+    return conversation_ids
+
+def open_conversation(user_id: int) -> int:
+    """创建新会话并写入欢迎消息（在数据库线程池中执行）"""
+    with db_pool.connection() as conn:
+        cursor = conn.cursor()
+        
+        # 创建新会话
+        cursor.execute(
+            "INSERT INTO conversations (user_id) VALUES (%s)",
+            (user_id,)
+        )
+        conn.commit()
+        
+        # 添加欢迎消息
+        conversation_id = cursor.lastrowid
+        save_message(conn, conversation_id, 'assistant', WELCOME_MESSAGE)
+        cursor.close()
+        
+        # 新会话成为活动会话
+        set_active_conversation(conn, user_id, conversation_id)
+    return conversation_id
+
+def delete_user_message(message_id: int, user_id: int) -> bool:
+    """删除属于该用户的消息，消息不存在或无权删除时返回False（在数据库线程池中执行）"""
+    with db_pool.connection() as conn:
+        cursor = conn.cursor()
+        
+        # 验证消息所有权
+        cursor.execute("""
+            SELECT m.id FROM chat_messages m
+            JOIN conversations c ON m.conversation_id = c.id
+            WHERE m.id = %s AND c.user_id = %s
+        """, (message_id, user_id))
+        
+        if not cursor.fetchone():
+            cursor.close()
+            return False
+        
+        # 删除消息
+        cursor.execute("DELETE FROM chat_messages WHERE id = %s", (message_id,))
+        conn.commit()
+        
+        cursor.close()
+    return True
+
+def load_history(
+    user_id: int,
+    conversation_id: Optional[int],
+    before_id: Optional[int],
+    since_id: Optional[int],
+    limit: int
+) -> Tuple[Optional[int], List[Dict]]:
+    """按消息ID游标读取一个会话的消息，返回 (会话ID, 按ID升序的消息)（在数据库线程池中执行）
+
+    - since_id: 只返回该ID之后的新消息（增量同步）
+    - before_id: 返回该ID之前最近的 limit 条消息（向前翻页）
+    - 都不传时返回最近的 limit 条消息
+    """
+    with db_pool.connection() as conn:
+        cursor = conn.cursor(dictionary=True)
+        try:
+            if conversation_id is None:
+                # 使用 conversations(user_id, created_at) 索引
+                cursor.execute(
+                    "SELECT id FROM conversations WHERE user_id = %s ORDER BY created_at DESC, id DESC LIMIT 1",
+                    (user_id,)
+                )
+            else:
+                cursor.execute(
+                    "SELECT id FROM conversations WHERE id = %s AND user_id = %s",
+                    (conversation_id, user_id)
+                )
+            row = cursor.fetchone()
+            if not row:
+                return None, []
+            conversation_id = row['id']
+
+            # 使用 chat_messages(conversation_id, id) 索引
+            columns = "id, role, content, created_at"
+            if since_id is not None:
+                cursor.execute(
+                    f"SELECT {columns} FROM chat_messages WHERE conversation_id = %s AND id > %s ORDER BY id ASC LIMIT %s",
+                    (conversation_id, since_id, limit)
+                )
+                return conversation_id, cursor.fetchall()
+
+            if before_id is not None:
+                cursor.execute(
+                    f"SELECT {columns} FROM chat_messages WHERE conversation_id = %s AND id < %s ORDER BY id DESC LIMIT %s",
+                    (conversation_id, before_id, limit)
+                )
+            else:
+                cursor.execute(
+                    f"SELECT {columns} FROM chat_messages WHERE conversation_id = %s ORDER BY id DESC LIMIT %s",
+                    (conversation_id, limit)
+                )
+            messages = cursor.fetchall()
+            messages.reverse()
+            return conversation_id, messages
+        finally:
+            cursor.close()
+
+def build_chat_messages(message: str, knowledge: str) -> List[Dict[str, str]]:
+    """根据知识库文本构建发给模型的消息列表"""
+    # 构建用户提示词
+    user_prompt = f"""知识库信息：
+{knowledge}
+
+用户问题：{message}"""
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt}
+    ]
+    prompt_builder.observe_prompt(messages)
+    return messages
+
+def spawn(aw) -> asyncio.Task:
+    """在后台执行，保留任务引用直到完成"""
+    task = asyncio.ensure_future(aw)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+async def within_deadline(task: asyncio.Future, deadline: Optional[float]):
+    """等待任务到截止时间（time.monotonic()），超时抛出 asyncio.TimeoutError，任务不取消、继续在后台执行"""
+    if deadline is None:
+        return await task
+    return await asyncio.wait_for(asyncio.shield(task), max(deadline - time.monotonic(), 0))
+
+async def persist_message(conversation_id: int, role: str, content: str, owner: str,
+                          deadline: Optional[float] = None):
+    """放入批量写入队列，队列积压到截止时间时转为后台等待，不阻塞响应"""
+    try:
+        await within_deadline(spawn(message_writer.submit(conversation_id, role, content, owner=owner)), deadline)
+    except asyncio.TimeoutError:
+        logger.warning(f"写入队列积压，会话 {conversation_id} 的消息转为后台写入")
+
+async def prepare_turn(current_user: dict, message: str,
+                       deadline: Optional[float] = None) -> Tuple[int, List[Dict]]:
+    """写入用户消息并检索知识库，返回 (会话ID, 检索到的卡片)；超过截止时间时不等待检索结果"""
+    # 模型调用按用户公平排队
+    llm_user.set(current_user['username'])
+    # 用户消息交给后台批量写入，不在请求路径上提交
+    conversation_id = await get_active_conversation_id(current_user)
+    await persist_message(conversation_id, 'user', message, current_user['username'], deadline)
     
-    return knowledge
+    # 从知识库搜索相关信息
+    try:
+        cards = await within_deadline(spawn(retrieve_cards(message)), deadline)
+    except asyncio.TimeoutError:
+        logger.warning("检索知识库超过时间预算")
+        cards = []
+    return conversation_id, cards
+
+def lookup_answer(message: str, cards: List[Dict]) -> Tuple[AnswerKey, Optional[str]]:
+    """查询回答缓存，返回 (缓存键, 缓存的回答)；目录版本变化时先清空缓存
+
+    知识库部分按检索到的卡片ID计算：提示词中的片段随问题措辞变化，卡片内容只随目录版本变化
+    """
+    answer_cache.sync_version(card_catalog.version)
+    cache_key = answer_cache.key(message, ",".join(str(card.get("id")) for card in cards))
+    return cache_key, answer_cache.get(cache_key)
+
+async def deliver_late_reply(llm_task: asyncio.Future, conversation_id: int, owner: str, cache_key: AnswerKey,
+                             fallback: str):
+    """已返回降级回答后等待模型回复：成功时写入会话和回答缓存，失败时写入已返回的降级回答，
+    每轮只保存一条助手消息"""
+    try:
+        reply = await llm_task
+    except Exception as e:
+        _deadline_counts["late_failed"] += 1
+        logger.warning(f"降级后的模型回复生成失败 - 会话ID: {conversation_id}: {str(e)}")
+        await message_writer.submit(conversation_id, 'assistant', fallback, owner=owner)
+        return
+    answer_cache.set(cache_key, reply)
+    await message_writer.submit(conversation_id, 'assistant', reply, owner=owner)
+    _deadline_counts["late_delivered"] += 1
 
 @router.post("/chat")
 async def chat_with_assistant(
     chat_message: ChatMessage,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    deepseek: DeepSeekAdapter = Depends(get_deepseek_adapter)
 ):
-    """与AI助手进行对话"""
+    """与AI助手进行对话
+
+    检索、模型调用和写入消息共用 CHAT_DEADLINE 秒的时间预算。预算用完或模型调用失败时，
+    返回根据检索到的卡片生成的模板回答，degraded 为 true；因超时降级时模型回复仍在生成，
+    完成后代替模板回答写入会话（late_reply 为 true），客户端可通过 /chat/history 的 since_id 获取
+    """
+    deadline = time.monotonic() + settings.CHAT_DEADLINE
+    llm_deadline.set(deadline)
+    message = chat_message.message
+    owner = current_user['username']
+    _deadline_counts["requests"] += 1
     try:
-        logger.info(f"收到聊天请求 - 用户ID: {current_user['id']}, 消息: {chat_message.message}")
-        conn = get_db_connection()
-        
-        # 获取或创建会话
-        conversation_id = get_active_conversation(current_user['id'], conn)
+        logger.info(f"收到聊天请求 - 用户ID: {current_user['id']}, 消息: {message}")
+        conversation_id, cards = await prepare_turn(current_user, message, deadline)
         
-        # 保存用户消息
-        user_message_id = save_message(conn, conversation_id, 'user', chat_message.message)
-        
-        # 从知识库搜索相关信息
-        cards = search_credit_cards(chat_message.message)
-        knowledge = format_knowledge_base(cards)
+        # 相同问题在知识库内容不变时直接使用缓存的回答
+        cache_key, response = lookup_answer(message, cards)
+        cached = response is not None
+        degraded_reason = None
+        late_reply = False
+        if not cached:
+            knowledge = format_knowledge_base(cards, message)
+            # 调用 DeepSeek API 获取回答，适配器和连接池由整个进程共享
+            llm_task = spawn(deepseek.chat_completion(build_chat_messages(message, knowledge)))
+            try:
+                response = await within_deadline(llm_task, deadline)
+                answer_cache.set(cache_key, response)
+            except asyncio.TimeoutError:
+                degraded_reason, late_reply = "timeout", True
+            except LimiterRejected as e:
+                degraded_reason = "busy"
+                logger.warning(f"模型调用被限流 - 用户ID: {current_user['id']}: {str(e)}")
+            except Exception as e:
+                degraded_reason = "error"
+                logger.error(f"模型调用失败 - 用户ID: {current_user['id']}: {str(e)}")
+            
+            if degraded_reason is not None:
+                _deadline_counts[f"degraded_{degraded_reason}"] += 1
+                response = ChatService.answer_from_cards(message, cards)
         
-        # 初始化 DeepSeek 适配器
-        deepseek = DeepSeekAdapter()
+        if late_reply:
+            # 模型回复仍在生成，由后台任务保存模型回复（失败时保存降级回答）
+            spawn(deliver_late_reply(llm_task, conversation_id, owner, cache_key, response))
+        else:
+            # 保存AI回复，消息ID在批量写入后才生成，需要时通过 /chat/history 获取
+            await persist_message(conversation_id, 'assistant', response, owner, deadline)
         
-        try:
-            # 构建系统提示词
-            system_prompt = """你是一个专业的信用卡助手，请基于提供的知识库信息回答用户的问题。
-如果知识库中没有相关信息，请明确告知用户。
-请用专业、友好的语气回答，并确保回答准确、完整。"""
+        return {
+            "response": response,
+            "message_id": None,
+            "cached": cached,
+            "degraded": degraded_reason is not None,
+            "degraded_reason": degraded_reason,
+            "late_reply": late_reply,
+            "status": "success"
+        }
             
-            # 构建用户提示词
-            user_prompt = f"""知识库信息：
-{knowledge}
+    except (HTTPException, PoolExhaustedError):
+        # 连接池耗尽由全局处理器返回503
+        raise
+    except Exception as e:
+        logger.error(f"处理聊天请求失败: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
 
-用户问题：{chat_message.message}"""
-            
-            # 调用 DeepSeek API 获取回答
-            response = await deepseek.chat_completion([
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ])
-            
-            # 保存AI回复
-            assistant_message_id = save_message(conn, conversation_id, 'assistant', response)
-            
-            return {
-                "response": response,
-                "message_id": assistant_message_id,
-                "status": "success"
-            }
+@router.post("/chat/agent")
+async def chat_with_agent(
+    chat_message: ChatMessage,
+    current_user: dict = Depends(get_current_user)
+):
+    """与信用卡推荐智能体对话
+
+    智能体的状态和对话记忆按活动会话保存在会话存储中，每轮恢复后处理，处理完成后写回
+    """
+    message = chat_message.message
+    owner = current_user['username']
+    llm_user.set(owner)
+    try:
+        logger.info(f"收到智能体请求 - 用户ID: {current_user['id']}, 消息: {message}")
+        conversation_id = await get_active_conversation_id(current_user)
+        await persist_message(conversation_id, 'user', message, owner)
+        response = await process_conversation_message(conversation_id, message)
+        await persist_message(conversation_id, 'assistant', response, owner)
+        return {"response": response, "conversation_id": conversation_id, "status": "success"}
+    except (HTTPException, PoolExhaustedError, LimiterRejected):
+        raise
+    except Exception as e:
+        logger.error(f"处理智能体请求失败: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail="处理智能体请求失败")
+
+def deadline_stats() -> Dict:
+    """/chat 时间预算和降级指标"""
+    return {
+        "budget_s": settings.CHAT_DEADLINE,
+        **_deadline_counts,
+        "background_tasks": len(_background_tasks),
+    }
+
+def sse_event(event: str, data: Dict) -> str:
+    """编码一条服务端事件"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def generate_reply(
+    deepseek: DeepSeekAdapter,
+    messages: List[Dict[str, str]],
+    conversation_id: int,
+    owner: str,
+    started: float,
+    cache_key: Optional[AnswerKey] = None
+) -> AsyncIterator[str]:
+    """逐段返回模型的增量输出，结束后保存拼接好的完整回复并记录指标
+
+    调用方中途停止读取（客户端断开）时保存已生成的部分，与用户看到的内容一致；
+    只有完整生成的回复才写入回答缓存。
+    """
+    parts: List[str] = []
+    outcome = "aborted"
+    try:
+        async for content in deepseek.chat_completion_stream(messages):
+            if not parts:
+                ttft_histogram.observe((time.perf_counter() - started) * 1000)
+            parts.append(content)
+            yield content
+        outcome = "completed"
+    except Exception:
+        outcome = "errors"
+        raise
+    finally:
+        _stream_counts[outcome] += 1
+        stream_duration_histogram.observe((time.perf_counter() - started) * 1000)
+        reply = "".join(parts)
+        if reply:
+            await message_writer.submit(conversation_id, 'assistant', reply, owner=owner)
+            if outcome == "completed" and cache_key is not None:
+                answer_cache.set(cache_key, reply)
+
+async def stream_reply(
+    deepseek: DeepSeekAdapter,
+    messages: List[Dict[str, str]],
+    conversation_id: int,
+    owner: str,
+    started: float,
+    cache_key: Optional[AnswerKey] = None
+):
+    """把增量输出编码为服务端事件：token（增量文本）、done（生成结束）、error（生成失败）"""
+    try:
+        reply = generate_reply(deepseek, messages, conversation_id, owner, started, cache_key)
+        try:
+            async for content in reply:
+                yield sse_event("token", {"content": content})
         finally:
-            await deepseek.close()
-            
+            await reply.aclose()
+        yield sse_event("done", {"conversation_id": conversation_id})
+    except LimiterRejected as e:
+        logger.warning(f"流式模型调用被限流: {str(e)}")
+        yield sse_event("error", {"detail": "模型服务繁忙，请稍后重试"})
     except Exception as e:
-        logger.error(f"处理聊天请求失败: {str(e)}", exc_info=True)
+        logger.error(f"流式生成回复失败: {str(e)}", exc_info=True)
+        yield sse_event("error", {"detail": "生成回复失败，请稍后重试"})
+
+async def cached_reply_events(answer: str, conversation_id: int):
+    """命中回答缓存时一次返回完整回复"""
+    yield sse_event("token", {"content": answer})
+    yield sse_event("done", {"conversation_id": conversation_id, "cached": True})
+
+@router.post("/chat/stream")
+async def chat_stream(
+    chat_message: ChatMessage,
+    current_user: dict = Depends(get_current_user),
+    deepseek: DeepSeekAdapter = Depends(get_deepseek_adapter)
+):
+    """流式对话：以服务端事件（text/event-stream）逐段返回回复"""
+    started = time.perf_counter()
+    try:
+        logger.info(f"收到流式聊天请求 - 用户ID: {current_user['id']}, 消息: {chat_message.message}")
+        conversation_id, cards = await prepare_turn(current_user, chat_message.message)
+        cache_key, answer = lookup_answer(chat_message.message, cards)
+        if answer is not None:
+            await message_writer.submit(conversation_id, 'assistant', answer, owner=current_user['username'])
+    except (HTTPException, PoolExhaustedError):
+        # 连接池耗尽由全局处理器返回503
+        raise
+    except Exception as e:
+        logger.error(f"处理流式聊天请求失败: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
+    
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    if answer is not None:
+        _stream_counts["cached"] += 1
+        return StreamingResponse(
+            cached_reply_events(answer, conversation_id), media_type="text/event-stream", headers=headers
+        )
+    
+    _stream_counts["started"] += 1
+    messages = build_chat_messages(chat_message.message, format_knowledge_base(cards, chat_message.message))
+    return StreamingResponse(
+        stream_reply(deepseek, messages, conversation_id, current_user['username'], started, cache_key),
+        media_type="text/event-stream",
+        headers=headers
+    )
+
+def stream_stats() -> Dict:
+    """流式对话指标，首字延迟从收到请求开始计算，包含检索知识库的时间"""
+    return {
+        **_stream_counts,
+        "websocket": dict(_ws_counts),
+        "ttft": ttft_histogram.stats(),
+        "duration": stream_duration_histogram.stats(),
+    }
+
+class ChatSession:
+    """WebSocket 连接上的会话状态
+
+    认证在连接建立时做一次；活动会话指针每轮从短时缓存读取，过期后才查库。
+    上一轮检索到的卡片保留为上下文，追问（如"它的年费多少"）检索不到卡片时沿用。
+    """
+
+    __slots__ = ("user", "conversation_id", "deepseek", "cards", "turns")
+
+    def __init__(self, user: dict, conversation_id: int, deepseek: DeepSeekAdapter):
+        self.user = user
+        self.conversation_id = conversation_id
+        self.deepseek = deepseek
+        self.cards: List[Dict] = []
+        self.turns = 0
+
+    async def follow_active_conversation(self):
+        """其他请求（如 /chat/new、清空历史，可能在其他 worker 中）切换了活动会话时跟随切换"""
+        conversation_id = await get_active_conversation_id(self.user)
+        if conversation_id != self.conversation_id:
+            self.conversation_id = conversation_id
+            self.cards = []
+
+    async def retrieve(self, message: str) -> List[Dict]:
+        cards = await retrieve_cards(message)
+        if cards:
+            self.cards = cards
+        return self.cards
+
+async def ws_authenticate(websocket: WebSocket) -> Optional[dict]:
+    """读取第一条消息 {"type": "auth", "token": "..."} 并校验令牌，失败时返回None"""
+    try:
+        payload = await asyncio.wait_for(websocket.receive_json(), WS_AUTH_TIMEOUT)
+        if not isinstance(payload, dict) or payload.get("type") != "auth":
+            return None
+        return await authenticate_token(str(payload.get("token") or ""))
+    except (asyncio.TimeoutError, HTTPException, ValueError):
+        return None
+
+async def ws_turn(websocket: WebSocket, session: ChatSession, message: str):
+    """处理一轮对话，回复以 token 消息逐段发送，以 done 或 error 结束"""
+    started = time.perf_counter()
+    username = session.user['username']
+    await session.follow_active_conversation()
+    llm_user.set(username)
+    session.turns += 1
+    _ws_counts["turns"] += 1
+
+    await message_writer.submit(session.conversation_id, 'user', message, owner=username)
+    cards = await session.retrieve(message)
+
+    cache_key, answer = lookup_answer(message, cards)
+    if answer is not None:
+        _stream_counts["cached"] += 1
+        await message_writer.submit(session.conversation_id, 'assistant', answer, owner=username)
+        await websocket.send_json({"type": "token", "content": answer})
+        await websocket.send_json({"type": "done", "conversation_id": session.conversation_id, "cached": True})
+        return
+
+    _stream_counts["started"] += 1
+    messages = build_chat_messages(message, format_knowledge_base(cards, message))
+    try:
+        reply = generate_reply(session.deepseek, messages, session.conversation_id, username, started, cache_key)
+        try:
+            async for content in reply:
+                await websocket.send_json({"type": "token", "content": content})
+        finally:
+            await reply.aclose()
+    except WebSocketDisconnect:
+        raise
+    except LimiterRejected as e:
+        logger.warning(f"WebSocket 模型调用被限流: {str(e)}")
+        await websocket.send_json({"type": "error", "detail": "模型服务繁忙，请稍后重试"})
+        return
+    except Exception as e:
+        logger.error(f"WebSocket 生成回复失败: {str(e)}", exc_info=True)
+        await websocket.send_json({"type": "error", "detail": "生成回复失败，请稍后重试"})
+        return
+    await websocket.send_json({"type": "done", "conversation_id": session.conversation_id})
+
+@ws_router.websocket("/chat/ws")
+async def chat_websocket(websocket: WebSocket):
+    """WebSocket 对话
+
+    连接后第一条消息必须是 {"type": "auth", "token": "..."}，之后：
+    - {"type": "message", "content": "..."}：回复以 {"type": "token"} 逐段返回，以 {"type": "done"} 结束
+    - {"type": "new_conversation"}：开始新会话，返回 {"type": "conversation", "conversation_id": ...}
+    """
+    await websocket.accept()
+    try:
+        user = await ws_authenticate(websocket)
+    except WebSocketDisconnect:
+        return
+    if user is None:
+        _ws_counts["auth_failures"] += 1
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    try:
+        conversation_id = await get_active_conversation_id(user)
+        deepseek = get_deepseek_adapter()
+    except Exception as e:
+        logger.error(f"WebSocket 初始化会话失败: {str(e)}")
+        await websocket.close(code=status.WS_1011_INTERNAL_ERROR)
+        return
+
+    session = ChatSession(user, conversation_id, deepseek)
+    _ws_counts["connections"] += 1
+    _ws_counts["active"] += 1
+    logger.info(f"WebSocket 已连接 - 用户ID: {user['id']}, 会话ID: {conversation_id}")
+    try:
+        await websocket.send_json({"type": "ready", "conversation_id": conversation_id})
+        while True:
+            try:
+                payload = await websocket.receive_json()
+            except ValueError:
+                await websocket.send_json({"type": "error", "detail": "消息不是有效的JSON"})
+                continue
+            kind = payload.get("type") if isinstance(payload, dict) else None
+
+            if kind == "message":
+                message = str(payload.get("content") or "").strip()
+                if not message:
+                    await websocket.send_json({"type": "error", "detail": "消息内容不能为空"})
+                    continue
+                await ws_turn(websocket, session, message)
+            elif kind == "new_conversation":
+                session.conversation_id = await run_db(open_conversation, user['id'])
+                session.cards = []
+                remember_active_conversation(user['username'], session.conversation_id)
+                await websocket.send_json({"type": "conversation", "conversation_id": session.conversation_id})
+            else:
+                await websocket.send_json({"type": "error", "detail": "未知的消息类型"})
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.error(f"WebSocket 连接异常: {str(e)}", exc_info=True)
     finally:
-        conn.close()
+        _ws_counts["active"] -= 1
+        logger.info(f"WebSocket 已断开 - 用户ID: {user['id']}, 对话轮数: {session.turns}")
 
 @router.get("/chat/history")
 async def get_chat_history_endpoint(
+    response: Response,
+    conversation_id: Optional[int] = Query(None, description="会话ID，默认最新会话"),
+    before_id: Optional[int] = Query(None, description="游标：返回 id 小于该值的消息"),
+    since_id: Optional[int] = Query(None, description="增量同步：返回 id 大于该值的消息"),
+    limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=MAX_HISTORY_PAGE_SIZE, description="每页数量"),
     current_user: dict = Depends(get_current_user)
 ):
-    """获取聊天历史记录"""
+    """获取聊天历史记录
+
+    返回一个会话中按时间升序的消息，会话ID通过响应头 X-Conversation-Id 返回。
+    向前翻页时，更早消息的游标通过响应头 X-Next-Before-Id 返回，没有更多消息时不返回该头。
+    """
+    if before_id is not None and since_id is not None:
+        raise HTTPException(status_code=400, detail="before_id 和 since_id 不能同时使用")
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        
-        # 获取最新会话的消息
-        cursor.execute("""
-            SELECT m.* FROM chat_messages m
-            JOIN conversations c ON m.conversation_id = c.id
-            WHERE c.user_id = %s
-            ORDER BY m.created_at ASC
-        """, (current_user['id'],))
-        
-        messages = cursor.fetchall()
-        cursor.close()
-        conn.close()
-        
-        return [
-            {
-                "id": msg['id'],
-                "role": msg['role'],
-                "content": msg['content'],
-                "created_at": msg['created_at']
-            }
-            for msg in messages
-        ]
+        conversation, messages = await run_db(
+            load_history, current_user['id'], conversation_id, before_id, since_id, limit
+        )
     except Exception as e:
         logger.error(f"获取聊天历史失败: {str(e)}")
         raise HTTPException(status_code=500, detail="获取聊天历史失败")
 
+    if conversation_id is not None and conversation is None:
+        raise HTTPException(status_code=404, detail="会话不存在")
+    if conversation is not None:
+        response.headers["X-Conversation-Id"] = str(conversation)
+    if since_id is None and len(messages) == limit:
+        response.headers["X-Next-Before-Id"] = str(messages[0]['id'])
+    return messages
+
 @router.post("/chat/new")
 async def create_new_conversation(
     current_user: dict = Depends(get_current_user)
 ):
     """创建新会话"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # 创建新会话
-        cursor.execute(
-            "INSERT INTO conversations (user_id) VALUES (%s)",
-            (current_user['id'],)
-        )
-        conn.commit()
-        
-        # 添加欢迎消息
-        conversation_id = cursor.lastrowid
-        welcome_message = """您好！我是AI信用卡助手，我可以帮您：
-1. 推荐最适合您的信用卡
-2. 解答信用卡相关问题
-3. 对比不同信用卡的权益
-请告诉我您的需求。"""
-        
-        save_message(conn, conversation_id, 'assistant', welcome_message)
-        
-        cursor.close()
-        conn.close()
-        
+        conversation_id = await run_db(open_conversation, current_user['id'])
+        remember_active_conversation(current_user['username'], conversation_id)
         return {"message": "新会话已创建"}
     except Exception as e:
         logger.error(f"创建新会话失败: {str(e)}")
@@ -285,35 +812,11 @@ async def clear_chat_history(
 ):
     """清空聊天历史"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # 删除用户的所有会话（会级联删除消息）
-        cursor.execute(
-            "DELETE FROM conversations WHERE user_id = %s",
-            (current_user['id'],)
-        )
-        conn.commit()
-        
-        # 创建新会话并添加欢迎消息
-        cursor.execute(
-            "INSERT INTO conversations (user_id) VALUES (%s)",
-            (current_user['id'],)
-        )
-        conn.commit()
-        
-        conversation_id = cursor.lastrowid
-        welcome_message = """您好！我是AI信用卡助手，我可以帮您：
-1. 推荐最适合您的信用卡
-2. 解答信用卡相关问题
-3. 对比不同信用卡的权益
-请告诉我您的需求。"""
-        
-        save_message(conn, conversation_id, 'assistant', welcome_message)
-        
-        cursor.close()
-        conn.close()
-        
+        # 删除所有会话后创建新会话并添加欢迎消息
+        for cleared_id in await run_db(clear_conversations, current_user['id']):
+            agent_session_store.discard(cleared_id)
+        conversation_id = await run_db(open_conversation, current_user['id'])
+        remember_active_conversation(current_user['username'], conversation_id)
         return {"message": "聊天历史已清空"}
     except Exception as e:
         logger.error(f"清空聊天历史失败: {str(e)}")
@@ -326,29 +829,13 @@ async def delete_message_endpoint(
 ):
     """删除单条消息"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # 验证消息所有权
-        cursor.execute("""
-            SELECT m.id FROM chat_messages m
-            JOIN conversations c ON m.conversation_id = c.id
-            WHERE m.id = %s AND c.user_id = %s
-        """, (message_id, current_user['id']))
-        
-        if not cursor.fetchone():
+        deleted = await run_db(delete_user_message, message_id, current_user['id'])
+        if not deleted:
             raise HTTPException(status_code=404, detail="消息不存在或无权删除")
         
-        # 删除消息
-        cursor.execute("DELETE FROM chat_messages WHERE id = %s", (message_id,))
-        conn.commit()
-        
-        cursor.close()
-        conn.close()
-        
         return {"message": "消息已删除"}
     except HTTPException as e:
         raise e
     except Exception as e:
         logger.error(f"删除消息失败: {str(e)}")
-        raise HTTPException(status_code=500, detail="删除消息失败") 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="删除消息失败")
@@ -1,10 +1,12 @@
-from fastapi import APIRouter, HTTPException, Query, Depends
+from fastapi import APIRouter, HTTPException, Query, Depends, Response
 from typing import List, Optional, Dict, Any
 from pydantic import BaseModel, Field
 from datetime import datetime
 import json
 import logging
-from database.db import get_db_connection
+from database.async_db import fetch_one, fetch_all
+from database.db import get_schema_probe
+from knowledge_base.catalog import card_catalog, CARD_FIELDS, JSON_FIELDS, parse_json_field, encode_json
 from .auth import get_current_user
 
 # 设置日志
@@ -36,91 +38,100 @@ class CreditCard(BaseModel):
             datetime: lambda v: v.isoformat() if v else None
         }
 
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+def parse_fields(fields: Optional[str]) -> List[str]:
+    """解析 fields 参数，id 总是返回以便作为翻页游标"""
+    if not fields:
+        return list(CARD_FIELDS)
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in requested if field not in CARD_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"不支持的字段: {', '.join(unknown)}")
+    return ["id"] + [field for field in dict.fromkeys(requested) if field != "id"]
+
+# 不是所有建表脚本都有的列（database/db.py 的 init_db 建的表没有 timestamp），响应模型中均为可选
+OPTIONAL_FIELDS = ("timestamp",)
+
+def existing_columns(columns: List[str]) -> List[str]:
+    """去掉 credit_cards 表中不存在的列，按启动时的结构探测结果判断；没有探测结果时去掉可选列"""
+    probe = get_schema_probe()
+    table = probe.get("credit_cards") if probe else None
+    if not table:
+        return [column for column in columns if column not in OPTIONAL_FIELDS]
+    present = set(table["columns"])
+    return [column for column in columns if column in present]
+
+async def query_card_page(
+    columns: List[str],
+    bank: Optional[str],
+    level: Optional[str],
+    after_id: Optional[int],
+    limit: int
+) -> List[Dict]:
+    """按 id 游标分页查询，只选取需要的列"""
+    conditions = []
+    params: List[Any] = []
+    if bank:
+        conditions.append("bank = %s")
+        params.append(bank)
+    if level:
+        conditions.append("level = %s")
+        params.append(level)
+    if after_id is not None:
+        conditions.append("id > %s")
+        params.append(after_id)
+    
+    # 列名来自 CARD_FIELDS 白名单，可以安全拼接
+    query = "SELECT " + ", ".join(f"`{column}`" for column in existing_columns(columns)) + " FROM credit_cards"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY id LIMIT %s"
+    params.append(limit)
+    
+    rows = await fetch_all(query, params)
+    for row in rows:
+        for field in JSON_FIELDS:
+            if field in row:
+                row[field] = parse_json_field(row[field])
+    return rows
+
 @router.get("/cards", response_model=List[CreditCard])
 async def get_credit_cards(
     bank: Optional[str] = Query(None, description="银行名称"),
     level: Optional[str] = Query(None, description="卡片等级"),
+    after_id: Optional[int] = Query(None, description="游标：返回 id 大于该值的卡片"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="每页数量"),
+    fields: Optional[str] = Query(None, description="逗号分隔的返回字段，如 name,bank,level"),
     current_user: dict = Depends(get_current_user)
 ):
-    """获取信用卡列表"""
-    conn = None
-    cursor = None
+    """获取信用卡列表
+
+    不带分页和字段参数时直接返回目录快照中预编码的JSON字节；
+    带 after_id/limit/fields 时按 id 游标分页，并只查询需要的列。
+    下一页游标通过响应头 X-Next-After-Id 返回，没有更多数据时不返回该头。
+    """
     try:
-        logger.debug("开始获取信用卡列表")
-        logger.debug(f"认证用户信息: {current_user}")
-        logger.debug(f"请求参数: bank={bank}, level={level}")
-        
-        conn = get_db_connection()
-        logger.debug("数据库连接成功")
-        cursor = conn.cursor(dictionary=True)
-        logger.debug("游标创建成功")
+        logger.debug(f"请求参数: bank={bank}, level={level}, after_id={after_id}, limit={limit}, fields={fields}")
+        if after_id is None and limit is None and fields is None:
+            snapshot = await card_catalog.get_snapshot()
+            return Response(content=snapshot.encoded(bank, level), media_type="application/json")
         
-        # 构建基本查询
-        query = "SELECT * FROM credit_cards"
-        params = []
+        columns = parse_fields(fields)
+        page_size = limit or DEFAULT_PAGE_SIZE
+        rows = await query_card_page(columns, bank, level, after_id, page_size)
         
-        # 添加筛选条件
-        conditions = []
-        if bank:
-            conditions.append("bank = %s")
-            params.append(bank)
-        if level:
-            conditions.append("level = %s")
-            params.append(level)
-            
-        if conditions:
-            query += " WHERE " + " AND ".join(conditions)
-            
-        logger.debug(f"执行SQL查询: {query}")
-        logger.debug(f"查询参数: {params}")
-        
-        cursor.execute(query, params)
-        cards = cursor.fetchall()
-        logger.debug(f"查询到 {len(cards)} 张信用卡")
-        
-        if not cards:
-            logger.debug("没有找到任何信用卡")
-            return []
-        
-        result = []
-        for card in cards:
-            try:
-                # 处理JSON字段
-                if card['benefits']:
-                    try:
-                        card['benefits'] = json.loads(card['benefits'])
-                    except json.JSONDecodeError:
-                        card['benefits'] = {}
-                else:
-                    card['benefits'] = {}
-                
-                if card['requirements']:
-                    try:
-                        card['requirements'] = json.loads(card['requirements'])
-                    except json.JSONDecodeError:
-                        card['requirements'] = {}
-                else:
-                    card['requirements'] = {}
-                
-                credit_card = CreditCard(**card)
-                result.append(credit_card)
-                logger.debug(f"成功处理卡片: {credit_card.name}")
-                
-            except Exception as e:
-                logger.error(f"处理卡片时出错: {str(e)}, card: {card}")
-                continue
-        
-        logger.debug(f"成功处理 {len(result)} 张信用卡")
-        return result
+        headers = {}
+        if len(rows) == page_size:
+            headers["X-Next-After-Id"] = str(rows[-1]["id"])
+        return Response(content=encode_json(rows), media_type="application/json", headers=headers)
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"获取信用卡列表错误: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
 
 @router.get("/cards/{card_id}", response_model=CreditCard)
 async def get_credit_card(
@@ -128,16 +139,17 @@ async def get_credit_card(
     current_user: dict = Depends(get_current_user)
 ):
     """获取特定信用卡的详细信息"""
-    conn = None
-    cursor = None
     try:
         logger.debug(f"开始获取信用卡详情: {card_id}")
         logger.debug(f"当前用户: {current_user['username']}")
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
         
-        cursor.execute("SELECT * FROM credit_cards WHERE id = %s", (card_id,))
-        card = cursor.fetchone()
+        # 优先使用目录快照，快照中没有时（例如刚导入的新卡）再查库
+        snapshot = await card_catalog.get_snapshot()
+        encoded = snapshot.encoded_card(card_id)
+        if encoded is not None:
+            return Response(content=encoded, media_type="application/json")
+        
+        card = await fetch_one("SELECT * FROM credit_cards WHERE id = %s", (card_id,))
         
         if not card:
             logger.warning(f"未找到信用卡: {card_id}")
@@ -171,8 +183,3 @@ async def get_credit_card(
     except Exception as e:
         logger.error(f"获取信用卡详情错误: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close() 
\ No newline at end of file
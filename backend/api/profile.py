@@ -1,13 +1,12 @@
 from fastapi import APIRouter, HTTPException, Depends, UploadFile, File
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Optional
 from datetime import date
-import logging
-from api.auth import get_current_user
+from api.auth import get_current_user, invalidate_user
 from utils.logger import setup_logger
-from config import DB_CONFIG
-import mysql.connector
-import bcrypt
+from database.pool import db_pool
+from database.async_db import run_db, fetch_one, fetch_all, execute
+from utils.password import password_hasher, PasswordHasherBusy
 
 # 设置日志记录器
 logger = setup_logger('profile')
@@ -28,71 +27,35 @@ class BankCard(BaseModel):
     card_type: str
     expiry_date: date
 
-def get_db_connection():
-    """获取数据库连接"""
-    try:
-        conn = mysql.connector.connect(**DB_CONFIG)
-        return conn
-    except Exception as e:
-        logger.error(f"数据库连接失败: {str(e)}")
-        raise HTTPException(status_code=500, detail="数据库连接失败")
-
 @router.get("/profile")
 async def get_profile(current_user: dict = Depends(get_current_user)):
     """获取用户个人信息"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute(
-            "SELECT id, username, email, avatar_url, full_name, phone FROM users WHERE id = %s",
-            (current_user["id"],)
-        )
-        user = cursor.fetchone()
-        cursor.close()
-        conn.close()
-        
-        if not user:
-            raise HTTPException(status_code=404, detail="用户不存在")
-            
-        return user
+        # current_user 已是完整的用户行（通常来自认证缓存），无需再次查库
+        fields = ("id", "username", "email", "avatar_url", "full_name", "phone")
+        return {field: current_user.get(field) for field in fields}
     except Exception as e:
         logger.error(f"获取用户信息失败: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.put("/profile")
-async def update_profile(
-    profile: UserProfile,
-    current_user: dict = Depends(get_current_user)
-):
-    """更新用户个人信息"""
-    try:
-        conn = get_db_connection()
+def _apply_profile_update(user_id: int, profile: UserProfile, new_hash: Optional[str] = None):
+    """在一个事务内更新密码和个人资料（在数据库线程池中执行）"""
+    with db_pool.connection() as conn:
+        # 连接池默认自动提交，这里显式开启事务保证密码和资料一起更新
+        conn.start_transaction()
         cursor = conn.cursor()
-        
-        # 如果要更改密码，先验证当前密码
-        if profile.new_password:
-            if not profile.current_password:
-                raise HTTPException(status_code=400, detail="需要提供当前密码")
-                
-            cursor.execute(
-                "SELECT password_hash FROM users WHERE id = %s",
-                (current_user["id"],)
-            )
-            current_hash = cursor.fetchone()[0]
-            
-            if not bcrypt.checkpw(profile.current_password.encode(), current_hash.encode()):
-                raise HTTPException(status_code=400, detail="当前密码不正确")
-                
-            new_hash = bcrypt.hashpw(profile.new_password.encode(), bcrypt.gensalt())
+    
+        # 新密码已在密码哈希线程池中校验并生成
+        if new_hash:
             cursor.execute(
                 "UPDATE users SET password_hash = %s WHERE id = %s",
-                (new_hash, current_user["id"])
+                (new_hash, user_id)
             )
-        
+    
         # 更新其他信息
         update_fields = []
         update_values = []
-        
+    
         if profile.username:
             update_fields.append("username = %s")
             update_values.append(profile.username)
@@ -105,17 +68,43 @@ async def update_profile(
         if profile.phone:
             update_fields.append("phone = %s")
             update_values.append(profile.phone)
-            
+        
         if update_fields:
             sql = f"UPDATE users SET {', '.join(update_fields)} WHERE id = %s"
-            update_values.append(current_user["id"])
+            update_values.append(user_id)
             cursor.execute(sql, update_values)
-            
+        
         conn.commit()
         cursor.close()
-        conn.close()
+
+@router.put("/profile")
+async def update_profile(
+    profile: UserProfile,
+    current_user: dict = Depends(get_current_user)
+):
+    """更新用户个人信息"""
+    try:
+        # 如果要更改密码，先验证当前密码
+        new_hash = None
+        if profile.new_password:
+            if not profile.current_password:
+                raise HTTPException(status_code=400, detail="需要提供当前密码")
+            
+            row = await fetch_one(
+                "SELECT password_hash FROM users WHERE id = %s",
+                (current_user["id"],)
+            )
+            if not await password_hasher.verify(profile.current_password, row["password_hash"]):
+                raise HTTPException(status_code=400, detail="当前密码不正确")
+            
+            new_hash = await password_hasher.hash(profile.new_password)
+        
+        await run_db(_apply_profile_update, current_user["id"], profile, new_hash)
+        invalidate_user(current_user["username"])
         
         return {"message": "个人信息更新成功"}
+    except PasswordHasherBusy:
+        raise
     except Exception as e:
         logger.error(f"更新用户信息失败: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -140,15 +129,10 @@ async def upload_avatar(
 async def get_user_cards(current_user: dict = Depends(get_current_user)):
     """获取用户的银行卡列表"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute(
+        cards = await fetch_all(
             "SELECT * FROM user_cards WHERE user_id = %s",
             (current_user["id"],)
         )
-        cards = cursor.fetchall()
-        cursor.close()
-        conn.close()
         return cards
     except Exception as e:
         logger.error(f"获取银行卡列表失败: {str(e)}")
@@ -161,9 +145,7 @@ async def add_bank_card(
 ):
     """添加银行卡"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute(
+        await execute(
             """
             INSERT INTO user_cards 
             (user_id, bank_name, card_number, card_type, expiry_date)
@@ -172,9 +154,6 @@ async def add_bank_card(
             (current_user["id"], card.bank_name, card.card_number, 
              card.card_type, card.expiry_date)
         )
-        conn.commit()
-        cursor.close()
-        conn.close()
         return {"message": "银行卡添加成功"}
     except Exception as e:
         logger.error(f"添加银行卡失败: {str(e)}")
@@ -187,15 +166,10 @@ async def delete_bank_card(
 ):
     """删除银行卡"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute(
+        await execute(
             "DELETE FROM user_cards WHERE id = %s AND user_id = %s",
             (card_id, current_user["id"])
         )
-        conn.commit()
-        cursor.close()
-        conn.close()
         return {"message": "银行卡删除成功"}
     except Exception as e:
         logger.error(f"删除银行卡失败: {str(e)}")
@@ -0,0 +1,98 @@
+"""
+异步数据库访问
+把同步的 mysql.connector 调用放到有界线程池中执行，避免阻塞事件循环
+"""
+
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from config import settings
+from database.pool import db_pool
+
+# 线程数与连接池大小一致：每个工作线程最多占用一个连接，不会在池上互相等待
+_executor = ThreadPoolExecutor(
+    max_workers=settings.DB_POOL_SIZE,
+    thread_name_prefix="db"
+)
+
+_lock = threading.Lock()
+_pending = 0
+_submitted = 0
+
+
+async def run_db(func: Callable, *args, **kwargs) -> Any:
+    """在数据库线程池中执行同步函数并等待结果"""
+    global _pending, _submitted
+    with _lock:
+        _pending += 1
+        _submitted += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+    finally:
+        with _lock:
+            _pending -= 1
+
+
+def _fetch_one(sql: str, params: Optional[Sequence] = None) -> Optional[Dict]:
+    with db_pool.connection() as conn:
+        cursor = conn.cursor(dictionary=True)
+        try:
+            cursor.execute(sql, params or ())
+            return cursor.fetchone()
+        finally:
+            cursor.close()
+
+
+def _fetch_all(sql: str, params: Optional[Sequence] = None) -> List[Dict]:
+    with db_pool.connection() as conn:
+        cursor = conn.cursor(dictionary=True)
+        try:
+            cursor.execute(sql, params or ())
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+
+
+def _execute(sql: str, params: Optional[Sequence] = None) -> int:
+    with db_pool.connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(sql, params or ())
+            conn.commit()
+            return cursor.lastrowid
+        finally:
+            cursor.close()
+
+
+async def fetch_one(sql: str, params: Optional[Sequence] = None) -> Optional[Dict]:
+    """查询单行，返回字典"""
+    return await run_db(_fetch_one, sql, params)
+
+
+async def fetch_all(sql: str, params: Optional[Sequence] = None) -> List[Dict]:
+    """查询多行，返回字典列表"""
+    return await run_db(_fetch_all, sql, params)
+
+
+async def execute(sql: str, params: Optional[Sequence] = None) -> int:
+    """执行写语句并提交，返回 lastrowid"""
+    return await run_db(_execute, sql, params)
+
+
+def executor_stats() -> Dict:
+    """数据库线程池指标"""
+    with _lock:
+        return {
+            "workers": settings.DB_POOL_SIZE,
+            "pending": _pending,
+            "submitted": _submitted,
+        }
+
+
+def shutdown_executor():
+    """关闭数据库线程池"""
+    _executor.shutdown(wait=True)
@@ -3,7 +3,10 @@ from mysql.connector import Error
 import os
 from dotenv import load_dotenv
 import logging
+from datetime import datetime
+from typing import Dict, Optional
 from config import DB_CONFIG
+from database.pool import db_pool
 
 # 加载环境变量
 load_dotenv()
@@ -31,6 +34,7 @@ def init_db():
             avatar_url VARCHAR(255),
             full_name VARCHAR(100),
             phone VARCHAR(20),
+            active_conversation_id INT NULL,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
         )
@@ -43,6 +47,7 @@ def init_db():
             user_id INT NOT NULL,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            INDEX idx_conversations_user_created (user_id, created_at),
             FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
         )
         """)
@@ -55,6 +60,18 @@ def init_db():
             role ENUM('user', 'assistant') NOT NULL,
             content TEXT NOT NULL,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            INDEX idx_chat_messages_conversation_id (conversation_id, id),
+            FOREIGN KEY (conversation_id) REFERENCES conversations(id) ON DELETE CASCADE
+        )
+        """)
+
+        # 创建智能体会话状态表
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS agent_sessions (
+            conversation_id INT PRIMARY KEY,
+            data MEDIUMBLOB NOT NULL,
+            version INT NOT NULL DEFAULT 1,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
             FOREIGN KEY (conversation_id) REFERENCES conversations(id) ON DELETE CASCADE
         )
         """)
@@ -98,9 +115,17 @@ def init_db():
             requirements JSON,
             points_rule TEXT,
             credit_limit VARCHAR(50),
+            summary TEXT,
+            key_facts JSON,
+            summary_hash CHAR(32),
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-            UNIQUE KEY bank_card_name (bank, name)
+            search_text TEXT GENERATED ALWAYS AS (
+                CONCAT_WS(' ', name, name, bank, bank, level,
+                          CAST(benefits AS CHAR), CAST(requirements AS CHAR), points_rule)
+            ) STORED,
+            UNIQUE KEY bank_card_name (bank, name),
+            FULLTEXT INDEX ft_credit_cards_search (search_text) WITH PARSER ngram
         )
         """)
 
@@ -126,6 +151,7 @@ def get_db():
         raise e
 
 def get_db_connection():
+    """获取一个独立的数据库连接（供导入脚本等离线任务使用，API请求请使用连接池）"""
     try:
         # 获取环境变量
         host = os.getenv('DB_HOST', 'localhost')
@@ -151,45 +177,57 @@ def get_db_connection():
             'connection_timeout': 10
         }
         
-        logger.debug(f"数据库连接配置: {config}")
-        
         connection = mysql.connector.connect(**config)
         
         # 设置连接选项
         connection.autocommit = True
         
-        # 测试连接
-        cursor = connection.cursor(dictionary=True)
-        cursor.execute("SELECT 1")
-        result = cursor.fetchone()
-        
-        # 测试查询credit_cards表
-        try:
-            cursor.execute("SELECT COUNT(*) as count FROM credit_cards")
-            count_result = cursor.fetchone()
-            logger.debug(f"credit_cards表中的记录数: {count_result['count'] if count_result else 0}")
-            
-            cursor.execute("SHOW COLUMNS FROM credit_cards")
-            columns = cursor.fetchall()
-            logger.debug(f"credit_cards表的列结构: {columns}")
-            
-            cursor.execute("SELECT * FROM credit_cards LIMIT 1")
-            sample_record = cursor.fetchone()
-            logger.debug(f"credit_cards表的示例记录: {sample_record}")
-        except Error as e:
-            logger.error(f"测试credit_cards表时出错: {e}")
-        finally:
-            cursor.close()
-        
-        if result and result.get('1') == 1:
-            logger.info("数据库连接测试成功")
-        else:
-            logger.warning("数据库连接测试未返回预期结果")
-        
         return connection
     except Error as e:
         logger.error(f"数据库连接失败: {e}")
         raise
     except Exception as e:
         logger.error(f"创建数据库连接时发生未知错误: {e}")
-        raise
\ No newline at end of file
+        raise
+
+# 启动时探测一次的数据库结构信息，请求路径上不再执行任何诊断查询
+_schema_probe: Optional[Dict] = None
+
+def probe_schema() -> Dict:
+    """探测数据库连通性和credit_cards表结构，结果缓存供/health使用"""
+    global _schema_probe
+    probe = {
+        "ok": False,
+        "checked_at": datetime.now().isoformat(),
+        "credit_cards": None,
+        "error": None,
+    }
+    try:
+        with db_pool.connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            try:
+                cursor.execute("SELECT COUNT(*) AS count FROM credit_cards")
+                count = cursor.fetchone()["count"]
+                cursor.execute("SHOW COLUMNS FROM credit_cards")
+                columns = [column["Field"] for column in cursor.fetchall()]
+                cursor.execute(
+                    "SHOW INDEX FROM credit_cards WHERE Key_name = %s",
+                    ("ft_credit_cards_search",)
+                )
+                fulltext = bool(cursor.fetchall())
+            finally:
+                cursor.close()
+        probe["credit_cards"] = {"rows": count, "columns": columns, "fulltext_index": fulltext}
+        if not fulltext:
+            logger.warning("credit_cards 缺少全文索引，请执行 scripts/create_fulltext_index.py")
+        probe["ok"] = True
+        logger.info(f"数据库结构探测成功: credit_cards {count} 行, {len(columns)} 列")
+    except Exception as e:
+        probe["error"] = str(e)
+        logger.error(f"数据库结构探测失败: {e}")
+    _schema_probe = probe
+    return probe
+
+def get_schema_probe() -> Optional[Dict]:
+    """返回启动时缓存的探测结果"""
+    return _schema_probe
@@ -0,0 +1,17 @@
+-- 信用卡全文检索
+-- 把卡名、银行、等级、权益、申请条件和积分规则拼成一个存储生成列，
+-- 并用 ngram 解析器建立全文索引，中文按字符二元组切分，无需分词词典。
+-- 卡名和银行重复一次，使其在相关度排序中权重更高。
+
+ALTER TABLE credit_cards
+    ADD COLUMN search_text TEXT GENERATED ALWAYS AS (
+        CONCAT_WS(' ',
+            name, name, bank, bank, level,
+            CAST(benefits AS CHAR),
+            CAST(requirements AS CHAR),
+            points_rule
+        )
+    ) STORED;
+
+ALTER TABLE credit_cards
+    ADD FULLTEXT INDEX ft_credit_cards_search (search_text) WITH PARSER ngram;
@@ -0,0 +1,9 @@
+-- 聊天历史分页索引
+-- conversations(user_id, created_at): 查找用户最新会话时不需要排序
+-- chat_messages(conversation_id, id): 按消息ID游标分页和增量同步只读取需要的行
+
+ALTER TABLE conversations
+    ADD INDEX idx_conversations_user_created (user_id, created_at);
+
+ALTER TABLE chat_messages
+    ADD INDEX idx_chat_messages_conversation_id (conversation_id, id);
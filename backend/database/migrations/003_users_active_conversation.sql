@@ -0,0 +1,6 @@
+-- 活动会话指针
+-- 聊天时直接读取用户的活动会话ID，不再每条消息都按 created_at 查询最新会话；
+-- 由 /chat/new 和 DELETE /chat/history 维护，已有用户在下一次聊天时按最新会话回填
+
+ALTER TABLE users
+    ADD COLUMN active_conversation_id INT NULL AFTER phone;
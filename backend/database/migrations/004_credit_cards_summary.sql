@@ -0,0 +1,9 @@
+-- 信用卡摘要
+-- 导入脚本为每张卡片生成一句话概要（summary）和按字段分组的要点（key_facts），
+-- summary_hash 为生成时卡片内容的哈希，内容变化后不再匹配，聊天不会使用过期的摘要。
+-- 已有数据执行 scripts/build_card_summaries.py 生成摘要
+
+ALTER TABLE credit_cards
+    ADD COLUMN summary TEXT AFTER credit_limit,
+    ADD COLUMN key_facts JSON AFTER summary,
+    ADD COLUMN summary_hash CHAR(32) AFTER key_facts;
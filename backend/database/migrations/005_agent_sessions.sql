@@ -0,0 +1,12 @@
+-- 智能体会话状态
+-- 按会话ID保存 CreditCardAgent 的状态、用户画像和对话记忆（msgpack 或 JSON 序列化，首字节标记格式），
+-- 多个 worker 共享；version 每次写入加一，进程内缓存据此判断是否需要重新读取。
+-- 会话删除时随外键级联删除
+
+CREATE TABLE IF NOT EXISTS agent_sessions (
+    conversation_id INT PRIMARY KEY,
+    data MEDIUMBLOB NOT NULL,
+    version INT NOT NULL DEFAULT 1,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    FOREIGN KEY (conversation_id) REFERENCES conversations(id) ON DELETE CASCADE
+);
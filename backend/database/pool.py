@@ -0,0 +1,225 @@
+"""
+数据库连接池
+进程内共享的MySQL连接池，提供上下文管理器接口、预检/回收和连接池指标
+"""
+
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+import mysql.connector
+from mysql.connector import Error
+
+from config import DB_CONFIG, settings
+from utils.logger import setup_logger
+
+# 设置日志记录器
+logger = setup_logger('db_pool')
+
+
+class PoolExhaustedError(Exception):
+    """等待超时后仍没有可用连接"""
+
+
+class _PooledConnection:
+    """连接池中的一个连接及其元数据"""
+
+    __slots__ = ("conn", "created_at", "last_used")
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+
+class ConnectionPool:
+    """有界MySQL连接池
+
+    - 连接按需创建，总数不超过 size
+    - 空闲超过 ping_interval 秒的连接在借出前先 ping 一次
+    - 存活超过 recycle 秒的连接会被关闭并重建
+    - 池满时最多等待 timeout 秒，超时抛出 PoolExhaustedError
+    """
+
+    def __init__(self, config: Dict, size: int = 10, timeout: float = 5.0,
+                 recycle: int = 3600, ping_interval: float = 30.0):
+        self._config = dict(config)
+        self.size = size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.ping_interval = ping_interval
+
+        # 后进先出：优先复用最近归还的热连接，冷连接自然老化回收
+        self._idle: "queue.LifoQueue[_PooledConnection]" = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+
+        self._checkouts = 0
+        self._waits = 0
+        self._timeouts = 0
+        self._wait_time_total = 0.0
+        self._wait_time_max = 0.0
+        self._recycled = 0
+        self._ping_failures = 0
+
+    def _connect(self) -> _PooledConnection:
+        """创建一个新的物理连接"""
+        conn = mysql.connector.connect(**self._config)
+        conn.autocommit = True
+        return _PooledConnection(conn)
+
+    def _discard(self, pooled: _PooledConnection):
+        """关闭连接并释放其占用的名额"""
+        try:
+            pooled.conn.close()
+        except Exception:
+            pass
+        with self._lock:
+            self._created -= 1
+
+    def _checkout(self) -> _PooledConnection:
+        """借出一个连接，必要时新建或等待"""
+        start = time.monotonic()
+        pooled: Optional[_PooledConnection] = None
+        try:
+            pooled = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_create = self._created < self.size
+                if can_create:
+                    self._created += 1
+            if can_create:
+                try:
+                    pooled = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                with self._lock:
+                    self._waits += 1
+                try:
+                    pooled = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    with self._lock:
+                        self._timeouts += 1
+                    logger.warning(f"数据库连接池已耗尽: size={self.size}, timeout={self.timeout}s")
+                    raise PoolExhaustedError("数据库连接池已耗尽")
+
+        pooled = self._validate(pooled)
+
+        waited = time.monotonic() - start
+        with self._lock:
+            self._checkouts += 1
+            self._wait_time_total += waited
+            if waited > self._wait_time_max:
+                self._wait_time_max = waited
+        return pooled
+
+    def _validate(self, pooled: _PooledConnection) -> _PooledConnection:
+        """回收过老的连接，并对空闲较久的连接做预检"""
+        now = time.monotonic()
+        if now - pooled.created_at > self.recycle:
+            self._recycled += 1
+            self._discard(pooled)
+            return self._replace()
+
+        if now - pooled.last_used > self.ping_interval:
+            try:
+                pooled.conn.ping(reconnect=False)
+            except Error:
+                self._ping_failures += 1
+                logger.warning("数据库连接预检失败，重新建立连接")
+                self._discard(pooled)
+                return self._replace()
+        return pooled
+
+    def _replace(self) -> _PooledConnection:
+        """为被丢弃的连接补建一个新连接"""
+        with self._lock:
+            self._created += 1
+        try:
+            return self._connect()
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    def _checkin(self, pooled: _PooledConnection, broken: bool = False):
+        """归还连接"""
+        if not broken:
+            try:
+                if pooled.conn.in_transaction:
+                    pooled.conn.rollback()
+            except Error:
+                broken = True
+        if broken:
+            self._discard(pooled)
+            return
+        pooled.last_used = time.monotonic()
+        self._idle.put(pooled)
+
+    @contextmanager
+    def connection(self):
+        """借出一个连接，退出上下文时自动归还
+
+        用法:
+            with db_pool.connection() as conn:
+                cursor = conn.cursor(dictionary=True)
+                ...
+        """
+        pooled = self._checkout()
+        broken = False
+        try:
+            yield pooled.conn
+        except Error:
+            broken = not pooled.conn.is_connected()
+            raise
+        finally:
+            self._checkin(pooled, broken)
+
+    def stats(self) -> Dict:
+        """连接池指标"""
+        with self._lock:
+            checkouts = self._checkouts
+            return {
+                "size": self.size,
+                "created": self._created,
+                "idle": self._idle.qsize(),
+                "in_use": self._created - self._idle.qsize(),
+                "checkouts": checkouts,
+                "waits": self._waits,
+                "timeouts": self._timeouts,
+                "wait_time_total_ms": round(self._wait_time_total * 1000, 3),
+                "wait_time_avg_ms": round(self._wait_time_total * 1000 / checkouts, 3) if checkouts else 0.0,
+                "wait_time_max_ms": round(self._wait_time_max * 1000, 3),
+                "recycled": self._recycled,
+                "ping_failures": self._ping_failures,
+            }
+
+    def close_all(self):
+        """关闭所有空闲连接"""
+        while True:
+            try:
+                pooled = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(pooled)
+        logger.info("数据库连接池已关闭")
+
+
+db_pool = ConnectionPool(
+    {
+        **DB_CONFIG,
+        "charset": "utf8mb4",
+        "collation": "utf8mb4_unicode_ci",
+        "use_unicode": True,
+        "connection_timeout": 10,
+    },
+    size=settings.DB_POOL_SIZE,
+    timeout=settings.DB_POOL_TIMEOUT,
+    recycle=settings.DB_POOL_RECYCLE,
+    ping_interval=settings.DB_POOL_PING_INTERVAL,
+)
@@ -7,6 +7,7 @@ CREATE TABLE IF NOT EXISTS users (
     avatar_url VARCHAR(255),
     full_name VARCHAR(100),
     phone VARCHAR(20),
+    active_conversation_id INT NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
 );
@@ -56,8 +57,18 @@ CREATE TABLE IF NOT EXISTS credit_cards (
     requirements JSON,
     points_rule TEXT,
     credit_limit VARCHAR(50),
+    -- 导入时生成的概要、要点和生成时的内容哈希，见 migrations/004_credit_cards_summary.sql
+    summary TEXT,
+    key_facts JSON,
+    summary_hash CHAR(32),
     timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-    UNIQUE KEY `bank_card_name` (`bank`, `name`)
+    -- 全文检索文本，见 migrations/001_credit_cards_fulltext.sql
+    search_text TEXT GENERATED ALWAYS AS (
+        CONCAT_WS(' ', name, name, bank, bank, level,
+                  CAST(benefits AS CHAR), CAST(requirements AS CHAR), points_rule)
+    ) STORED,
+    UNIQUE KEY `bank_card_name` (`bank`, `name`),
+    FULLTEXT INDEX ft_credit_cards_search (search_text) WITH PARSER ngram
 ); 
\ No newline at end of file
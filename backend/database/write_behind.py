@@ -0,0 +1,206 @@
+"""
+聊天消息异步写入
+请求只把消息放入队列，后台任务按条数或时间批量写入 chat_messages，
+每批一条多行 INSERT、一次提交，关闭时写完队列中剩余的消息
+"""
+
+import asyncio
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from mysql.connector import Error, errorcode
+
+from config import settings
+from database.async_db import run_db
+from database.pool import db_pool
+from utils.logger import setup_logger
+
+# 设置日志记录器
+logger = setup_logger('write_behind')
+
+INSERT_SQL = "INSERT INTO chat_messages (conversation_id, role, content) VALUES (%s, %s, %s)"
+
+# (会话ID, 角色, 内容, 所属用户名)
+PendingMessage = Tuple[int, str, str, Optional[str]]
+
+
+def _insert_batch(batch: List[PendingMessage]) -> List[PendingMessage]:
+    """写入一批消息，返回因会话已删除而无法写入的消息（在数据库线程池中执行）
+
+    executemany 会把 INSERT ... VALUES 合并成一条多行语句。
+    整批因外键失败时（会话在其他进程中被清空），逐条重写以找出失效的消息。
+    连接池的连接开启了自动提交，这里显式开启事务，整批只提交一次；
+    其他错误时整批回滚后抛出，重试时不会重复写入已写过的消息。
+    """
+    rows = [message[:3] for message in batch]
+    with db_pool.connection() as conn:
+        cursor = conn.cursor()
+        try:
+            conn.start_transaction()
+            try:
+                cursor.executemany(INSERT_SQL, rows)
+                conn.commit()
+                return []
+            except Error as e:
+                if e.errno != errorcode.ER_NO_REFERENCED_ROW_2:
+                    raise
+                # 失败的多行语句已整体撤销，事务仍然有效，继续逐条写入
+
+            orphaned = []
+            for message in batch:
+                try:
+                    cursor.execute(INSERT_SQL, message[:3])
+                except Error as e:
+                    if e.errno != errorcode.ER_NO_REFERENCED_ROW_2:
+                        raise
+                    orphaned.append(message)
+            conn.commit()
+            return orphaned
+        except Exception:
+            try:
+                conn.rollback()
+            except Error as e:
+                logger.warning(f"回滚消息写入失败: {str(e)}")
+            raise
+        finally:
+            cursor.close()
+
+
+class MessageWriter:
+    """chat_messages 批量写入器
+
+    - 队列中攒够 batch_size 条或距第一条消息超过 flush_interval 秒时写入一批
+    - 队列满时 submit() 等待，向请求施加背压而不是无限占用内存
+    - 写入失败时按 retry_delay 重试 max_retries 次，仍失败则丢弃该批并记录
+    """
+
+    def __init__(self, batch_size: int = 100, flush_interval: float = 0.05,
+                 max_queue: int = 10000, max_retries: int = 3, retry_delay: float = 0.5):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        # 会话已删除时的回调，参数为消息所属用户名
+        self.on_orphaned: Optional[Callable[[str], None]] = None
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+        self._enqueued = 0
+        self._written = 0
+        self._batches = 0
+        self._failed = 0
+        self._orphaned = 0
+        self._max_depth = 0
+        self._last_flush_ms = 0.0
+
+    def start(self):
+        """在当前事件循环中启动后台写入任务"""
+        if self._task is not None and not self._task.done():
+            return
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._stopping = False
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def submit(self, conversation_id: int, role: str, content: str, owner: Optional[str] = None):
+        """放入一条待写入的消息"""
+        if self._task is None or self._task.done():
+            self.start()
+        await self._queue.put((conversation_id, role, content, owner))
+        self._enqueued += 1
+        depth = self._queue.qsize()
+        if depth > self._max_depth:
+            self._max_depth = depth
+
+    async def _next_batch(self) -> List[PendingMessage]:
+        """等待第一条消息，再在 flush_interval 内尽量攒满一批"""
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._stopping:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _flush(self, batch: List[PendingMessage]):
+        start = time.perf_counter()
+        for attempt in range(self.max_retries + 1):
+            try:
+                orphaned = await run_db(_insert_batch, batch)
+                break
+            except Exception as e:
+                if attempt == self.max_retries:
+                    self._failed += len(batch)
+                    logger.error(f"写入 {len(batch)} 条聊天消息失败，已丢弃: {str(e)}")
+                    return
+                logger.warning(f"写入聊天消息失败，{self.retry_delay} 秒后重试: {str(e)}")
+                await asyncio.sleep(self.retry_delay)
+
+        self._batches += 1
+        self._written += len(batch) - len(orphaned)
+        self._last_flush_ms = (time.perf_counter() - start) * 1000
+        if orphaned:
+            self._orphaned += len(orphaned)
+            logger.warning(f"{len(orphaned)} 条消息所属的会话已删除，未写入")
+            if self.on_orphaned is not None:
+                for owner in {message[3] for message in orphaned if message[3]}:
+                    self.on_orphaned(owner)
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            try:
+                await self._flush(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def drain(self, timeout: float = 10.0):
+        """写完队列中的消息后停止后台任务"""
+        if self._task is None:
+            return
+        self._stopping = True
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"关闭时仍有 {self._queue.qsize()} 条聊天消息未写入")
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def stats(self) -> Dict:
+        """写入队列指标"""
+        return {
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "max_queue_depth": self._max_depth,
+            "max_queue": self.max_queue,
+            "enqueued": self._enqueued,
+            "written": self._written,
+            "batches": self._batches,
+            "avg_batch_size": round(self._written / self._batches, 1) if self._batches else 0.0,
+            "last_flush_ms": round(self._last_flush_ms, 2),
+            "failed": self._failed,
+            "orphaned": self._orphaned,
+        }
+
+
+message_writer = MessageWriter(
+    batch_size=settings.MESSAGE_WRITER_BATCH_SIZE,
+    flush_interval=settings.MESSAGE_WRITER_FLUSH_INTERVAL,
+    max_queue=settings.MESSAGE_WRITER_MAX_QUEUE
+)
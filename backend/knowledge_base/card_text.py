@@ -0,0 +1,89 @@
+"""
+卡片文本处理
+估算 token 数，把卡片字段拆成可单独选取的片段；提示词组装和导入时的摘要生成共用
+"""
+
+import math
+import re
+from typing import Dict, List, Tuple
+
+CJK_PATTERN = re.compile(r"[一-鿿　-〿＀-￯]")
+# 长字段按句切分，每句单独参与排序
+SENTENCE_PATTERN = re.compile(r"[^。；;！!\n]+[。；;！!]?")
+# 字符串形式的权益列表
+ITEM_SEPARATOR_PATTERN = re.compile(r"[，,、；;。\n]+")
+# 过长的句子再按逗号切分
+CLAUSE_SEPARATOR_PATTERN = re.compile(r"[，,]+")
+
+# 超过该 token 数的句子按逗号切成分句
+MAX_SENTENCE_TOKENS = 40
+
+# 字段的输出顺序、标签和基础权重
+FIELDS: Tuple[Tuple[str, str, float], ...] = (
+    ("annual_fee", "年费政策", 1.0),
+    ("credit_limit", "信用额度", 0.6),
+    ("benefits", "主要权益", 1.0),
+    ("requirements", "申请条件", 0.8),
+    ("points_rule", "积分规则", 0.8),
+)
+FIELD_ORDER = {field: index for index, (field, _, _) in enumerate(FIELDS)}
+FIELD_LABELS: Dict[str, str] = {field: label for field, label, _ in FIELDS}
+
+
+def estimate_tokens(text: str) -> int:
+    """估算 token 数：汉字和全角符号约 0.6 个 token，其他非空白字符约 0.3 个"""
+    if not text:
+        return 0
+    cjk = len(CJK_PATTERN.findall(text))
+    other = len(text) - cjk - text.count(" ") - text.count("\n")
+    return math.ceil(cjk * 0.6 + max(other, 0) * 0.3)
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """截断到不超过 max_tokens，截断时以省略号结尾"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if estimate_tokens(text[:middle]) + 1 <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low] + "…"
+
+
+def _split_text(field: str, text: str) -> List[str]:
+    if field == "benefits":
+        return [item.strip() for item in ITEM_SEPARATOR_PATTERN.split(text) if item.strip()]
+    items = []
+    for sentence in SENTENCE_PATTERN.findall(text):
+        sentence = sentence.strip()
+        if estimate_tokens(sentence) > MAX_SENTENCE_TOKENS:
+            items.extend(clause.strip() for clause in CLAUSE_SEPARATOR_PATTERN.split(sentence) if clause.strip())
+        elif sentence:
+            items.append(sentence)
+    return items or [text]
+
+
+def field_items(field: str, value) -> List[str]:
+    """把字段值拆成可单独选取的片段，去掉重复的片段"""
+    if not value:
+        return []
+    if isinstance(value, dict):
+        items = []
+        for key, item in value.items():
+            if isinstance(item, (list, tuple)):
+                item = "、".join(str(part) for part in item)
+            if item in (None, ""):
+                items.append(str(key))
+            elif key == FIELD_LABELS[field]:
+                # 与字段标签相同的键（如申请条件中的"申请条件"）不再重复
+                items.extend(_split_text(field, str(item)))
+            else:
+                items.append(f"{key}：{item}")
+    elif isinstance(value, (list, tuple)):
+        items = [str(item) for item in value if item]
+    else:
+        items = _split_text(field, str(value).strip())
+    return list(dict.fromkeys(items))
@@ -0,0 +1,238 @@
+"""
+信用卡目录快照
+在进程内缓存解析好的信用卡数据和常用筛选条件下预编码的JSON响应，
+目录只在导入脚本运行后才会变化，版本变化或超过TTL时重新加载
+"""
+
+import asyncio
+import json
+import threading
+import time
+from datetime import date, datetime
+from typing import Dict, List, Optional, Tuple
+
+from config import settings
+from database.async_db import run_db
+from database.pool import db_pool
+from knowledge_base.summaries import CardSummary, load_summary
+from utils.logger import setup_logger
+
+# 设置日志记录器
+logger = setup_logger('catalog')
+
+# 与 api.credit_cards.CreditCard 一致的字段
+CARD_FIELDS = (
+    "id", "bank", "name", "level", "annual_fee", "benefits", "requirements",
+    "points_rule", "credit_limit", "timestamp", "created_at", "updated_at",
+)
+JSON_FIELDS = ("benefits", "requirements")
+
+
+def parse_json_field(value) -> Dict:
+    """解析JSON列，无法解析时返回空字典"""
+    if not value:
+        return {}
+    if isinstance(value, dict):
+        return value
+    try:
+        parsed = json.loads(value)
+    except (TypeError, ValueError):
+        return {}
+    return parsed if isinstance(parsed, dict) else {}
+
+
+def parse_card_row(row: Dict) -> Dict:
+    """把数据库行转换为接口使用的卡片字典"""
+    card = {field: row.get(field) for field in CARD_FIELDS}
+    for field in JSON_FIELDS:
+        card[field] = parse_json_field(card[field])
+    return card
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"无法序列化类型: {type(value).__name__}")
+
+
+def encode_json(data) -> bytes:
+    """与 FastAPI JSONResponse 相同的紧凑编码"""
+    return json.dumps(
+        data, ensure_ascii=False, allow_nan=False, separators=(",", ":"), default=_json_default
+    ).encode("utf-8")
+
+
+class CatalogSnapshot:
+    """某一版本的目录数据，创建后只读"""
+
+    def __init__(self, version: int, fingerprint: Tuple, cards: List[Dict],
+                 summaries: Optional[Dict[int, CardSummary]] = None):
+        self.version = version
+        self.fingerprint = fingerprint
+        self.loaded_at = time.monotonic()
+        self.cards = cards
+        self.by_id = {card["id"]: card for card in cards}
+        # 导入时生成且与当前内容一致的摘要，不出现在接口响应中
+        self.summaries: Dict[int, CardSummary] = summaries or {}
+        self._encoded: Dict[Tuple[Optional[str], Optional[str]], bytes] = {}
+        self._lock = threading.Lock()
+
+        # 预编码最常用的筛选组合：全部、按银行、按等级
+        self.encoded()
+        for bank in {card["bank"] for card in cards}:
+            self.encoded(bank=bank)
+        for level in {card["level"] for card in cards if card["level"]}:
+            self.encoded(level=level)
+
+    def filter(self, bank: Optional[str] = None, level: Optional[str] = None) -> List[Dict]:
+        """按银行和等级筛选"""
+        return [
+            card for card in self.cards
+            if (bank is None or card["bank"] == bank) and (level is None or card["level"] == level)
+        ]
+
+    def encoded(self, bank: Optional[str] = None, level: Optional[str] = None) -> bytes:
+        """返回筛选结果的JSON字节，首次请求某个组合时编码并缓存"""
+        key = (bank, level)
+        data = self._encoded.get(key)
+        if data is None:
+            data = encode_json(self.filter(bank, level))
+            with self._lock:
+                self._encoded[key] = data
+        return data
+
+    def encoded_card(self, card_id: int) -> Optional[bytes]:
+        """返回单张卡片的JSON字节"""
+        card = self.by_id.get(card_id)
+        return None if card is None else encode_json(card)
+
+
+class CardCatalog:
+    """信用卡目录
+
+    - 每隔 check_interval 秒用一条轻量查询检查目录指纹（行数、最大ID、最后更新时间），
+      指纹变化即视为版本升级并重新加载
+    - 超过 ttl 秒无论是否变化都强制重新加载
+    - 重新加载期间其他请求继续使用旧快照
+    """
+
+    def __init__(self, ttl: float = 600.0, check_interval: float = 30.0):
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._version = 0
+        self._last_check = 0.0
+        self._force_reload = False
+        self._refresh_lock: Optional[asyncio.Lock] = None
+        self._reloads = 0
+        self._checks = 0
+
+    def _fingerprint(self, cursor) -> Tuple:
+        cursor.execute("SELECT COUNT(*) AS count, MAX(id) AS max_id, MAX(updated_at) AS updated_at FROM credit_cards")
+        row = cursor.fetchone()
+        return (row["count"], row["max_id"], row["updated_at"])
+
+    def refresh(self, force: bool = False) -> CatalogSnapshot:
+        """检查目录版本，必要时重新加载（同步，在数据库线程池中执行）"""
+        with db_pool.connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            try:
+                fingerprint = self._fingerprint(cursor)
+                self._checks += 1
+                self._last_check = time.monotonic()
+                current = self._snapshot
+                if not force and current is not None and current.fingerprint == fingerprint:
+                    return current
+
+                cursor.execute("SELECT * FROM credit_cards ORDER BY id")
+                rows = cursor.fetchall()
+            finally:
+                cursor.close()
+
+        cards = []
+        summaries: Dict[int, CardSummary] = {}
+        for row in rows:
+            if not row.get("bank") or not row.get("name"):
+                logger.warning(f"跳过缺少银行或卡名的信用卡记录: id={row.get('id')}")
+                continue
+            card = parse_card_row(row)
+            cards.append(card)
+            summary = load_summary(row, card)
+            if summary is not None:
+                summaries[card["id"]] = summary
+
+        self._version += 1
+        snapshot = CatalogSnapshot(self._version, fingerprint, cards, summaries)
+        self._snapshot = snapshot
+        self._reloads += 1
+        logger.info(
+            f"信用卡目录已加载: 版本 {snapshot.version}, {len(cards)} 张卡片, {len(summaries)} 张有摘要"
+        )
+        if len(summaries) < len(cards):
+            logger.warning(
+                f"{len(cards) - len(summaries)} 张卡片缺少摘要或摘要已过期，请执行 scripts/build_card_summaries.py"
+            )
+        return snapshot
+
+    def _needs_refresh(self) -> Tuple[bool, bool]:
+        """返回 (是否需要刷新, 是否强制重新加载)"""
+        snapshot = self._snapshot
+        if snapshot is None:
+            return True, True
+        now = time.monotonic()
+        if self._force_reload or now - snapshot.loaded_at > self.ttl:
+            return True, True
+        if now - self._last_check > self.check_interval:
+            return True, False
+        return False, False
+
+    async def get_snapshot(self) -> CatalogSnapshot:
+        """获取当前快照，过期时刷新"""
+        needed, force = self._needs_refresh()
+        if not needed:
+            return self._snapshot
+
+        if self._refresh_lock is None:
+            self._refresh_lock = asyncio.Lock()
+        if self._refresh_lock.locked() and self._snapshot is not None:
+            # 其他请求正在刷新，先返回旧快照
+            return self._snapshot
+
+        async with self._refresh_lock:
+            needed, force = self._needs_refresh()
+            if needed:
+                self._force_reload = False
+                await run_db(self.refresh, force)
+        return self._snapshot
+
+    def invalidate(self):
+        """标记目录已变化，下一次访问时重新加载"""
+        self._force_reload = True
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def summaries(self) -> Dict[int, CardSummary]:
+        """当前快照中的卡片摘要"""
+        snapshot = self._snapshot
+        return snapshot.summaries if snapshot else {}
+
+    def stats(self) -> Dict:
+        """目录指标"""
+        snapshot = self._snapshot
+        return {
+            "version": self._version,
+            "cards": len(snapshot.cards) if snapshot else 0,
+            "age_seconds": round(time.monotonic() - snapshot.loaded_at, 1) if snapshot else None,
+            "encoded_variants": len(snapshot._encoded) if snapshot else 0,
+            "summaries": len(snapshot.summaries) if snapshot else 0,
+            "reloads": self._reloads,
+            "checks": self._checks,
+        }
+
+
+card_catalog = CardCatalog(
+    ttl=settings.CARD_CATALOG_TTL,
+    check_interval=settings.CARD_CATALOG_CHECK_INTERVAL
+)
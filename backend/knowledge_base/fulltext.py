@@ -0,0 +1,97 @@
+"""
+信用卡全文检索
+基于 credit_cards.search_text 上的 ngram 全文索引（见 database/migrations/001_credit_cards_fulltext.sql），
+按相关度返回匹配的卡片；索引尚未建立时退回到 LIKE 查询
+"""
+
+from typing import Dict, List
+
+from mysql.connector import Error, errorcode
+
+from database.pool import db_pool
+from utils.logger import setup_logger
+
+# 设置日志记录器
+logger = setup_logger('fulltext')
+
+FULLTEXT_INDEX = "ft_credit_cards_search"
+
+# 只查询实际的业务列，search_text 只用于检索
+SEARCH_COLUMNS = (
+    "id", "bank", "name", "level", "annual_fee", "benefits", "requirements",
+    "points_rule", "credit_limit",
+)
+
+# 缺少全文索引或 search_text 列时的错误码
+_MISSING_INDEX_ERRORS = (errorcode.ER_FT_MATCHING_KEY_NOT_FOUND, errorcode.ER_BAD_FIELD_ERROR)
+
+_fulltext_available = True
+
+
+def _column_list() -> str:
+    return ", ".join(f"`{column}`" for column in SEARCH_COLUMNS)
+
+
+def _match_query(cursor, keyword: str, limit: int) -> List[Dict]:
+    sql = f"""
+    SELECT {_column_list()},
+           MATCH(search_text) AGAINST (%s IN NATURAL LANGUAGE MODE) AS relevance
+    FROM credit_cards
+    WHERE MATCH(search_text) AGAINST (%s IN NATURAL LANGUAGE MODE)
+    ORDER BY relevance DESC
+    LIMIT %s
+    """
+    cursor.execute(sql, (keyword, keyword, limit))
+    return cursor.fetchall()
+
+
+def _like_query(cursor, keyword: str, limit: int) -> List[Dict]:
+    sql = f"""
+    SELECT {_column_list()}
+    FROM credit_cards
+    WHERE bank LIKE %s
+       OR name LIKE %s
+       OR level LIKE %s
+       OR CAST(benefits AS CHAR) LIKE %s
+    LIMIT %s
+    """
+    search_term = f"%{keyword}%"
+    cursor.execute(sql, (search_term, search_term, search_term, search_term, limit))
+    return cursor.fetchall()
+
+
+def search_cards(keyword: str, limit: int = 5) -> List[Dict]:
+    """按相关度搜索信用卡（同步，在数据库线程池中执行）
+
+    Args:
+        keyword: 搜索文本，可以是整句用户消息，ngram 解析器会切分为二元组逐一匹配
+        limit: 最多返回的卡片数
+
+    Returns:
+        按相关度降序排列的卡片列表
+    """
+    global _fulltext_available
+    keyword = (keyword or "").strip()
+    if not keyword:
+        return []
+
+    with db_pool.connection() as conn:
+        cursor = conn.cursor(dictionary=True)
+        try:
+            if _fulltext_available:
+                try:
+                    return _match_query(cursor, keyword, limit)
+                except Error as e:
+                    if e.errno not in _MISSING_INDEX_ERRORS:
+                        raise
+                    _fulltext_available = False
+                    logger.warning(f"全文索引 {FULLTEXT_INDEX} 不存在，退回到LIKE查询，请执行迁移: {e}")
+            return _like_query(cursor, keyword, limit)
+        finally:
+            cursor.close()
+
+
+def reset_fulltext_state():
+    """迁移执行后重新启用全文检索"""
+    global _fulltext_available
+    _fulltext_available = True
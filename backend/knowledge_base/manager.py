@@ -4,73 +4,55 @@
 """
 
 from typing import List, Dict, Optional
-import mysql.connector
-from config import DB_CONFIG
+from database.pool import db_pool
 
 class KnowledgeBaseManager:
     """知识库管理器类"""
     
     def __init__(self):
-        self.db_config = DB_CONFIG
-    
-    def get_db_connection(self):
-        """获取数据库连接"""
-        try:
-            conn = mysql.connector.connect(**self.db_config)
-            return conn
-        except Exception as e:
-            raise Exception(f"数据库连接失败: {str(e)}")
+        self.pool = db_pool
     
     def search_similar(self, query_embedding: List[float], limit: int = 5) -> List[Dict]:
         """搜索相似文档"""
         try:
-            conn = self.get_db_connection()
-            cursor = conn.cursor(dictionary=True)
-            
-            # 这里需要实现向量相似度搜索
-            # 目前返回空列表
-            return []
+            with self.pool.connection() as conn:
+                cursor = conn.cursor(dictionary=True)
+                try:
+                    # 这里需要实现向量相似度搜索
+                    # 目前返回空列表
+                    return []
+                finally:
+                    cursor.close()
             
         except Exception as e:
             raise Exception(f"搜索失败: {str(e)}")
-        finally:
-            if 'cursor' in locals():
-                cursor.close()
-            if 'conn' in locals():
-                conn.close()
     
     def add_document(self, content: str, embedding: List[float]) -> int:
         """添加文档到知识库"""
         try:
-            conn = self.get_db_connection()
-            cursor = conn.cursor()
-            
-            # 这里需要实现文档添加逻辑
-            # 目前返回0
-            return 0
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                try:
+                    # 这里需要实现文档添加逻辑
+                    # 目前返回0
+                    return 0
+                finally:
+                    cursor.close()
             
         except Exception as e:
             raise Exception(f"添加文档失败: {str(e)}")
-        finally:
-            if 'cursor' in locals():
-                cursor.close()
-            if 'conn' in locals():
-                conn.close()
     
     def get_document(self, doc_id: int) -> Optional[Dict]:
         """获取文档"""
         try:
-            conn = self.get_db_connection()
-            cursor = conn.cursor(dictionary=True)
-            
-            # 这里需要实现文档获取逻辑
-            # 目前返回None
-            return None
+            with self.pool.connection() as conn:
+                cursor = conn.cursor(dictionary=True)
+                try:
+                    # 这里需要实现文档获取逻辑
+                    # 目前返回None
+                    return None
+                finally:
+                    cursor.close()
             
         except Exception as e:
             raise Exception(f"获取文档失败: {str(e)}")
-        finally:
-            if 'cursor' in locals():
-                cursor.close()
-            if 'conn' in locals():
-                conn.close() 
\ No newline at end of file
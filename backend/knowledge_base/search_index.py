@@ -0,0 +1,320 @@
+"""
+信用卡倒排索引
+在进程内对目录快照建立倒排索引，中文按字符二元组切分，用 BM25 排序，
+聊天检索无需访问数据库；目录版本变化时只重新索引内容有变化的卡片
+"""
+
+import asyncio
+import heapq
+import json
+import math
+import re
+import threading
+import time
+from collections import Counter
+from operator import itemgetter
+from typing import Dict, List, Optional, Set, Tuple
+
+from knowledge_base.catalog import CatalogSnapshot, card_catalog
+from utils.logger import setup_logger
+
+# 设置日志记录器
+logger = setup_logger('search_index')
+
+# 连续汉字的所有二元组（前瞻匹配可以重叠）、孤立的单个汉字、英文和数字整词
+BIGRAM_PATTERN = re.compile(r"(?=([一-鿿]{2}))")
+SINGLE_PATTERN = re.compile(r"(?<![一-鿿])[一-鿿](?![一-鿿])")
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+# 变化的卡片超过该比例时整体重建，否则增量更新
+REBUILD_RATIO = 0.2
+
+# 参与索引的字段，任一字段变化时重新索引该卡片
+INDEXED_FIELDS = ("name", "bank", "level", "benefits", "requirements", "points_rule")
+
+
+def tokenize(text: str) -> List[str]:
+    """切分文本：连续汉字按二元组切分（单字保留原字），英文和数字按整词"""
+    text = text.lower()
+    return BIGRAM_PATTERN.findall(text) + SINGLE_PATTERN.findall(text) + WORD_PATTERN.findall(text)
+
+
+# 卡片索引内容的比较键，直接比较字段值，不需要序列化或计算哈希
+content_key = itemgetter(*INDEXED_FIELDS)
+
+
+def card_document(card: Dict) -> str:
+    """卡片的索引文本，卡名和银行重复一次以提高权重；JSON字段直接序列化，分词时会忽略标点"""
+    name = card.get("name") or ""
+    bank = card.get("bank") or ""
+    return " ".join((
+        name, name, bank, bank, card.get("level") or "",
+        json.dumps(card.get("benefits") or {}, ensure_ascii=False),
+        json.dumps(card.get("requirements") or {}, ensure_ascii=False),
+        card.get("points_rule") or "",
+    ))
+
+
+class _IndexData:
+    """倒排表
+
+    倒排列表中直接保存每个词在文档中的 BM25 词频分量 tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / avgdl))，
+    avgdl 取整体重建时的值，增量更新不改变已有文档的分量，下一次重建时重新计算。
+    ranked 保存每个词按分量降序排列的文档ID，供阈值算法按序读取
+    """
+
+    __slots__ = ("postings", "ranked", "doc_key", "doc_tokens", "avgdl")
+
+    def __init__(self, avgdl: float = 0.0):
+        self.postings: Dict[str, Dict[int, float]] = {}
+        self.ranked: Dict[str, List[int]] = {}
+        self.doc_key: Dict[int, Tuple] = {}
+        self.doc_tokens: Dict[int, List[str]] = {}
+        self.avgdl = avgdl
+
+    def impacts(self, tokens: List[str], k1: float, b: float) -> Dict[str, float]:
+        """文档中每个词的 BM25 词频分量"""
+        norm = k1 * (1 - b + b * len(tokens) / self.avgdl) if self.avgdl else k1
+        return {token: tf * (k1 + 1) / (tf + norm) for token, tf in Counter(tokens).items()}
+
+    def add(self, card_id: int, key: Tuple, tokens: List[str], k1: float, b: float):
+        """建索引时添加文档，全部添加完后调用 rank_all()"""
+        postings = self.postings
+        for token, impact in self.impacts(tokens, k1, b).items():
+            posting = postings.get(token)
+            if posting is None:
+                posting = postings[token] = {}
+            posting[card_id] = impact
+        self.doc_key[card_id] = key
+        self.doc_tokens[card_id] = tokens
+
+    def rank_all(self):
+        self.ranked = {token: _ranked(posting) for token, posting in self.postings.items()}
+
+
+def _ranked(posting: Dict[int, float]) -> List[int]:
+    return sorted(posting, key=posting.__getitem__, reverse=True)
+
+
+def _reranked(ids: List[int], posting: Dict[int, float], dropped: Set[int], inserted: List[int]) -> List[int]:
+    """在已排序的文档ID列表上删除和插入少量文档，变化较多时直接重新排序"""
+    if (len(dropped) + len(inserted)) * 16 > len(ids):
+        return _ranked(posting)
+    ids = [card_id for card_id in ids if card_id not in dropped] if dropped else list(ids)
+    for card_id in inserted:
+        impact = posting[card_id]
+        low, high = 0, len(ids)
+        while low < high:
+            middle = (low + high) // 2
+            if posting[ids[middle]] >= impact:
+                low = middle + 1
+            else:
+                high = middle
+        ids.insert(low, card_id)
+    return ids
+
+
+class CardSearchIndex:
+    """信用卡 BM25 倒排索引
+
+    - sync() 在线程池中执行，变化较少时在锁内增量更新，变化较多时在锁外重建后整体替换
+    - rank() 在事件循环中执行，用阈值算法（Fagin TA）按分量从高到低并行读取各词的倒排列表，
+      当前第 k 名的得分不低于未读文档的得分上界时提前结束，不需要扫描高频词的完整倒排列表
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._data = _IndexData()
+        self._cards: Dict[int, Dict] = {}
+        self._version: Optional[int] = None
+        self._lock = threading.Lock()
+        self._sync_lock: Optional[asyncio.Lock] = None
+
+        self._builds = 0
+        self._incremental_updates = 0
+        self._searches = 0
+        self._search_time_total = 0.0
+
+    def build(self, cards: List[Dict], version: Optional[int] = None):
+        """整体重建索引"""
+        tokens_by_id = {card["id"]: tokenize(card_document(card)) for card in cards}
+        total = sum(len(tokens) for tokens in tokens_by_id.values())
+        data = _IndexData(avgdl=total / len(tokens_by_id) if tokens_by_id else 0.0)
+        for card in cards:
+            data.add(card["id"], content_key(card), tokens_by_id[card["id"]], self.k1, self.b)
+        data.rank_all()
+
+        with self._lock:
+            self._data = data
+            self._cards = {card["id"]: card for card in cards}
+            self._version = version
+        self._builds += 1
+
+    def _apply(self, data: _IndexData, keys: Dict[int, Tuple],
+               changed: List[int], removed: List[int], snapshot: CatalogSnapshot):
+        """增量更新：在锁外复制并修改受影响的倒排列表，再在锁内替换引用"""
+        updates: Dict[str, Dict[int, float]] = {}
+        dropped: Dict[str, Set[int]] = {}
+        inserted: Dict[str, List[int]] = {}
+
+        def touch(token: str) -> Dict[int, float]:
+            posting = updates.get(token)
+            if posting is None:
+                posting = updates[token] = dict(data.postings.get(token, ()))
+                dropped[token] = set()
+                inserted[token] = []
+            return posting
+
+        for card_id in removed + changed:
+            for token in set(data.doc_tokens.get(card_id, ())):
+                if touch(token).pop(card_id, None) is not None:
+                    dropped[token].add(card_id)
+
+        new_tokens = {}
+        for card_id in changed:
+            tokens = new_tokens[card_id] = tokenize(card_document(snapshot.by_id[card_id]))
+            for token, impact in data.impacts(tokens, self.k1, self.b).items():
+                touch(token)[card_id] = impact
+                inserted[token].append(card_id)
+        ranked = {
+            token: _reranked(data.ranked.get(token, []), posting, dropped[token], inserted[token])
+            for token, posting in updates.items() if posting
+        }
+
+        with self._lock:
+            for token, posting in updates.items():
+                if posting:
+                    data.postings[token] = posting
+                    data.ranked[token] = ranked[token]
+                else:
+                    data.postings.pop(token, None)
+                    data.ranked.pop(token, None)
+            for card_id in removed:
+                data.doc_key.pop(card_id, None)
+                data.doc_tokens.pop(card_id, None)
+            for card_id, tokens in new_tokens.items():
+                data.doc_key[card_id] = keys[card_id]
+                data.doc_tokens[card_id] = tokens
+            self._cards = dict(snapshot.by_id)
+            self._version = snapshot.version
+
+    def sync(self, snapshot: CatalogSnapshot) -> Tuple[int, int, int]:
+        """与目录快照同步，返回 (新增, 更新, 删除) 的卡片数"""
+        if snapshot.version == self._version:
+            return 0, 0, 0
+
+        data = self._data
+        keys = {card["id"]: content_key(card) for card in snapshot.cards}
+        removed = [card_id for card_id in data.doc_key if card_id not in keys]
+        # 只对索引内容变化的卡片重新分词
+        changed = [card_id for card_id, key in keys.items() if data.doc_key.get(card_id) != key]
+        added = sum(1 for card_id in changed if card_id not in data.doc_key)
+        updated = len(changed) - added
+
+        if not data.doc_key or len(changed) + len(removed) > REBUILD_RATIO * max(len(keys), 1):
+            self.build(snapshot.cards, snapshot.version)
+        else:
+            self._apply(data, keys, changed, removed, snapshot)
+            self._incremental_updates += 1
+
+        logger.info(
+            f"倒排索引已同步到目录版本 {snapshot.version}: "
+            f"新增 {added}, 更新 {updated}, 删除 {len(removed)}"
+        )
+        return added, updated, len(removed)
+
+    def rank(self, query: str, k: int = 5) -> List[Tuple[float, int]]:
+        """返回得分最高的 k 个 (得分, 卡片ID)"""
+        start = time.perf_counter()
+        query_terms = set(tokenize(query))
+        top: List[Tuple[float, int]] = []
+        with self._lock:
+            data = self._data
+            n_docs = len(data.doc_key)
+            terms = []
+            for term in query_terms:
+                posting = data.postings.get(term)
+                if posting is None:
+                    continue
+                df = len(posting)
+                idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+                terms.append((idf, posting, data.ranked[term]))
+
+            seen = set()
+            depth = 0
+            longest = max((len(ids) for _, _, ids in terms), default=0)
+            while depth < longest:
+                # 未读到的文档在每个词上的分量都不超过当前深度的分量
+                threshold = 0.0
+                for idf, posting, ids in terms:
+                    if depth >= len(ids):
+                        continue
+                    card_id = ids[depth]
+                    threshold += idf * posting[card_id]
+                    if card_id in seen:
+                        continue
+                    seen.add(card_id)
+                    score = 0.0
+                    for other_idf, other_posting, _ in terms:
+                        impact = other_posting.get(card_id)
+                        if impact is not None:
+                            score += other_idf * impact
+                    if len(top) < k:
+                        heapq.heappush(top, (score, card_id))
+                    elif score > top[0][0]:
+                        heapq.heapreplace(top, (score, card_id))
+                if len(top) >= k and top[0][0] >= threshold:
+                    break
+                depth += 1
+
+        self._searches += 1
+        self._search_time_total += time.perf_counter() - start
+        return sorted(top, reverse=True)
+
+    def search(self, query: str, k: int = 5) -> List[Dict]:
+        """返回相关度最高的 k 张卡片"""
+        cards = self._cards
+        return [cards[card_id] for _, card_id in self.rank(query, k) if card_id in cards]
+
+    async def ensure_current(self):
+        """目录版本变化时在线程池中同步索引"""
+        snapshot = await card_catalog.get_snapshot()
+        if snapshot.version == self._version:
+            return
+
+        if self._sync_lock is None:
+            self._sync_lock = asyncio.Lock()
+        if self._sync_lock.locked() and self._version is not None:
+            # 其他请求正在同步，先使用旧索引
+            return
+
+        async with self._sync_lock:
+            if snapshot.version != self._version:
+                loop = asyncio.get_running_loop()
+                await loop.run_in_executor(None, self.sync, snapshot)
+
+    async def top_k(self, query: str, k: int = 5) -> List[Dict]:
+        """同步到最新目录后检索"""
+        await self.ensure_current()
+        return self.search(query, k)
+
+    @property
+    def version(self) -> Optional[int]:
+        return self._version
+
+    def stats(self) -> Dict:
+        """索引指标"""
+        data = self._data
+        return {
+            "catalog_version": self._version,
+            "documents": len(data.doc_key),
+            "terms": len(data.postings),
+            "builds": self._builds,
+            "incremental_updates": self._incremental_updates,
+            "searches": self._searches,
+            "avg_search_us": round(self._search_time_total / self._searches * 1e6, 1) if self._searches else 0.0,
+        }
+
+
+card_search_index = CardSearchIndex()
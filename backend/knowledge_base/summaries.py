@@ -0,0 +1,141 @@
+"""
+卡片摘要
+导入时为每张卡片生成一句话概要和按字段分组的要点，与卡片一起存入 credit_cards，
+聊天和智能体的提示词直接使用这些精简内容，不再每次从原始字段截取。
+摘要记录生成时卡片内容的哈希，内容变化或摘要格式升级后哈希不再匹配，旧摘要不会被使用
+"""
+
+import hashlib
+import json
+from typing import Dict, List, NamedTuple, Optional
+
+from knowledge_base.card_text import (
+    CLAUSE_SEPARATOR_PATTERN, FIELDS, SENTENCE_PATTERN, estimate_tokens, field_items, truncate_tokens,
+)
+
+# 摘要格式版本，修改生成规则时加一，已有摘要全部视为过期
+SUMMARY_FORMAT_VERSION = 2
+
+# 参与内容哈希的字段
+SUMMARY_SOURCE_FIELDS = (
+    "bank", "name", "level", "annual_fee", "credit_limit", "benefits", "requirements", "points_rule",
+)
+JSON_SOURCE_FIELDS = ("benefits", "requirements")
+
+# 每个字段保留的要点数
+FACT_LIMITS = {
+    "annual_fee": 2,
+    "credit_limit": 1,
+    "benefits": 4,
+    "requirements": 2,
+    "points_rule": 2,
+}
+MAX_FACT_TOKENS = 30
+MAX_SUMMARY_TOKENS = 60
+
+# 年费要点优先保留金额和减免条件
+FEE_KEYWORDS = ("免", "首年", "元")
+# 要点末尾去掉的标点，拼接时统一使用"；"
+TRAILING_PUNCTUATION = "。；;！!，,、 "
+
+
+class CardSummary(NamedTuple):
+    summary: str
+    key_facts: Dict[str, List[str]]
+    content_hash: str
+
+
+def content_hash(card: Dict) -> str:
+    """卡片内容的哈希，card 为 catalog.parse_card_row 解析后的字典
+
+    JSON 字段按键排序序列化，其他字段统一转成字符串，不受数据库回读时键顺序和类型变化的影响
+    """
+    payload = [SUMMARY_FORMAT_VERSION]
+    for field in SUMMARY_SOURCE_FIELDS:
+        value = card.get(field)
+        if field not in JSON_SOURCE_FIELDS and value is not None:
+            value = str(value)
+        payload.append(value)
+    encoded = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(encoded.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _fact_items(field: str, value) -> List[str]:
+    """要点候选：文本字段按整句拆分（不像提示词片段那样再按逗号切开，要点总是从句首开始）"""
+    if field == "benefits" or not isinstance(value, str):
+        return field_items(field, value)
+    sentences = [sentence.strip() for sentence in SENTENCE_PATTERN.findall(value.strip())]
+    return list(dict.fromkeys(sentence for sentence in sentences if sentence))
+
+
+def _clip_fact(text: str, max_tokens: int) -> str:
+    """去掉末尾标点；过长时保留能放下的前几个分句，一个分句都放不下时再按字截断"""
+    text = text.strip().rstrip(TRAILING_PUNCTUATION)
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    kept = ""
+    for clause in CLAUSE_SEPARATOR_PATTERN.split(text):
+        candidate = f"{kept}，{clause}" if kept else clause
+        if estimate_tokens(candidate) + 1 > max_tokens:
+            break
+        kept = candidate
+    if kept:
+        return kept.rstrip(TRAILING_PUNCTUATION) + "…"
+    return truncate_tokens(text, max_tokens)
+
+
+def _pick_facts(field: str, value) -> List[str]:
+    items = _fact_items(field, value)
+    if field == "annual_fee":
+        # 稳定排序，含金额或减免条件的句子排在前面，其余保持原有顺序
+        items = sorted(items, key=lambda item: not any(keyword in item for keyword in FEE_KEYWORDS))
+    facts = (_clip_fact(item, MAX_FACT_TOKENS) for item in items)
+    return [fact for fact in facts if fact][:FACT_LIMITS[field]]
+
+
+def summarize_card(card: Dict) -> CardSummary:
+    """生成卡片的概要和要点（抽取式，结果只取决于卡片内容）"""
+    key_facts: Dict[str, List[str]] = {}
+    for field, _, _ in FIELDS:
+        facts = _pick_facts(field, card.get(field))
+        if facts:
+            key_facts[field] = facts
+
+    parts = [str(card.get("level") or "").strip()]
+    if key_facts.get("annual_fee"):
+        parts.append(key_facts["annual_fee"][0])
+    if key_facts.get("benefits"):
+        parts.append("权益：" + "、".join(key_facts["benefits"][:2]))
+    # 空的部分不参与拼接，不会出现连续的分隔符
+    summary = truncate_tokens("；".join(part for part in parts if part), MAX_SUMMARY_TOKENS)
+    return CardSummary(summary, key_facts, content_hash(card))
+
+
+def load_summary(row: Dict, card: Dict) -> Optional[CardSummary]:
+    """从数据库行读取摘要，没有摘要或摘要与卡片当前内容不一致时返回None"""
+    stored_hash = row.get("summary_hash")
+    if not stored_hash or not row.get("summary"):
+        return None
+    if stored_hash != content_hash(card):
+        return None
+    key_facts = row.get("key_facts")
+    if isinstance(key_facts, (str, bytes)):
+        try:
+            key_facts = json.loads(key_facts)
+        except ValueError:
+            return None
+    if not isinstance(key_facts, dict):
+        return None
+    return CardSummary(row["summary"], key_facts, stored_hash)
+
+
+def card_brief(card: Dict, summary: Optional[CardSummary] = None) -> str:
+    """单张卡片的精简描述，没有摘要时从原始字段截取同样数量的要点"""
+    if summary is None:
+        summary = summarize_card(card)
+    lines = [f"【{card.get('bank') or ''} - {card.get('name') or ''}】", f"概要：{summary.summary}"]
+    for field, label, _ in FIELDS:
+        facts = summary.key_facts.get(field)
+        if facts:
+            lines.append(f"{label}：{'；'.join(facts)}")
+    return "\n".join(lines)
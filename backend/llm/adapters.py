@@ -3,36 +3,82 @@ LLM适配器
 提供大语言模型接口
 """
 
-from typing import List, Dict
+import os
+from functools import partial
+from typing import List, Dict, Optional
 import httpx
-# from ..config import DEEPSEEK_API_KEY
+from llm_service.embedding_batcher import EmbeddingBatcher, embedding_batcher_for, new_embedding_batcher
+from llm_service.http_client import llm_http_client
+from llm_service.limiter import llm_limiter
+from llm_service.single_flight import llm_flights, payload_key
+
+async def request_embeddings(client: Optional[httpx.AsyncClient], base_url: str, headers: Dict[str, str],
+                             texts: List[str]) -> List[List[float]]:
+    """批量获取向量，client 为 None 时在调用时使用进程共享的客户端"""
+    if client is None:
+        client = llm_http_client.client
+    async with llm_limiter.slot():
+        response = await client.post(
+            f"{base_url}/embeddings",
+            headers=headers,
+            json={"input": texts}
+        )
+        response.raise_for_status()
+    # 按 index 排序，保证与输入顺序一致
+    data = sorted(response.json()["data"], key=lambda item: item.get("index", 0))
+    return [item["embedding"] for item in data]
 
 class DeepSeekAdapter:
-    """DeepSeek API适配器"""
+    """DeepSeek API适配器
+
+    请求通过进程共享的 HTTP 客户端发送，复用长连接
+    """
     
-    def __init__(self):
+    def __init__(self, client: Optional[httpx.AsyncClient] = None):
         self.api_key = os.getenv("DEEPSEEK_API_KEY")
         self.base_url = "https://api.deepseek.com/v1"
         self.headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
+        self._client = client
+        self._embedding_batcher: Optional[EmbeddingBatcher] = None
     
-    async def get_embedding(self, text: str) -> List[float]:
-        """获取文本的向量表示"""
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{self.base_url}/embeddings",
-                headers=self.headers,
-                json={"input": text}
+    @property
+    def client(self) -> httpx.AsyncClient:
+        return self._client if self._client is not None else llm_http_client.client
+    
+    @property
+    def embedding_batcher(self) -> EmbeddingBatcher:
+        """向量请求合并器：使用共享客户端时同一服务共用一个，检索器每次新建适配器也能合并；
+        注入了客户端时每个适配器单独一个"""
+        if self._client is None:
+            return embedding_batcher_for(
+                (self.base_url, None, self.api_key),
+                partial(request_embeddings, None, self.base_url, dict(self.headers))
             )
-            response.raise_for_status()
-            return response.json()["data"][0]["embedding"]
+        if self._embedding_batcher is None:
+            self._embedding_batcher = new_embedding_batcher(
+                partial(request_embeddings, self._client, self.base_url, self.headers)
+            )
+        return self._embedding_batcher
+    
+    async def get_embedding(self, text: str) -> List[float]:
+        """获取文本的向量表示，并发请求合并为一次批量调用"""
+        return await self.embedding_batcher.embed(text)
+    
+    async def get_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """批量获取向量表示（建索引时使用），按单批上限分批并发发送"""
+        return await self.embedding_batcher.embed_many(texts)
     
     async def chat(self, messages: List[Dict[str, str]]) -> str:
-        """发送聊天消息"""
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
+        """发送聊天消息，相同消息的并发请求共用一次 API 调用"""
+        key = payload_key(self.base_url, "deepseek-chat", messages)
+        return await llm_flights.do(key, lambda: self._chat(messages))
+    
+    async def _chat(self, messages: List[Dict[str, str]]) -> str:
+        async with llm_limiter.slot():
+            response = await self.client.post(
                 f"{self.base_url}/chat/completions",
                 headers=self.headers,
                 json={
@@ -41,4 +87,4 @@ class DeepSeekAdapter:
                 }
             )
             response.raise_for_status()
-            return response.json()["choices"][0]["message"]["content"] 
\ No newline at end of file
+        return response.json()["choices"][0]["message"]["content"] 
\ No newline at end of file
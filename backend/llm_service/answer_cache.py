@@ -0,0 +1,182 @@
+"""
+聊天回答缓存
+相同的问题在检索到相同知识库内容时直接返回缓存的回答，不再调用模型。
+键由规范化后的问题文本和知识库文本的哈希组成；同一知识库内容下，
+问题的字符二元组向量余弦相似度超过阈值时视为同一问题的不同问法
+"""
+
+import hashlib
+import math
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter
+from typing import Dict, NamedTuple, Optional
+
+from config import settings
+from knowledge_base.search_index import tokenize
+from utils.cache import TTLCache
+from utils.logger import setup_logger
+
+# 设置日志记录器
+logger = setup_logger('answer_cache')
+
+# 空白、标点和结构助词"的"，\w 包含汉字
+SEPARATOR_PATTERN = re.compile(r"[\W_的]+")
+# 不影响问题含义的开头客套话和句末语气词
+FILLER_PREFIXES = ("请问一下", "请问", "我想问一下", "我想问", "想问一下", "我想知道", "你好", "您好")
+FILLER_SUFFIXES = ("吗", "呢", "呀", "啊", "吧", "么")
+
+# 同一知识库内容下最多保留的问题数，语义匹配时逐个比较
+MAX_QUESTIONS_PER_KNOWLEDGE = 32
+
+
+def normalize_question(text: str) -> str:
+    """规范化问题：全角转半角、转小写、去掉空白标点、"的"和客套话"""
+    text = SEPARATOR_PATTERN.sub("", unicodedata.normalize("NFKC", text).lower())
+    stripped = True
+    while stripped:
+        stripped = False
+        for prefix in FILLER_PREFIXES:
+            if text.startswith(prefix) and len(text) > len(prefix):
+                text = text[len(prefix):]
+                stripped = True
+        for suffix in FILLER_SUFFIXES:
+            if text.endswith(suffix) and len(text) > len(suffix):
+                text = text[:-len(suffix)]
+                stripped = True
+    return text
+
+
+def knowledge_digest(knowledge: str) -> str:
+    return hashlib.blake2b(knowledge.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class AnswerKey(NamedTuple):
+    knowledge: str
+    question: str
+
+
+class _Entry(NamedTuple):
+    answer: str
+    vector: Counter
+    norm: float
+    stored_at: float
+
+
+def _vector(question: str):
+    vector = Counter(tokenize(question))
+    return vector, math.sqrt(sum(count * count for count in vector.values()))
+
+
+class AnswerCache:
+    """聊天回答缓存
+
+    - 外层是按知识库哈希索引的 TTLCache（LRU 淘汰），每项保存该知识库内容下的若干问题和回答
+    - 每个回答单独按 ttl 过期
+    - 目录版本变化时整体清空
+    - similarity 为 0 时只做精确匹配
+    """
+
+    def __init__(self, maxsize: int = 2000, ttl: float = 3600.0, similarity: float = 0.9):
+        self.ttl = ttl
+        self.similarity = similarity
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._version: Optional[int] = None
+        self._lock = threading.Lock()
+
+        self._exact_hits = 0
+        self._semantic_hits = 0
+        self._misses = 0
+        self._stores = 0
+        self._invalidations = 0
+
+    @staticmethod
+    def key(question: str, knowledge: str) -> AnswerKey:
+        return AnswerKey(knowledge_digest(knowledge), normalize_question(question))
+
+    def sync_version(self, version: Optional[int]):
+        """目录版本变化时清空缓存"""
+        if version == self._version:
+            return
+        with self._lock:
+            if version != self._version:
+                if self._version is not None:
+                    self._cache.clear()
+                    self._invalidations += 1
+                    logger.info(f"信用卡目录已更新到版本 {version}，清空回答缓存")
+                self._version = version
+
+    def get(self, key: AnswerKey) -> Optional[str]:
+        """返回缓存的回答，未命中时返回None"""
+        now = time.monotonic()
+        bucket: Optional[Dict[str, _Entry]] = self._cache.get(key.knowledge)
+        if bucket:
+            entry = bucket.get(key.question)
+            if entry is not None and now - entry.stored_at < self.ttl:
+                self._exact_hits += 1
+                return entry.answer
+
+            if self.similarity > 0:
+                vector, norm = _vector(key.question)
+                best, best_score = None, self.similarity
+                for question, entry in bucket.items():
+                    if not norm or not entry.norm or now - entry.stored_at >= self.ttl:
+                        continue
+                    dot = sum(count * entry.vector.get(token, 0) for token, count in vector.items())
+                    score = dot / (norm * entry.norm)
+                    if score >= best_score:
+                        best, best_score = entry, score
+                if best is not None:
+                    self._semantic_hits += 1
+                    return best.answer
+
+        self._misses += 1
+        return None
+
+    def set(self, key: AnswerKey, answer: str):
+        """保存完整的回答"""
+        if not key.question or not answer:
+            return
+        vector, norm = _vector(key.question)
+        with self._lock:
+            # 复制后替换，读取方拿到的字典不会被修改
+            bucket = dict(self._cache.get(key.knowledge) or {})
+            bucket.pop(key.question, None)
+            bucket[key.question] = _Entry(answer, vector, norm, time.monotonic())
+            while len(bucket) > MAX_QUESTIONS_PER_KNOWLEDGE:
+                bucket.pop(next(iter(bucket)))
+            self._cache.set(key.knowledge, bucket)
+            self._stores += 1
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self) -> Dict:
+        """缓存指标"""
+        hits = self._exact_hits + self._semantic_hits
+        lookups = hits + self._misses
+        cache_stats = self._cache.stats()
+        return {
+            "catalog_version": self._version,
+            "knowledge_blocks": cache_stats["size"],
+            "maxsize": cache_stats["maxsize"],
+            "ttl": self.ttl,
+            "similarity": self.similarity,
+            "lookups": lookups,
+            "exact_hits": self._exact_hits,
+            "semantic_hits": self._semantic_hits,
+            "misses": self._misses,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "stores": self._stores,
+            "evictions": cache_stats["evictions"],
+            "invalidations": self._invalidations,
+        }
+
+
+answer_cache = AnswerCache(
+    maxsize=settings.ANSWER_CACHE_SIZE,
+    ttl=settings.ANSWER_CACHE_TTL,
+    similarity=settings.ANSWER_CACHE_SIMILARITY
+)
@@ -3,68 +3,107 @@ DeepSeek API适配器
 实现与DeepSeek API的交互功能
 """
 
-from typing import List, Dict, Optional
+from functools import partial
+from typing import AsyncIterator, List, Dict, Optional
+import json
 import httpx
 import logging
 from config import settings
+from llm_service.embedding_batcher import EmbeddingBatcher, embedding_batcher_for, new_embedding_batcher
+from llm_service.http_client import llm_http_client
+from llm_service.limiter import llm_limiter
+from llm_service.single_flight import llm_flights, payload_key
 
 # 设置日志记录器
 logger = logging.getLogger(__name__)
 
+EMBEDDING_MODEL = "text-embedding-ada-002"
+
+
+async def request_embeddings(client: Optional[httpx.AsyncClient], texts: List[str]) -> List[List[float]]:
+    """批量获取向量，client 为 None 时在调用时使用进程共享的客户端"""
+    if client is None:
+        client = llm_http_client.client
+    try:
+        logger.info(f"获取文本向量表示，文本数量: {len(texts)}")
+        async with llm_limiter.slot():
+            response = await client.post(
+                "/embeddings",
+                json={
+                    "input": texts,
+                    "model": EMBEDDING_MODEL
+                }
+            )
+            response.raise_for_status()
+        # 按 index 排序，保证与输入顺序一致
+        data = sorted(response.json()["data"], key=lambda item: item.get("index", 0))
+        return [item["embedding"] for item in data]
+    except httpx.HTTPError as e:
+        logger.error(f"获取向量表示失败: {str(e)}")
+        raise
+    except Exception as e:
+        logger.error(f"获取向量表示时发生错误: {str(e)}")
+        raise
+
 class DeepSeekAdapter:
-    """DeepSeek API适配器类"""
+    """DeepSeek API适配器类
+
+    默认使用进程共享的 HTTP 客户端，适配器本身不持有连接，可以随用随建
+    """
     
-    def __init__(self):
+    def __init__(self, client: Optional[httpx.AsyncClient] = None):
         self.api_key = settings.DEEPSEEK_API_KEY
         if not self.api_key:
             raise ValueError("DeepSeek API密钥未设置")
             
         self.api_base = settings.DEEPSEEK_API_BASE
-        self.client = httpx.AsyncClient(
-            base_url=self.api_base,
-            headers={
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            },
-            timeout=30.0
-        )
+        self._client = client
+        self._embedding_batcher: Optional[EmbeddingBatcher] = None
         logger.info("DeepSeek适配器初始化完成")
     
-    async def get_embeddings(self, texts: List[str]) -> List[List[float]]:
-        """获取文本的向量表示"""
-        try:
-            logger.info(f"获取文本向量表示，文本数量: {len(texts)}")
-            response = await self.client.post(
-                "/embeddings",
-                json={
-                    "input": texts,
-                    "model": "text-embedding-ada-002"
-                }
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """注入的客户端，未注入时使用进程共享的客户端"""
+        return self._client if self._client is not None else llm_http_client.client
+    
+    @property
+    def embedding_batcher(self) -> EmbeddingBatcher:
+        """向量请求合并器：使用共享客户端时同一服务共用一个，注入了客户端时每个适配器单独一个"""
+        if self._client is None:
+            return embedding_batcher_for(
+                (self.api_base, EMBEDDING_MODEL, self.api_key), partial(request_embeddings, None)
             )
-            response.raise_for_status()
-            data = response.json()
-            return [item["embedding"] for item in data["data"]]
-        except httpx.HTTPError as e:
-            logger.error(f"获取向量表示失败: {str(e)}")
-            raise
-        except Exception as e:
-            logger.error(f"获取向量表示时发生错误: {str(e)}")
-            raise
+        if self._embedding_batcher is None:
+            self._embedding_batcher = new_embedding_batcher(partial(request_embeddings, self._client))
+        return self._embedding_batcher
+    
+    async def get_embedding(self, text: str) -> List[float]:
+        """获取单条文本的向量表示，并发请求合并为一次批量调用"""
+        return await self.embedding_batcher.embed(text)
+    
+    async def get_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """获取文本的向量表示，按单批上限（EMBEDDING_BATCH_SIZE）分批发送"""
+        return await self.embedding_batcher.embed_many(texts)
     
     async def chat_completion(self, messages: List[Dict[str, str]], 
                             temperature: float = 0.7) -> str:
-        """生成对话回复"""
+        """生成对话回复，消息和温度都相同的并发请求共用一次 API 调用"""
+        key = payload_key(self.api_base, "deepseek-chat", messages, temperature)
+        return await llm_flights.do(key, lambda: self._chat_completion(messages, temperature))
+    
+    async def _chat_completion(self, messages: List[Dict[str, str]], temperature: float) -> str:
         try:
             logger.info("开始生成对话回复")
-            response = await self.client.post(
-                "/chat/completions",
-                json={
-                    "model": "deepseek-chat",
-                    "messages": messages,
-                    "temperature": temperature
-                }
-            )
-            response.raise_for_status()
+            async with llm_limiter.slot():
+                response = await self.client.post(
+                    "/chat/completions",
+                    json={
+                        "model": "deepseek-chat",
+                        "messages": messages,
+                        "temperature": temperature
+                    }
+                )
+                response.raise_for_status()
             data = response.json()
             logger.info("成功生成对话回复")
             return data["choices"][0]["message"]["content"]
@@ -75,6 +114,44 @@ class DeepSeekAdapter:
             logger.error(f"生成对话回复时发生错误: {str(e)}")
             raise
     
+    async def chat_completion_stream(self, messages: List[Dict[str, str]],
+                                     temperature: float = 0.7) -> AsyncIterator[str]:
+        """以流式模式生成对话回复，逐段返回增量文本"""
+        logger.info("开始流式生成对话回复")
+        # 名额在整个流式输出期间占用，延迟按响应头到达计算
+        async with llm_limiter.slot() as slot:
+            async with self.client.stream(
+                "POST",
+                "/chat/completions",
+                json={
+                    "model": "deepseek-chat",
+                    "messages": messages,
+                    "temperature": temperature,
+                    "stream": True
+                }
+            ) as response:
+                if response.is_error:
+                    await response.aread()
+                    logger.error(f"流式生成对话回复失败: {response.status_code} {response.text}")
+                    response.raise_for_status()
+                slot.mark()
+                
+                # 服务端事件格式：每行 "data: {...}"，以 "data: [DONE]" 结束
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    chunk = json.loads(data)
+                    choices = chunk.get("choices") or []
+                    if not choices:
+                        continue
+                    content = (choices[0].get("delta") or {}).get("content")
+                    if content:
+                        yield content
+        logger.info("流式对话回复完成")
+    
     async def generate_card_recommendation(self, user_profile: Dict) -> Dict:
         """生成信用卡推荐"""
         try:
@@ -107,5 +184,15 @@ class DeepSeekAdapter:
         }
     
     async def close(self):
-        """关闭HTTP客户端"""
-        await self.client.aclose() 
\ No newline at end of file
+        """共享客户端由应用关闭时统一关闭，这里不关闭连接"""
+
+
+_default_adapter: Optional[DeepSeekAdapter] = None
+
+
+def get_deepseek_adapter() -> DeepSeekAdapter:
+    """进程共享的适配器，可作为 FastAPI 依赖注入"""
+    global _default_adapter
+    if _default_adapter is None:
+        _default_adapter = DeepSeekAdapter()
+    return _default_adapter
@@ -0,0 +1,164 @@
+"""
+向量请求微批处理
+并发的单条向量请求先排队几毫秒，合并成一次批量 API 调用（不超过服务商的单批上限），
+结果按位置分发给各个调用方；批量建索引时同样按上限分批并发发送
+"""
+
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+from config import settings
+from utils.logger import setup_logger
+from utils.metrics import Histogram
+
+# 设置日志记录器
+logger = setup_logger('embedding_batcher')
+
+# 批量向量函数：文本列表 -> 按相同顺序的向量列表
+EmbedFn = Callable[[List[str]], Awaitable[List[List[float]]]]
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048)
+
+
+class EmbeddingBatcher:
+    """向量请求合并器
+
+    - 第一个请求入队后等待 max_delay 秒，期间到达的请求合并为一批；排队数达到 max_batch 时立即发送
+    - 同一批中相同的文本只发送一次
+    - 多个批次可以同时在途，总并发由 embed_fn 内部的调用限流控制
+    - 批量调用失败时该批所有调用方收到同一个异常；调用方取消不影响同批的其他请求
+    """
+
+    def __init__(self, embed_fn: EmbedFn, max_batch: int = 128, max_delay: float = 0.005):
+        self.embed_fn = embed_fn
+        self.max_batch = max(1, max_batch)
+        self.max_delay = max_delay
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks = set()
+
+        self._requests = 0
+        self._batches = 0
+        self._texts_sent = 0
+        self._deduplicated = 0
+        self._size_flushes = 0
+        self._timer_flushes = 0
+        self._errors = 0
+        self._in_flight = 0
+        self._batch_sizes = Histogram(buckets=BATCH_SIZE_BUCKETS, unit="texts")
+
+    def _enqueue(self, text: str) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+        self._requests += 1
+        if len(self._pending) >= self.max_batch:
+            self._size_flushes += 1
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_delay, self._on_timer)
+        return future
+
+    def _on_timer(self):
+        self._timer = None
+        if self._pending:
+            self._timer_flushes += 1
+            self._flush()
+
+    def _flush(self):
+        """按 max_batch 切分排队的请求并发送"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._pending:
+            batch = self._pending[:self.max_batch]
+            del self._pending[:self.max_batch]
+            task = asyncio.get_running_loop().create_task(self._send(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch: List[Tuple[str, asyncio.Future]]):
+        waiting = [(text, future) for text, future in batch if not future.done()]
+        if not waiting:
+            return
+        texts = list(dict.fromkeys(text for text, _ in waiting))
+        self._deduplicated += len(waiting) - len(texts)
+        self._batches += 1
+        self._texts_sent += len(texts)
+        self._batch_sizes.observe(len(texts))
+        self._in_flight += 1
+        try:
+            vectors = await self.embed_fn(texts)
+            if len(vectors) != len(texts):
+                raise ValueError(f"向量数量 {len(vectors)} 与文本数量 {len(texts)} 不一致")
+        except Exception as e:
+            self._errors += 1
+            logger.error(f"批量获取向量失败（{len(texts)} 条）: {str(e)}")
+            for _, future in waiting:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self._in_flight -= 1
+
+        by_text: Dict[str, List[float]] = dict(zip(texts, vectors))
+        for text, future in waiting:
+            if not future.done():
+                future.set_result(by_text[text])
+
+    async def embed(self, text: str) -> List[float]:
+        """获取单条文本的向量，与同时到达的其他请求合并发送"""
+        return await self._enqueue(text)
+
+    async def embed_many(self, texts: List[str]) -> List[List[float]]:
+        """获取多条文本的向量，按 max_batch 分批并发发送，结果与输入顺序一致"""
+        futures = [self._enqueue(text) for text in texts]
+        return list(await asyncio.gather(*futures))
+
+    def stats(self) -> Dict:
+        """合并指标"""
+        return {
+            "max_batch": self.max_batch,
+            "max_delay_ms": round(self.max_delay * 1000, 2),
+            "requests": self._requests,
+            "batches": self._batches,
+            "texts_sent": self._texts_sent,
+            "deduplicated": self._deduplicated,
+            "avg_batch_size": round(self._texts_sent / self._batches, 2) if self._batches else 0.0,
+            "size_flushes": self._size_flushes,
+            "timer_flushes": self._timer_flushes,
+            "pending": len(self._pending),
+            "in_flight": self._in_flight,
+            "errors": self._errors,
+            "batch_size": self._batch_sizes.stats(),
+        }
+
+
+def new_embedding_batcher(embed_fn: EmbedFn) -> EmbeddingBatcher:
+    """按配置（EMBEDDING_BATCH_SIZE、EMBEDDING_BATCH_DELAY）创建合并器"""
+    return EmbeddingBatcher(
+        embed_fn,
+        max_batch=settings.EMBEDDING_BATCH_SIZE,
+        max_delay=settings.EMBEDDING_BATCH_DELAY
+    )
+
+
+# 按服务地址、模型和密钥共享的合并器，同一服务的不同适配器实例共用一个队列
+_batchers: Dict[Hashable, EmbeddingBatcher] = {}
+
+
+def embedding_batcher_for(key: Hashable, embed_fn: EmbedFn) -> EmbeddingBatcher:
+    """返回 key（服务地址, 模型, 密钥）对应的合并器，首次使用时用 embed_fn 创建
+
+    合并器会一直保留 embed_fn，embed_fn 只能依赖 key 中的内容，不能绑定某个适配器实例
+    （否则会一直使用第一个适配器的客户端）
+    """
+    batcher = _batchers.get(key)
+    if batcher is None:
+        batcher = _batchers[key] = new_embedding_batcher(embed_fn)
+    return batcher
+
+
+def embedding_stats() -> Dict:
+    """所有合并器的指标，键为服务地址和模型，不含密钥"""
+    return {f"{key[0]} {key[1] or 'default'}": batcher.stats() for key, batcher in _batchers.items()}
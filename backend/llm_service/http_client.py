@@ -0,0 +1,128 @@
+"""
+大模型 HTTP 客户端
+整个进程共用一个 httpx.AsyncClient，连接保持长连接并在请求间复用，
+安装了 h2 时使用 HTTP/2 在同一连接上并发多个请求，避免每轮对话重新做 DNS、TCP 和 TLS 握手
+"""
+
+import importlib.util
+import time
+from collections import Counter
+from typing import Dict, Optional
+
+import httpx
+
+from config import settings
+from utils.logger import setup_logger
+
+# 设置日志记录器
+logger = setup_logger('llm_http_client')
+
+
+class LLMHttpClient:
+    """进程共享的大模型 HTTP 客户端
+
+    - start() 在应用启动时创建客户端，close() 在应用关闭时关闭；脚本中未调用 start() 时首次使用再创建
+    - 通过 httpcore 的 trace 扩展统计新建连接数，与请求数对比得到连接复用率
+    """
+
+    def __init__(self, base_url: str, api_key: Optional[str], max_connections: int = 100,
+                 max_keepalive_connections: int = 20, keepalive_expiry: float = 60.0,
+                 timeout: float = 30.0, connect_timeout: float = 5.0, http2: bool = True):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.http2 = http2 and importlib.util.find_spec("h2") is not None
+        if http2 and not self.http2:
+            logger.warning("未安装 h2，大模型客户端使用 HTTP/1.1 长连接")
+
+        self._client: Optional[httpx.AsyncClient] = None
+        self._created_at: Optional[float] = None
+
+        self._requests = 0
+        self._responses = 0
+        self._connections = 0
+        self._tls_handshakes = 0
+        self._connect_failures = 0
+        self._http_versions: Counter = Counter()
+
+    def start(self) -> httpx.AsyncClient:
+        """创建客户端，已创建时直接返回"""
+        if self._client is None or self._client.is_closed:
+            headers = {"Content-Type": "application/json"}
+            if self.api_key:
+                headers["Authorization"] = f"Bearer {self.api_key}"
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers=headers,
+                limits=self.limits,
+                timeout=self.timeout,
+                http2=self.http2,
+                event_hooks={"request": [self._on_request], "response": [self._on_response]}
+            )
+            self._created_at = time.time()
+            logger.info(
+                f"大模型客户端已创建: {self.base_url}, HTTP/2: {self.http2}, "
+                f"最大连接数: {self.limits.max_connections}"
+            )
+        return self._client
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        return self.start()
+
+    async def close(self):
+        """关闭客户端及其连接池"""
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+            logger.info("大模型客户端已关闭")
+        self._client = None
+
+    async def _on_request(self, request: httpx.Request):
+        self._requests += 1
+        request.extensions["trace"] = self._trace
+
+    async def _on_response(self, response: httpx.Response):
+        self._responses += 1
+        self._http_versions[response.http_version] += 1
+
+    async def _trace(self, event_name: str, info: Dict):
+        # 只有新建连接时才会出现 TCP 连接和 TLS 握手事件，复用的连接直接发送请求
+        if event_name == "connection.connect_tcp.complete":
+            self._connections += 1
+        elif event_name == "connection.start_tls.complete":
+            self._tls_handshakes += 1
+        elif event_name == "connection.connect_tcp.failed":
+            self._connect_failures += 1
+
+    def stats(self) -> Dict:
+        """连接复用指标"""
+        reused = max(self._requests - self._connections, 0)
+        return {
+            "open": self._client is not None and not self._client.is_closed,
+            "http2": self.http2,
+            "max_connections": self.limits.max_connections,
+            "max_keepalive_connections": self.limits.max_keepalive_connections,
+            "requests": self._requests,
+            "responses": self._responses,
+            "new_connections": self._connections,
+            "tls_handshakes": self._tls_handshakes,
+            "connect_failures": self._connect_failures,
+            "reuse_ratio": round(reused / self._requests, 3) if self._requests else 0.0,
+            "http_versions": dict(self._http_versions),
+        }
+
+
+llm_http_client = LLMHttpClient(
+    base_url=settings.DEEPSEEK_API_BASE,
+    api_key=settings.DEEPSEEK_API_KEY,
+    max_connections=settings.LLM_HTTP_MAX_CONNECTIONS,
+    max_keepalive_connections=settings.LLM_HTTP_MAX_KEEPALIVE,
+    keepalive_expiry=settings.LLM_HTTP_KEEPALIVE_EXPIRY,
+    timeout=settings.LLM_HTTP_TIMEOUT,
+    http2=settings.LLM_HTTP2
+)
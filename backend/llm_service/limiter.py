@@ -0,0 +1,242 @@
+"""
+大模型调用并发限制
+按观测到的延迟自适应调整并发上限（AIMD：延迟正常时加性增加，变慢或过载时乘性减少），
+超出上限的调用按用户轮流排队，队列有界且等待有截止时间，超出时快速拒绝而不是堆积挂起的协程
+"""
+
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Deque, Dict, Optional
+
+import httpx
+
+from config import settings
+from utils.logger import setup_logger
+from utils.metrics import Histogram
+
+# 设置日志记录器
+logger = setup_logger('llm_limiter')
+
+# 发起调用的用户，由接口层设置，用于公平排队；未设置的调用（脚本、智能体）共用一个队列
+llm_user: ContextVar[str] = ContextVar("llm_user", default="anonymous")
+# 调用方的截止时间（time.monotonic()），由接口层设置，排队等待不会超过该时间
+llm_deadline: ContextVar[Optional[float]] = ContextVar("llm_deadline", default=None)
+
+
+class LimiterRejected(Exception):
+    """大模型调用排队已满或等待超过截止时间，需要调用方稍后重试"""
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def is_overload_error(error: BaseException) -> bool:
+    """超时、限流和服务端错误说明上游已过载"""
+    if isinstance(error, (httpx.TimeoutException, httpx.ConnectError, asyncio.TimeoutError)):
+        return True
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code == 429 or error.response.status_code >= 500
+    return False
+
+
+class _Slot:
+    """一次已获准的调用，流式调用在收到首个数据时调用 mark() 记录延迟"""
+
+    __slots__ = ("started", "latency")
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.latency: Optional[float] = None
+
+    def mark(self):
+        if self.latency is None:
+            self.latency = time.monotonic() - self.started
+
+
+class AdaptiveLimiter:
+    """自适应并发限制器
+
+    - 延迟不超过 latency_target 时上限每轮增加约 1（每次成功增加 1/上限）
+    - 延迟超标或出现过载错误时上限乘以 backoff，冷却期内只减少一次，避免同一批慢请求连续砍半
+    - 排队按用户轮转：每次放行时取下一个用户队首的调用，单个用户的排队数另有上限
+    - 等待超过 max_wait 或调用方给出的截止时间时抛出 LimiterRejected
+    """
+
+    def __init__(self, initial_limit: int = 16, min_limit: int = 2, max_limit: int = 64,
+                 latency_target: float = 10.0, backoff: float = 0.7, max_queue: int = 200,
+                 max_queue_per_user: int = 8, max_wait: float = 5.0):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self.max_queue = max_queue
+        self.max_queue_per_user = max_queue_per_user
+        self.max_wait = max_wait
+
+        self._limit = float(initial_limit)
+        self._in_flight = 0
+        self._queues: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        self._queued = 0
+        self._last_decrease = 0.0
+
+        self._admitted = 0
+        self._completed = 0
+        self._rejected_full = 0
+        self._rejected_user = 0
+        self._rejected_deadline = 0
+        self._increases = 0
+        self._decreases = 0
+        self._overload_errors = 0
+        self._latency_ewma = 0.0
+        self._wait_histogram = Histogram()
+
+    @property
+    def limit(self) -> int:
+        return max(self.min_limit, int(self._limit))
+
+    def _dispatch(self):
+        """有空闲名额时按用户轮转放行排队的调用"""
+        while self._queues and self._in_flight < self.limit:
+            user, queue = next(iter(self._queues.items()))
+            waiter = queue.popleft()
+            self._queued -= 1
+            if queue:
+                self._queues.move_to_end(user)
+            else:
+                del self._queues[user]
+            if waiter.done():
+                continue
+            self._in_flight += 1
+            waiter.set_result(None)
+
+    def _discard(self, user: str, waiter: asyncio.Future) -> bool:
+        """从队列中移除未被放行的等待者，已被放行时返回False"""
+        queue = self._queues.get(user)
+        if queue is None or waiter not in queue:
+            return False
+        queue.remove(waiter)
+        self._queued -= 1
+        if not queue:
+            del self._queues[user]
+        return True
+
+    async def acquire(self, user: Optional[str] = None, deadline: Optional[float] = None):
+        """获取一个调用名额，deadline 为 time.monotonic() 时间"""
+        user = user or llm_user.get()
+        if deadline is None:
+            deadline = llm_deadline.get()
+        if self._in_flight < self.limit and not self._queued:
+            self._in_flight += 1
+            self._admitted += 1
+            self._wait_histogram.observe(0.0)
+            return
+
+        now = time.monotonic()
+        timeout = self.max_wait if deadline is None else min(self.max_wait, deadline - now)
+        if timeout <= 0:
+            self._rejected_deadline += 1
+            raise LimiterRejected("等待模型调用名额将超过截止时间")
+        if self._queued >= self.max_queue:
+            self._rejected_full += 1
+            raise LimiterRejected("模型调用排队已满")
+        queue = self._queues.get(user)
+        if queue is not None and len(queue) >= self.max_queue_per_user:
+            self._rejected_user += 1
+            raise LimiterRejected("当前用户的模型调用排队过多")
+
+        waiter = asyncio.get_running_loop().create_future()
+        if queue is None:
+            queue = self._queues[user] = deque()
+        queue.append(waiter)
+        self._queued += 1
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError:
+            self._discard(user, waiter)
+            self._rejected_deadline += 1
+            raise LimiterRejected("等待模型调用名额超时")
+        except asyncio.CancelledError:
+            if not self._discard(user, waiter) and waiter.done() and not waiter.cancelled():
+                # 已放行但调用方被取消，归还名额
+                self._release()
+            raise
+        self._admitted += 1
+        self._wait_histogram.observe((time.monotonic() - now) * 1000)
+
+    def _release(self):
+        self._in_flight -= 1
+        self._dispatch()
+
+    def _on_success(self, latency: float):
+        self._latency_ewma = latency if not self._latency_ewma else 0.8 * self._latency_ewma + 0.2 * latency
+        if latency > self.latency_target:
+            self._decrease(f"延迟 {latency:.1f}s 超过目标 {self.latency_target}s")
+        elif self._limit < self.max_limit:
+            self._limit = min(self.max_limit, self._limit + 1 / self._limit)
+            self._increases += 1
+
+    def _decrease(self, reason: str):
+        now = time.monotonic()
+        if now - self._last_decrease < self.latency_target:
+            return
+        self._last_decrease = now
+        previous = self.limit
+        self._limit = max(self.min_limit, self._limit * self.backoff)
+        self._decreases += 1
+        logger.warning(f"模型调用并发上限 {previous} -> {self.limit}: {reason}")
+
+    @asynccontextmanager
+    async def slot(self, user: Optional[str] = None, deadline: Optional[float] = None) -> AsyncIterator[_Slot]:
+        """在名额内执行一次调用，正常结束时以 mark() 记录的延迟（未记录时为总耗时）调整上限"""
+        await self.acquire(user, deadline)
+        slot = _Slot()
+        try:
+            yield slot
+        except Exception as e:
+            if is_overload_error(e):
+                self._overload_errors += 1
+                self._decrease(f"上游过载: {type(e).__name__}")
+            raise
+        else:
+            slot.mark()
+            self._on_success(slot.latency)
+        finally:
+            self._completed += 1
+            self._release()
+
+    def stats(self) -> Dict:
+        """限流指标"""
+        return {
+            "limit": self.limit,
+            "min_limit": self.min_limit,
+            "max_limit": self.max_limit,
+            "in_flight": self._in_flight,
+            "queued": self._queued,
+            "queued_users": len(self._queues),
+            "max_queue": self.max_queue,
+            "admitted": self._admitted,
+            "completed": self._completed,
+            "rejected_full": self._rejected_full,
+            "rejected_user": self._rejected_user,
+            "rejected_deadline": self._rejected_deadline,
+            "increases": self._increases,
+            "decreases": self._decreases,
+            "overload_errors": self._overload_errors,
+            "latency_ewma_s": round(self._latency_ewma, 3),
+            "wait": self._wait_histogram.stats(),
+        }
+
+
+llm_limiter = AdaptiveLimiter(
+    initial_limit=settings.LLM_CONCURRENCY_INITIAL,
+    min_limit=settings.LLM_CONCURRENCY_MIN,
+    max_limit=settings.LLM_CONCURRENCY_MAX,
+    latency_target=settings.LLM_LATENCY_TARGET,
+    max_queue=settings.LLM_QUEUE_SIZE,
+    max_queue_per_user=settings.LLM_QUEUE_PER_USER,
+    max_wait=settings.LLM_QUEUE_TIMEOUT
+)
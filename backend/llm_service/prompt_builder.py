@@ -0,0 +1,182 @@
+"""
+提示词知识库组装
+把检索到的卡片拆成字段片段（年费、权益的每一项、申请条件等），按与问题的相关度排序，
+在 token 预算内选取最有用的片段，再按卡片和字段的固定顺序输出；token 数在本地估算
+"""
+
+from typing import Dict, Iterable, List, Mapping, NamedTuple, Optional, Set, Tuple
+
+from config import settings
+from knowledge_base.card_text import FIELD_LABELS, FIELD_ORDER, FIELDS, estimate_tokens, field_items, truncate_tokens
+from knowledge_base.search_index import tokenize
+from knowledge_base.summaries import CardSummary
+from utils.metrics import Histogram
+
+# 单个片段最多占用的 token 数，超出部分截断
+MAX_SNIPPET_TOKENS = 80
+
+# 问题中出现这些词时提高对应字段的权重
+FIELD_HINTS: Dict[str, Tuple[str, ...]] = {
+    "annual_fee": ("年费", "费用", "免费", "收费", "多少钱"),
+    "credit_limit": ("额度", "提额", "授信"),
+    "benefits": ("权益", "优惠", "好处", "贵宾", "返现", "里程", "福利", "特权"),
+    "requirements": ("申请", "条件", "门槛", "收入", "办理", "资格"),
+    "points_rule": ("积分", "兑换", "累积"),
+}
+
+SIZE_BUCKETS = (100, 200, 300, 400, 600, 800, 1000, 1500, 2000, 3000, 5000)
+
+
+class Snippet(NamedTuple):
+    card_index: int
+    field: str
+    position: int
+    text: str
+    tokens: int
+    score: float
+
+
+class BuiltKnowledge(NamedTuple):
+    text: str
+    tokens: int
+    snippets_used: int
+    snippets_total: int
+    cards_used: int
+
+
+def card_header(card: Dict, summary: Optional[CardSummary] = None) -> str:
+    header = f"【{card.get('bank') or ''} - {card.get('name') or ''}】\n"
+    if summary is not None:
+        # 概要已包含卡片等级
+        header += f"概要：{summary.summary}\n"
+    elif card.get("level"):
+        header += f"卡片等级：{card['level']}\n"
+    return header
+
+
+class PromptBuilder:
+    """在 token 预算内组装知识库文本
+
+    片段得分 = 字段权重 × 卡片排名权重 × (1 + 与问题共有的词数)，问题提到的字段权重翻倍。
+    先放入各卡片的标题行（卡名、银行、等级或概要），再按得分从高到低放入片段，放不下的跳过。
+    有导入时生成的摘要的卡片只从要点中选取片段，没有的从原始字段拆分
+    """
+
+    def __init__(self, budget: int = 600):
+        self.budget = budget
+        self.knowledge_tokens = Histogram(buckets=SIZE_BUCKETS, unit="tokens")
+        self.prompt_tokens = Histogram(buckets=SIZE_BUCKETS, unit="tokens")
+        self._builds = 0
+        self._snippets_total = 0
+        self._snippets_dropped = 0
+        self._cards_total = 0
+        self._cards_summarized = 0
+
+    @staticmethod
+    def _field_boosts(question: str) -> Set[str]:
+        return {field for field, hints in FIELD_HINTS.items() if any(hint in question for hint in hints)}
+
+    def snippets(self, question: str, cards: List[Dict],
+                 summaries: Optional[Mapping[int, CardSummary]] = None) -> List[Snippet]:
+        """拆分并打分"""
+        query_terms = set(tokenize(question))
+        boosted = self._field_boosts(question)
+        snippets = []
+        for card_index, card in enumerate(cards):
+            rank_weight = 1.0 / (1 + 0.5 * card_index)
+            summary = summaries.get(card.get("id")) if summaries else None
+            for field, _, weight in FIELDS:
+                if field in boosted:
+                    weight *= 2
+                if summary is not None:
+                    items = summary.key_facts.get(field) or []
+                else:
+                    items = field_items(field, card.get(field))
+                for position, item in enumerate(items):
+                    text = truncate_tokens(item, MAX_SNIPPET_TOKENS)
+                    overlap = len(query_terms.intersection(tokenize(text)))
+                    # 同一字段中靠前的片段略微优先
+                    score = weight * rank_weight * (1 + overlap) / (1 + 0.05 * position)
+                    snippets.append(Snippet(card_index, field, position, text, estimate_tokens(text) + 1, score))
+        return snippets
+
+    def build(self, question: str, cards: List[Dict], budget: Optional[int] = None,
+              summaries: Optional[Mapping[int, CardSummary]] = None) -> BuiltKnowledge:
+        """返回预算内的知识库文本，summaries 为卡片ID到导入时生成的摘要的映射"""
+        budget = self.budget if budget is None else budget
+        if not cards:
+            return BuiltKnowledge("", 0, 0, 0, 0)
+        summaries = summaries or {}
+
+        title = "信用卡知识库：\n\n"
+        used = estimate_tokens(title)
+        headers: Dict[int, str] = {}
+        for card_index, card in enumerate(cards):
+            header = card_header(card, summaries.get(card.get("id")))
+            cost = estimate_tokens(header)
+            if used + cost > budget:
+                break
+            headers[card_index] = header
+            used += cost
+
+        snippets = self.snippets(question, cards, summaries)
+        chosen: List[Snippet] = []
+        for snippet in sorted(snippets, key=lambda item: item.score, reverse=True):
+            if snippet.card_index not in headers:
+                continue
+            # 字段标签只在该字段的第一个片段前出现一次
+            label_cost = 0 if any(
+                item.card_index == snippet.card_index and item.field == snippet.field for item in chosen
+            ) else estimate_tokens(FIELD_LABELS[snippet.field]) + 1
+            if used + snippet.tokens + label_cost > budget:
+                continue
+            chosen.append(snippet)
+            used += snippet.tokens + label_cost
+
+        text = self._render(cards, headers, chosen)
+        tokens = estimate_tokens(text)
+        self._builds += 1
+        self._snippets_total += len(snippets)
+        self._snippets_dropped += len(snippets) - len(chosen)
+        self._cards_total += len(cards)
+        self._cards_summarized += sum(1 for card in cards if card.get("id") in summaries)
+        self.knowledge_tokens.observe(tokens)
+        return BuiltKnowledge(text, tokens, len(chosen), len(snippets), len(headers))
+
+    @staticmethod
+    def _render(cards: List[Dict], headers: Dict[int, str], chosen: Iterable[Snippet]) -> str:
+        by_card: Dict[int, Dict[str, List[Snippet]]] = {}
+        for snippet in chosen:
+            by_card.setdefault(snippet.card_index, {}).setdefault(snippet.field, []).append(snippet)
+
+        knowledge = "信用卡知识库：\n\n"
+        for card_index in sorted(headers):
+            knowledge += headers[card_index]
+            fields = by_card.get(card_index, {})
+            for field in sorted(fields, key=FIELD_ORDER.__getitem__):
+                items = sorted(fields[field], key=lambda item: item.position)
+                knowledge += f"{FIELD_LABELS[field]}：{'；'.join(item.text for item in items)}\n"
+            knowledge += "\n"
+        return knowledge
+
+    def observe_prompt(self, messages: List[Dict[str, str]]) -> int:
+        """记录发给模型的提示词大小"""
+        tokens = sum(estimate_tokens(message["content"]) for message in messages)
+        self.prompt_tokens.observe(tokens)
+        return tokens
+
+    def stats(self) -> Dict:
+        """提示词大小指标"""
+        return {
+            "budget": self.budget,
+            "builds": self._builds,
+            "snippets_total": self._snippets_total,
+            "snippets_dropped": self._snippets_dropped,
+            "cards_total": self._cards_total,
+            "cards_summarized": self._cards_summarized,
+            "knowledge_tokens": self.knowledge_tokens.stats(),
+            "prompt_tokens": self.prompt_tokens.stats(),
+        }
+
+
+prompt_builder = PromptBuilder(budget=settings.PROMPT_KNOWLEDGE_TOKENS)
@@ -0,0 +1,86 @@
+"""
+相同请求合并
+并发的相同请求只向上游发送一次，结果（或异常）分发给所有等待方
+"""
+
+import asyncio
+import hashlib
+import json
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+def payload_key(*parts) -> str:
+    """请求内容的哈希，字典按键排序，参数相同的请求得到相同的键"""
+    encoded = json.dumps(parts, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(encoded.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """同一事件循环中按键合并进行中的请求
+
+    上游请求在独立任务中执行，某个等待方被取消（客户端断开）不影响其他等待方；
+    所有等待方都取消时才取消上游请求。请求完成后立即移除，不缓存结果
+    """
+
+    def __init__(self):
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._calls = 0
+        self._upstream = 0
+        self._collapsed = 0
+        self._cancelled = 0
+        self._max_waiters = 0
+
+    def _remove(self, key: Hashable, flight: _Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """执行 fn()，已有相同键的请求在进行时等待它的结果"""
+        self._calls += 1
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.get_running_loop().create_task(fn()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._remove(key, flight))
+            self._upstream += 1
+        else:
+            self._collapsed += 1
+
+        flight.waiters += 1
+        if flight.waiters > self._max_waiters:
+            self._max_waiters = flight.waiters
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # 没有等待方了，后来的相同请求重新发起
+                self._remove(key, flight)
+                flight.task.cancel()
+                self._cancelled += 1
+
+    def stats(self) -> Dict:
+        """合并指标"""
+        return {
+            "calls": self._calls,
+            "upstream_requests": self._upstream,
+            "collapsed": self._collapsed,
+            "collapse_ratio": round(self._collapsed / self._calls, 4) if self._calls else 0.0,
+            "in_flight": len(self._flights),
+            "max_waiters": self._max_waiters,
+            "cancelled": self._cancelled,
+        }
+
+
+# 大模型补全请求
+llm_flights = SingleFlight()
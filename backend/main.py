@@ -1,7 +1,22 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from api import auth, chat, profile, credit_cards
+from database.pool import db_pool, PoolExhaustedError
+from database.async_db import run_db, executor_stats, shutdown_executor
+from database.write_behind import message_writer
+from database.db import probe_schema, get_schema_probe
+from knowledge_base.catalog import card_catalog
+from knowledge_base.search_index import card_search_index
+from llm_service.http_client import llm_http_client
+from llm_service.answer_cache import answer_cache
+from llm_service.single_flight import llm_flights
+from llm_service.limiter import llm_limiter, LimiterRejected
+from llm_service.embedding_batcher import embedding_stats
+from llm_service.prompt_builder import prompt_builder
+from agent.session_store import agent_session_store
 from utils.logger import setup_logger
+from utils.password import password_hasher, PasswordHasherBusy
 from fastapi.security import OAuth2PasswordBearer
 from typing import Optional
 
@@ -35,24 +50,97 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-After-Id", "X-Conversation-Id", "X-Next-Before-Id"],
 )
 
 # 注册路由
 app.include_router(auth.router, prefix="/api/auth", tags=["认证"])
 app.include_router(chat.router, prefix="/api", tags=["聊天"], dependencies=[Depends(oauth2_scheme)])
+# WebSocket 握手无法携带 Authorization 头，连接后用第一条消息认证
+app.include_router(chat.ws_router, prefix="/api", tags=["聊天"])
 app.include_router(profile.router, prefix="/api", tags=["个人中心"], dependencies=[Depends(oauth2_scheme)])
 app.include_router(credit_cards.router, prefix="/api", tags=["信用卡"], dependencies=[Depends(oauth2_scheme)])
 
+@app.exception_handler(PoolExhaustedError)
+async def pool_exhausted_handler(request: Request, exc: PoolExhaustedError):
+    """数据库连接池耗尽时快速返回503，而不是让请求排队超时"""
+    return JSONResponse(status_code=503, content={"detail": "服务繁忙，请稍后重试"})
+
+@app.exception_handler(PasswordHasherBusy)
+async def password_hasher_busy_handler(request: Request, exc: PasswordHasherBusy):
+    """登录/注册请求积压时直接拒绝，保护聊天等其他接口的延迟"""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "登录请求过多，请稍后重试"},
+        headers={"Retry-After": "1"}
+    )
+
+@app.exception_handler(LimiterRejected)
+async def llm_limiter_rejected_handler(request: Request, exc: LimiterRejected):
+    """模型调用排队已满或等待超时时返回503，由客户端稍后重试"""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "模型服务繁忙，请稍后重试"},
+        headers={"Retry-After": str(int(exc.retry_after))}
+    )
+
 @app.on_event("startup")
 async def startup_event():
     """应用启动时的事件处理"""
+    await run_db(probe_schema)
+    message_writer.start()
+    llm_http_client.start()
+    try:
+        await card_catalog.get_snapshot()
+        await card_search_index.ensure_current()
+    except Exception as e:
+        logger.error(f"预加载信用卡目录失败: {str(e)}")
     logger.info("信用卡助手API服务启动")
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """应用关闭时的事件处理"""
+    # 先写完排队的聊天消息，再关闭数据库线程池和连接池
+    await message_writer.drain()
+    await llm_http_client.close()
+    shutdown_executor()
+    password_hasher.shutdown()
+    db_pool.close_all()
     logger.info("信用卡助手API服务关闭")
 
 @app.get("/")
 async def root():
-    return {"message": "信用卡助手API服务"} 
\ No newline at end of file
+    return {"message": "信用卡助手API服务"}
+
+@app.get("/health")
+async def health():
+    """健康检查，返回启动时缓存的数据库探测结果，不发起新的查询"""
+    probe = get_schema_probe()
+    return {
+        "status": "ok" if probe and probe["ok"] else "degraded",
+        "database": probe,
+        "db_pool": db_pool.stats(),
+    }
+
+@app.get("/metrics")
+async def metrics():
+    """运行指标"""
+    return {
+        "db_pool": db_pool.stats(),
+        "db_executor": executor_stats(),
+        "message_writer": message_writer.stats(),
+        "chat_stream": chat.stream_stats(),
+        "chat_deadline": chat.deadline_stats(),
+        "llm_http_client": llm_http_client.stats(),
+        "answer_cache": answer_cache.stats(),
+        "llm_single_flight": llm_flights.stats(),
+        "llm_limiter": llm_limiter.stats(),
+        "embedding_batcher": embedding_stats(),
+        "prompt_builder": prompt_builder.stats(),
+        "agent_sessions": agent_session_store.stats(),
+        "user_cache": auth.user_cache.stats(),
+        "active_conversations": chat.active_conversations.stats(),
+        "password_hasher": password_hasher.stats(),
+        "card_catalog": card_catalog.stats(),
+        "card_search_index": card_search_index.stats(),
+    }
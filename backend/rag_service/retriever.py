@@ -3,15 +3,15 @@ RAG检索器
 实现向量数据库检索功能
 """
 
-from typing import List, Dict
-import numpy as np
+from typing import List, Dict, Optional
 from llm.adapters import DeepSeekAdapter
 
 class RAGRetriever:
     """RAG检索器类"""
     
-    def __init__(self):
-        self.llm = DeepSeekAdapter()
+    def __init__(self, llm: Optional[DeepSeekAdapter] = None):
+        # 默认适配器使用进程共享的 HTTP 客户端
+        self.llm = llm if llm is not None else DeepSeekAdapter()
     
     async def retrieve(self, query: str, top_k: int = 5) -> List[Dict]:
         """检索相关文档"""
@@ -25,6 +25,9 @@ class RAGRetriever:
     def _calculate_similarity(self, query_embedding: List[float], 
                             doc_embedding: List[float]) -> float:
         """计算向量相似度"""
+        # numpy导入较慢，只在真正计算相似度时加载
+        import numpy as np
+        
         query_vector = np.array(query_embedding)
         doc_vector = np.array(doc_embedding)
         return np.dot(query_vector, doc_vector) / (
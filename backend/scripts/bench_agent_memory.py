@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+智能体对话记忆基准测试
+模拟多轮长对话，比较不限长度的对话历史和有界记忆（最近几轮 + 滚动摘要）每轮发给模型的历史上下文大小，
+并测量并入摘要的耗时；使用抽取式摘要，不需要数据库和模型 API
+
+用法:
+    python scripts/bench_agent_memory.py --turns 200 --sessions 20
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from typing import Dict, List
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from agent.memory import ConversationMemory, MESSAGE_OVERHEAD_TOKENS
+from knowledge_base.card_text import estimate_tokens
+
+QUESTIONS = [
+    "我年收入15万左右，经常出差，有什么推荐的信用卡",
+    "招商银行经典白金卡的年费是多少，怎么免",
+    "这张卡的机场贵宾厅每年能用几次",
+    "和中信银行的京东联名卡比哪个更划算",
+    "我主要在网上购物和餐饮消费，积分怎么算",
+    "境外消费有没有返现，外汇手续费多少",
+    "刚毕业的学生可以办哪张卡",
+    "白金卡申请需要什么条件，需要提供收入证明吗",
+    "额度一般能批多少，之后怎么提额",
+    "有没有加油返现比较高的车主卡",
+]
+ANSWER_SENTENCES = [
+    "根据您的情况，推荐优先考虑招商银行经典白金卡。",
+    "该卡首年免年费，之后每年300元，年消费满12笔可以免次年年费。",
+    "持卡人每年可以享受2次国内机场贵宾厅服务，部分机场支持携带同行人。",
+    "京东联名卡在京东消费可以获得3倍积分，更适合经常网购的用户。",
+    "境外消费可享1.5%的返现，但需要注意外汇兑换手续费。",
+    "申请白金卡一般要求年收入8万元以上，并且信用记录良好。",
+    "初始额度通常在1万到5万元之间，按时还款半年后可以申请提额。",
+    "积分可以兑换航空里程、酒店住宿或者商城礼品，兑换比例各不相同。",
+    "如果您经常自驾，可以关注带有加油返现和道路救援权益的车主卡。",
+    "以上信息仅供参考，具体以银行官方公布的最新政策为准。",
+]
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def message_tokens(messages: List[Dict[str, str]]) -> int:
+    return sum(estimate_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS for message in messages)
+
+
+async def run_session(args, rng: random.Random, checkpoints: Dict[int, Dict[str, List[int]]],
+                      fold_latencies: List[float]):
+    memory = ConversationMemory(
+        max_turns=args.max_turns,
+        max_tokens=args.max_tokens,
+        summary_tokens=args.summary_tokens,
+        fold_batch=args.fold_batch,
+    )
+    unbounded: List[Dict[str, str]] = []
+    for turn in range(1, args.turns + 1):
+        question = rng.choice(QUESTIONS)
+        answer = "".join(rng.sample(ANSWER_SENTENCES, rng.randint(3, 7)))
+
+        # 本轮发送给模型的历史上下文（不含当前问题）
+        if turn in checkpoints:
+            checkpoints[turn]["unbounded"].append(message_tokens(unbounded))
+            checkpoints[turn]["bounded"].append(message_tokens(memory.context()))
+
+        unbounded.append({"role": "user", "content": question})
+        unbounded.append({"role": "assistant", "content": answer})
+        memory.add_user(question)
+        memory.add_assistant(answer)
+        start = time.perf_counter()
+        await memory.compact()
+        fold_latencies.append(time.perf_counter() - start)
+    return memory
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="智能体对话记忆基准测试")
+    parser.add_argument("--turns", type=int, default=200, help="每个会话的轮数")
+    parser.add_argument("--sessions", type=int, default=20, help="会话数")
+    parser.add_argument("--max-turns", type=int, default=6, help="原样保留的最近轮数")
+    parser.add_argument("--max-tokens", type=int, default=1500, help="历史上下文 token 上限")
+    parser.add_argument("--summary-tokens", type=int, default=300, help="滚动摘要 token 上限")
+    parser.add_argument("--fold-batch", type=int, default=4, help="每次并入摘要的最少轮数")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    marks = sorted({turn for turn in (1, 10, 25, 50, 100, 150, 200, args.turns) if turn <= args.turns})
+    checkpoints = {turn: {"unbounded": [], "bounded": []} for turn in marks}
+    fold_latencies: List[float] = []
+    memory = None
+    for _ in range(args.sessions):
+        memory = await run_session(args, rng, checkpoints, fold_latencies)
+
+    print(f"{args.sessions} 个会话 × {args.turns} 轮，保留最近 {args.max_turns} 轮，"
+          f"上下文上限 {args.max_tokens} tokens，摘要上限 {args.summary_tokens} tokens\n")
+    print(f"{'轮次':>6} {'不限长度(p50)':>14} {'有界记忆(p50)':>14} {'有界记忆(max)':>14}")
+    for turn in marks:
+        unbounded = checkpoints[turn]["unbounded"]
+        bounded = checkpoints[turn]["bounded"]
+        print(f"{turn:>6} {percentile(unbounded, 50):>14} {percentile(bounded, 50):>14} {max(bounded):>14}")
+
+    print(f"\n每轮并入摘要耗时: p50 {percentile(fold_latencies, 50) * 1e6:.0f} us  "
+          f"p99 {percentile(fold_latencies, 99) * 1e6:.0f} us  max {max(fold_latencies) * 1e6:.0f} us")
+    print(f"最后一个会话: {memory.stats()}")
+    print(f"\n最后一个会话的摘要:\n{memory.summary}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+并发压测脚本
+对运行中的API服务分别以 1、16、128 个并发客户端发起请求，统计每秒请求数和延迟分位
+
+用法:
+    python scripts/bench_concurrency.py --base-url http://localhost:8000 \
+        --username test --password 123456 --path /api/chat/history
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from typing import List, Optional
+
+import httpx
+
+
+async def login(client: httpx.AsyncClient, username: str, password: str) -> str:
+    """登录获取访问令牌"""
+    response = await client.post(
+        "/api/auth/login",
+        data={"username": username, "password": password, "grant_type": "password"}
+    )
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+async def worker(client: httpx.AsyncClient, path: str, headers: dict,
+                 deadline: float, latencies: List[float], errors: List[int]):
+    """在截止时间前循环发请求"""
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            response = await client.get(path, headers=headers)
+            if response.status_code >= 400:
+                errors.append(response.status_code)
+                continue
+        except httpx.HTTPError:
+            errors.append(0)
+            continue
+        latencies.append(time.perf_counter() - start)
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(len(ordered) * pct / 100))
+    return ordered[index]
+
+
+async def run_level(base_url: str, path: str, token: Optional[str],
+                    concurrency: int, duration: float) -> dict:
+    """以指定并发数压测一轮"""
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    latencies: List[float] = []
+    errors: List[int] = []
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60.0) as client:
+        deadline = time.perf_counter() + duration
+        started = time.perf_counter()
+        await asyncio.gather(*[
+            worker(client, path, headers, deadline, latencies, errors)
+            for _ in range(concurrency)
+        ])
+        elapsed = time.perf_counter() - started
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "mean_ms": statistics.mean(latencies) * 1000 if latencies else 0.0,
+    }
+
+
+async def main_async(args):
+    token = args.token
+    if not token and args.username:
+        async with httpx.AsyncClient(base_url=args.base_url, timeout=30.0) as client:
+            token = await login(client, args.username, args.password)
+
+    print(f"压测接口: {args.base_url}{args.path}，每轮 {args.duration} 秒")
+    print(f"{'并发':>6} {'请求数':>8} {'错误':>6} {'RPS':>10} {'p50(ms)':>10} {'p99(ms)':>10}")
+    for concurrency in args.levels:
+        result = await run_level(args.base_url, args.path, token, concurrency, args.duration)
+        print(f"{result['concurrency']:>6} {result['requests']:>8} {result['errors']:>6} "
+              f"{result['rps']:>10.1f} {result['p50_ms']:>10.1f} {result['p99_ms']:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API并发压测")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--path", default="/api/chat/history")
+    parser.add_argument("--token", help="直接使用已有的访问令牌")
+    parser.add_argument("--username", help="用于登录获取令牌的用户名")
+    parser.add_argument("--password", default="")
+    parser.add_argument("--duration", type=float, default=10.0, help="每轮压测秒数")
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 16, 128], help="并发客户端数")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+登录风暴压测脚本
+先单独测量聊天接口的延迟作为基线，再在大量并发登录的同时重复测量，
+用于确认 bcrypt 计算不会拖慢聊天流量
+
+用法:
+    python scripts/bench_login_storm.py --base-url http://localhost:8000 \
+        --username test --password 123456 --logins 64
+"""
+
+import argparse
+import asyncio
+import time
+from collections import Counter
+from typing import List
+
+import httpx
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(len(ordered) * pct / 100))
+    return ordered[index]
+
+
+async def login(client: httpx.AsyncClient, username: str, password: str) -> httpx.Response:
+    return await client.post(
+        "/api/auth/login",
+        data={"username": username, "password": password, "grant_type": "password"}
+    )
+
+
+async def probe_chat(client: httpx.AsyncClient, path: str, token: str,
+                     deadline: float, interval: float) -> List[float]:
+    """在截止时间前按固定间隔请求聊天接口，记录延迟"""
+    headers = {"Authorization": f"Bearer {token}"}
+    latencies = []
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        response = await client.get(path, headers=headers)
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(interval)
+    return latencies
+
+
+async def login_storm(client: httpx.AsyncClient, username: str, password: str,
+                      deadline: float, statuses: Counter):
+    """在截止时间前不断登录"""
+    while time.perf_counter() < deadline:
+        try:
+            response = await login(client, username, password)
+            statuses[response.status_code] += 1
+        except httpx.HTTPError:
+            statuses["error"] += 1
+
+
+def report(title: str, latencies: List[float]):
+    print(f"{title:<10} 样本 {len(latencies):>5}  "
+          f"p50 {percentile(latencies, 50) * 1000:>8.1f} ms  "
+          f"p99 {percentile(latencies, 99) * 1000:>8.1f} ms  "
+          f"max {max(latencies, default=0.0) * 1000:>8.1f} ms")
+
+
+async def main_async(args):
+    limits = httpx.Limits(max_connections=args.logins + 4)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=60.0) as client:
+        response = await login(client, args.username, args.password)
+        response.raise_for_status()
+        token = response.json()["access_token"]
+
+        # 基线：没有登录流量时的聊天接口延迟
+        deadline = time.perf_counter() + args.duration
+        baseline = await probe_chat(client, args.path, token, deadline, args.interval)
+
+        # 登录风暴期间的聊天接口延迟
+        statuses: Counter = Counter()
+        deadline = time.perf_counter() + args.duration
+        storm = [
+            login_storm(client, args.username, args.password, deadline, statuses)
+            for _ in range(args.logins)
+        ]
+        results = await asyncio.gather(
+            probe_chat(client, args.path, token, deadline, args.interval),
+            *storm
+        )
+        during_storm = results[0]
+
+    print(f"探测接口: {args.base_url}{args.path}，并发登录数 {args.logins}，每阶段 {args.duration} 秒")
+    report("基线", baseline)
+    report("登录风暴", during_storm)
+    print("登录结果: " + ", ".join(f"{code}: {count}" for code, count in sorted(statuses.items(), key=str)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="登录风暴下的聊天接口延迟")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--path", default="/api/chat/history", help="用于探测延迟的聊天接口")
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--logins", type=int, default=64, help="并发登录客户端数")
+    parser.add_argument("--duration", type=float, default=10.0, help="每阶段秒数")
+    parser.add_argument("--interval", type=float, default=0.05, help="探测请求间隔秒数")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
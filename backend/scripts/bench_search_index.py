@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+倒排索引基准测试
+生成大量合成信用卡数据，测量整体建索引耗时、增量更新耗时和查询延迟，不需要数据库
+
+用法:
+    python scripts/bench_search_index.py --cards 100000 --queries 2000
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from typing import Dict, List
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from knowledge_base.catalog import CatalogSnapshot
+from knowledge_base.search_index import CardSearchIndex
+
+BANKS = ["招商银行", "工商银行", "建设银行", "中国银行", "农业银行", "交通银行", "浦发银行",
+         "中信银行", "光大银行", "民生银行", "兴业银行", "平安银行", "广发银行", "华夏银行"]
+LEVELS = ["普卡", "金卡", "白金卡", "钻石卡", "无限卡"]
+THEMES = ["经典", "青年", "商务", "旅行", "航空", "车主", "购物", "美食", "运动", "留学",
+          "联名", "数字", "尊享", "优享", "乐享", "悦享", "至尊", "精英", "城市", "主题"]
+BENEFIT_KEYS = ["机场贵宾厅", "积分兑换", "酒店优惠", "餐饮折扣", "加油返现", "航空里程",
+                "免费体检", "道路救援", "境外返现", "高铁贵宾", "电影票优惠", "视频会员"]
+BENEFIT_VALUES = ["每年6次", "无限次", "消费满100返10", "5折优惠", "1%返现", "每20元累积1里程",
+                  "首年免费", "全国可用", "限指定商户", "每月1次"]
+REQUIREMENTS = ["年满18周岁", "稳定工作", "年收入10万以上", "年收入30万以上", "良好信用记录"]
+
+QUERIES = [
+    "招商银行有哪些白金卡", "免年费的信用卡推荐", "经常出差适合办哪张航空卡",
+    "机场贵宾厅无限次的卡", "加油返现比较高的车主卡", "学生可以办的青年卡",
+    "境外消费返现", "酒店优惠和积分兑换", "工商银行钻石卡申请条件", "每月视频会员权益",
+]
+
+
+def synthetic_card(card_id: int, rng: random.Random) -> Dict:
+    bank = rng.choice(BANKS)
+    level = rng.choice(LEVELS)
+    name = f"{bank[:2]}{rng.choice(THEMES)}{rng.choice(THEMES)}{level}{card_id}"
+    benefits = {key: rng.choice(BENEFIT_VALUES) for key in rng.sample(BENEFIT_KEYS, 4)}
+    return {
+        "id": card_id,
+        "bank": bank,
+        "name": name,
+        "level": level,
+        "annual_fee": rng.choice(["免年费", "首年免年费，刷卡6次免次年年费", "年费600元"]),
+        "benefits": benefits,
+        "requirements": {"申请条件": rng.sample(REQUIREMENTS, 2)},
+        "points_rule": f"每消费{rng.choice([10, 20, 50])}元累积1积分",
+        "credit_limit": f"{rng.choice([1, 5, 10, 20, 50])}万元",
+        "timestamp": None,
+        "created_at": None,
+        "updated_at": None,
+    }
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="信用卡倒排索引基准测试")
+    parser.add_argument("--cards", type=int, default=100000, help="合成卡片数")
+    parser.add_argument("--queries", type=int, default=2000, help="查询次数")
+    parser.add_argument("--changes", type=int, default=100, help="增量更新时修改的卡片数")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    cards = [synthetic_card(card_id, rng) for card_id in range(1, args.cards + 1)]
+    index = CardSearchIndex()
+
+    snapshot = CatalogSnapshot(1, None, cards)
+    start = time.perf_counter()
+    index.sync(snapshot)
+    build_seconds = time.perf_counter() - start
+    stats = index.stats()
+    print(f"整体建索引: {args.cards} 张卡片, {stats['terms']} 个词, 耗时 {build_seconds:.2f} 秒")
+
+    # 增量更新：修改部分卡片、删除一张、新增一张
+    changed = list(cards)
+    for position in rng.sample(range(len(changed)), args.changes):
+        card = dict(changed[position])
+        card["benefits"] = {**card["benefits"], "新增权益": rng.choice(BENEFIT_VALUES)}
+        changed[position] = card
+    changed.pop()
+    changed.append(synthetic_card(args.cards + 1, rng))
+    snapshot = CatalogSnapshot(2, None, changed)
+    start = time.perf_counter()
+    added, updated, removed = index.sync(snapshot)
+    print(f"增量更新: 新增 {added}, 更新 {updated}, 删除 {removed}, "
+          f"耗时 {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    latencies = []
+    for i in range(args.queries):
+        query = QUERIES[i % len(QUERIES)]
+        start = time.perf_counter()
+        index.search(query, args.top_k)
+        latencies.append(time.perf_counter() - start)
+    print(f"查询 {args.queries} 次: "
+          f"p50 {percentile(latencies, 50) * 1e6:.0f} us  "
+          f"p99 {percentile(latencies, 99) * 1e6:.0f} us  "
+          f"max {max(latencies) * 1e6:.0f} us")
+
+    print("\n示例结果:")
+    for query in QUERIES[:3]:
+        names = [card["name"] for card in index.search(query, 3)]
+        print(f"  {query}: {', '.join(names)}")
+
+
+if __name__ == "__main__":
+    main()
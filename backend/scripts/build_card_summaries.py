@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+为 credit_cards 生成卡片摘要
+只处理没有摘要或内容哈希与摘要不一致的卡片，可重复执行；缺少摘要列时先执行
+database/migrations/004_credit_cards_summary.sql 中的变更
+
+用法:
+    python scripts/build_card_summaries.py [--force]
+"""
+
+import argparse
+import json
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from database.db import get_db_connection
+from knowledge_base.catalog import parse_card_row
+from knowledge_base.summaries import content_hash, summarize_card
+
+ADD_COLUMNS_SQL = """
+ALTER TABLE credit_cards
+    ADD COLUMN summary TEXT AFTER credit_limit,
+    ADD COLUMN key_facts JSON AFTER summary,
+    ADD COLUMN summary_hash CHAR(32) AFTER key_facts
+"""
+
+UPDATE_SQL = "UPDATE credit_cards SET summary = %s, key_facts = %s, summary_hash = %s WHERE id = %s"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成信用卡摘要")
+    parser.add_argument("--force", action="store_true", help="重新生成所有卡片的摘要")
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute("SHOW COLUMNS FROM credit_cards LIKE 'summary_hash'")
+        if cursor.fetchall():
+            print("摘要列已存在")
+        else:
+            print("添加 summary、key_facts、summary_hash 列...")
+            cursor.execute(ADD_COLUMNS_SQL)
+
+        cursor.execute("SELECT * FROM credit_cards ORDER BY id")
+        rows = cursor.fetchall()
+        updates = []
+        for row in rows:
+            card = parse_card_row(row)
+            if not args.force and row.get("summary") and row.get("summary_hash") == content_hash(card):
+                continue
+            summary = summarize_card(card)
+            updates.append((
+                summary.summary,
+                json.dumps(summary.key_facts, ensure_ascii=False),
+                summary.content_hash,
+                row["id"],
+            ))
+
+        if updates:
+            cursor.executemany(UPDATE_SQL, updates)
+        conn.commit()
+        print(f"完成，生成摘要 {len(updates)} 张，已是最新 {len(rows) - len(updates)} 张")
+    finally:
+        cursor.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+为 credit_cards 建立 ngram 全文索引
+执行 database/migrations/001_credit_cards_fulltext.sql 中的变更，已存在的列和索引会跳过，可重复执行
+
+用法:
+    python scripts/create_fulltext_index.py
+"""
+
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import mysql.connector
+
+from config import DB_CONFIG
+from knowledge_base.fulltext import FULLTEXT_INDEX
+
+ADD_COLUMN_SQL = """
+ALTER TABLE credit_cards
+    ADD COLUMN search_text TEXT GENERATED ALWAYS AS (
+        CONCAT_WS(' ',
+            name, name, bank, bank, level,
+            CAST(benefits AS CHAR),
+            CAST(requirements AS CHAR),
+            points_rule
+        )
+    ) STORED
+"""
+
+ADD_INDEX_SQL = f"""
+ALTER TABLE credit_cards
+    ADD FULLTEXT INDEX {FULLTEXT_INDEX} (search_text) WITH PARSER ngram
+"""
+
+
+def main():
+    # 不使用 get_db_connection()：它开启了 raise_on_warnings，
+    # 首次建立全文索引时 InnoDB 重建表（添加 FTS_DOC_ID）产生的警告会被当作错误
+    conn = mysql.connector.connect(**DB_CONFIG)
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute("SHOW COLUMNS FROM credit_cards LIKE 'search_text'")
+        if cursor.fetchall():
+            print("search_text 列已存在，跳过")
+        else:
+            print("添加 search_text 生成列...")
+            cursor.execute(ADD_COLUMN_SQL)
+
+        cursor.execute("SHOW INDEX FROM credit_cards WHERE Key_name = %s", (FULLTEXT_INDEX,))
+        if cursor.fetchall():
+            print(f"全文索引 {FULLTEXT_INDEX} 已存在，跳过")
+        else:
+            print(f"建立全文索引 {FULLTEXT_INDEX}...")
+            cursor.execute(ADD_INDEX_SQL)
+
+        conn.commit()
+        cursor.execute("SELECT COUNT(*) AS count FROM credit_cards")
+        print(f"完成，已索引 {cursor.fetchone()['count']} 张信用卡")
+    finally:
+        cursor.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
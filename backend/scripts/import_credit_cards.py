@@ -3,7 +3,7 @@ import json
 import logging
 import sys
 import os
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 import mysql.connector
 from mysql.connector import Error
 from pathlib import Path
@@ -12,12 +12,15 @@ from datetime import datetime
 # 添加项目根目录到 Python 路径
 project_root = Path(__file__).parent.parent.parent
 sys.path.append(str(project_root))
+sys.path.append(str(project_root / 'backend'))
 
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from models import Base, CreditCard
 from config import Settings
 from backend.database.db import get_db_connection
+from knowledge_base.catalog import parse_card_row
+from knowledge_base.summaries import content_hash, summarize_card
 
 # 配置日志
 logging.basicConfig(
@@ -70,6 +73,28 @@ def format_application_condition(condition: Dict) -> str:
         return '，'.join(f"{v}" for v in condition.values())
     return str(condition)
 
+def card_summary_values(card: Dict, existing_hashes: Dict[Tuple[str, str], Optional[str]]) -> Tuple:
+    """生成摘要列 (summary, key_facts, summary_hash) 的值
+
+    哈希按数据库回读后的内容计算；与库中已有摘要的哈希相同时不重新生成，
+    摘要列传空值，由 ON DUPLICATE KEY UPDATE 保留原摘要
+    """
+    parsed = parse_card_row({
+        'bank': card['bank'],
+        'name': card['name'],
+        'level': card['level'],
+        'annual_fee': card['annual_fee'],
+        'benefits': json.dumps(card['benefits'], ensure_ascii=False),
+        'requirements': json.dumps(card['requirements'], ensure_ascii=False),
+        'points_rule': card['points_rule'],
+        'credit_limit': card['credit_limit'],
+    })
+    digest = content_hash(parsed)
+    if existing_hashes.get((card['bank'], card['name'])) == digest:
+        return None, None, digest
+    summary = summarize_card(parsed)
+    return summary.summary, json.dumps(summary.key_facts, ensure_ascii=False), summary.content_hash
+
 def import_credit_cards(json_file_path):
     try:
         # 读取 JSON 文件
@@ -85,11 +110,16 @@ def import_credit_cards(json_file_path):
             sql_create_table = f.read()
             cursor.execute(sql_create_table)
 
+        # 已有卡片的摘要哈希，内容未变化的卡片不重新生成摘要
+        cursor.execute("SELECT bank, name, summary_hash FROM credit_cards")
+        existing_hashes = {(bank, name): summary_hash for bank, name, summary_hash in cursor.fetchall()}
+
         # 准备插入语句
         insert_query = """
         INSERT INTO credit_cards 
-        (bank, name, timestamp, level, annual_fee, benefits, requirements, points_rule, credit_limit)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+        (bank, name, timestamp, level, annual_fee, benefits, requirements, points_rule, credit_limit,
+         summary, key_facts, summary_hash)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
         ON DUPLICATE KEY UPDATE
         timestamp = VALUES(timestamp),
         level = VALUES(level),
@@ -97,11 +127,18 @@ def import_credit_cards(json_file_path):
         benefits = VALUES(benefits),
         requirements = VALUES(requirements),
         points_rule = VALUES(points_rule),
-        credit_limit = VALUES(credit_limit)
+        credit_limit = VALUES(credit_limit),
+        summary = IF(summary_hash <=> VALUES(summary_hash), summary, VALUES(summary)),
+        key_facts = IF(summary_hash <=> VALUES(summary_hash), key_facts, VALUES(key_facts)),
+        summary_hash = VALUES(summary_hash)
         """
 
         # 插入数据
+        summarized = 0
         for card in credit_cards:
+            summary_values = card_summary_values(card, existing_hashes)
+            if summary_values[0] is not None:
+                summarized += 1
             values = (
                 card['bank'],
                 card['name'],
@@ -111,13 +148,15 @@ def import_credit_cards(json_file_path):
                 json.dumps(card['benefits'], ensure_ascii=False),
                 json.dumps(card['requirements'], ensure_ascii=False),
                 card['points_rule'],
-                card['credit_limit']
+                card['credit_limit'],
+                *summary_values
             )
             cursor.execute(insert_query, values)
 
         # 提交事务
         conn.commit()
-        print(f"成功导入 {len(credit_cards)} 条信用卡数据")
+        print(f"成功导入 {len(credit_cards)} 条信用卡数据，生成摘要 {summarized} 张，"
+              f"内容未变化 {len(credit_cards) - summarized} 张")
 
     except Exception as e:
         print(f"导入数据时出错: {str(e)}")
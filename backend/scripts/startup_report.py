@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+启动耗时报告
+用 python -X importtime 在子进程中导入 main，统计导入总耗时和最慢的模块，
+并检查 selenium、numpy 等重型依赖是否进入了API进程的导入链
+
+用法:
+    python scripts/startup_report.py --budget 1.0 --top 20
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# API进程不应在启动时加载的重型模块
+HEAVY_MODULES = ("selenium", "numpy", "pandas", "torch", "langchain")
+
+LINE_PATTERN = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s+)(\S+)$")
+
+
+def collect_import_times(module: str) -> List[Tuple[int, int, int, str]]:
+    """在子进程中导入模块，返回 (自身耗时us, 累计耗时us, 层级, 模块名) 列表"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        print(result.stderr, file=sys.stderr)
+        raise SystemExit(f"导入 {module} 失败")
+
+    entries = []
+    for line in result.stderr.splitlines():
+        match = LINE_PATTERN.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, name = match.groups()
+        level = (len(indent) - 1) // 2
+        entries.append((int(self_us), int(cumulative_us), level, name))
+    return entries
+
+
+def summarize_packages(entries: List[Tuple[int, int, int, str]]) -> Dict[str, int]:
+    """按顶层包汇总自身耗时"""
+    totals: Dict[str, int] = {}
+    for self_us, _, _, name in entries:
+        package = name.split(".")[0]
+        totals[package] = totals.get(package, 0) + self_us
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API进程启动导入耗时报告")
+    parser.add_argument("--module", default="main", help="要导入的入口模块")
+    parser.add_argument("--budget", type=float, default=1.0, help="导入耗时预算（秒）")
+    parser.add_argument("--top", type=int, default=20, help="显示最慢的模块数")
+    args = parser.parse_args()
+
+    entries = collect_import_times(args.module)
+    total_us = sum(self_us for self_us, _, _, _ in entries)
+
+    print(f"导入 {args.module} 共 {len(entries)} 个模块，总耗时 {total_us / 1e6:.3f} 秒（预算 {args.budget:.3f} 秒）\n")
+
+    print(f"最慢的 {args.top} 个模块（累计耗时）:")
+    for self_us, cumulative_us, level, name in sorted(entries, key=lambda e: e[1], reverse=True)[:args.top]:
+        print(f"  {cumulative_us / 1000:>9.1f} ms  自身 {self_us / 1000:>8.1f} ms  {'  ' * level}{name}")
+
+    print("\n按顶层包汇总（自身耗时）:")
+    packages = summarize_packages(entries)
+    for package, package_us in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"  {package_us / 1000:>9.1f} ms  {package}")
+
+    heavy = sorted(package for package in packages if package in HEAVY_MODULES)
+    if heavy:
+        print(f"\n警告: 启动时加载了重型模块: {', '.join(heavy)}")
+
+    if total_us / 1e6 > args.budget or heavy:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
-from ..utils.logger import setup_logger
-from ..utils.db import Database
+from utils.logger import setup_logger
+from utils.db import Database
+from typing import Dict, List
 import json
 
 # 设置日志记录器
@@ -29,7 +30,8 @@ class ChatService:
             logger.error(f"处理消息时出错: {str(e)}")
             return "抱歉，我遇到了一些问题，请稍后再试。"
 
-    def _analyze_intent(self, message):
+    @staticmethod
+    def _analyze_intent(message):
         """分析消息意图"""
         message = message.lower()
         
@@ -78,36 +80,39 @@ class ChatService:
             """
             self.db.execute(sql)
             cards = self.db.fetchall()
-            
-            # 构建推荐回复
-            response = "根据您的需求，我为您推荐以下信用卡：\n\n"
-            for card in cards:
-                response += f"【{card['bank_name']} {card['card_name']}】\n"
-                response += f"等级：{card['card_level']}\n"
-                response += f"年费：{card['annual_fee']}\n"
-                response += f"额度：{card['credit_limit']}\n"
-                
-                # 解析权益信息
-                try:
-                    benefits = json.loads(card['benefits'])
-                    response += "主要权益：\n"
-                    for key, value in benefits.items():
-                        response += f"- {value}\n"
-                except:
-                    response += f"主要权益：{card['benefits']}\n"
-                
-                response += "\n"
-            
-            return response
+            return self._format_recommendation(cards)
         except Exception as e:
             logger.error(f"处理推荐请求时出错: {str(e)}")
             return "抱歉，生成推荐时出现错误。请稍后再试。"
 
+    @staticmethod
+    def _format_recommendation(cards):
+        """构建推荐回复"""
+        response = "根据您的需求，我为您推荐以下信用卡：\n\n"
+        for card in cards:
+            response += f"【{card['bank_name']} {card['card_name']}】\n"
+            response += f"等级：{card['card_level']}\n"
+            response += f"年费：{card['annual_fee']}\n"
+            response += f"额度：{card['credit_limit']}\n"
+            
+            # 解析权益信息
+            try:
+                benefits = _parse_benefits(card['benefits'])
+                response += "主要权益：\n"
+                for key, value in benefits.items():
+                    response += f"- {value}\n"
+            except:
+                response += f"主要权益：{card['benefits']}\n"
+            
+            response += "\n"
+        
+        return response
+
     def _handle_search(self, message):
         """处理搜索请求"""
         try:
             # 提取搜索关键词
-            keywords = message.replace('查询', '').replace('搜索', '').replace('找', '').strip()
+            keywords = self._search_keywords(message)
             
             # 搜索数据库
             sql = """
@@ -121,21 +126,29 @@ class ChatService:
             search_param = f"%{keywords}%"
             self.db.execute(sql, (search_param, search_param, search_param))
             results = self.db.fetchall()
-            
-            if not results:
-                return f'抱歉，没有找到与"{keywords}"相关的信用卡。'
-            
-            response = f"为您找到以下相关信用卡：\n\n"
-            for card in results:
-                response += f"【{card['bank_name']} {card['card_name']}】\n"
-                response += f"等级：{card['card_level']}\n"
-                response += f"年费：{card['annual_fee']}\n\n"
-            
-            return response
+            return self._format_search(results, keywords)
         except Exception as e:
             logger.error(f"处理搜索请求时出错: {str(e)}")
             return "抱歉，搜索时出现错误。请稍后再试。"
 
+    @staticmethod
+    def _search_keywords(message):
+        return message.replace('查询', '').replace('搜索', '').replace('找', '').strip()
+
+    @staticmethod
+    def _format_search(results, keywords):
+        """构建搜索结果回复"""
+        if not results:
+            return f'抱歉，没有找到与"{keywords}"相关的信用卡。'
+        
+        response = f"为您找到以下相关信用卡：\n\n"
+        for card in results:
+            response += f"【{card['bank_name']} {card['card_name']}】\n"
+            response += f"等级：{card['card_level']}\n"
+            response += f"年费：{card['annual_fee']}\n\n"
+        
+        return response
+
     def _handle_comparison(self, message):
         """处理比较请求"""
         try:
@@ -150,7 +163,7 @@ class ChatService:
         """处理年费查询"""
         try:
             # 提取银行或卡片名称
-            keywords = message.replace('年费', '').replace('费用', '').strip()
+            keywords = self._fee_keywords(message)
             
             sql = """
             SELECT bank_name, card_name, annual_fee
@@ -162,25 +175,33 @@ class ChatService:
             search_param = f"%{keywords}%"
             self.db.execute(sql, (search_param, search_param))
             results = self.db.fetchall()
-            
-            if not results:
-                return f'抱歉，没有找到与"{keywords}"相关的年费信息。'
-            
-            response = f"为您找到以下年费信息：\n\n"
-            for card in results:
-                response += f"【{card['bank_name']} {card['card_name']}】\n"
-                response += f"年费政策：{card['annual_fee']}\n\n"
-            
-            return response
+            return self._format_fee(results, keywords)
         except Exception as e:
             logger.error(f"处理年费查询时出错: {str(e)}")
             return "抱歉，查询年费信息时出现错误。请稍后再试。"
 
+    @staticmethod
+    def _fee_keywords(message):
+        return message.replace('年费', '').replace('费用', '').strip()
+
+    @staticmethod
+    def _format_fee(results, keywords):
+        """构建年费信息回复"""
+        if not results:
+            return f'抱歉，没有找到与"{keywords}"相关的年费信息。'
+        
+        response = f"为您找到以下年费信息：\n\n"
+        for card in results:
+            response += f"【{card['bank_name']} {card['card_name']}】\n"
+            response += f"年费政策：{card['annual_fee']}\n\n"
+        
+        return response
+
     def _handle_benefits_query(self, message):
         """处理权益查询"""
         try:
             # 提取银行或卡片名称
-            keywords = message.replace('权益', '').replace('优惠', '').replace('好处', '').strip()
+            keywords = self._benefits_keywords(message)
             
             sql = """
             SELECT bank_name, card_name, benefits
@@ -192,31 +213,77 @@ class ChatService:
             search_param = f"%{keywords}%"
             self.db.execute(sql, (search_param, search_param))
             results = self.db.fetchall()
-            
-            if not results:
-                return f'抱歉，没有找到与"{keywords}"相关的权益信息。'
-            
-            response = f"为您找到以下权益信息：\n\n"
-            for card in results:
-                response += f"【{card['bank_name']} {card['card_name']}】\n"
-                try:
-                    benefits = json.loads(card['benefits'])
-                    for key, value in benefits.items():
-                        response += f"- {value}\n"
-                except:
-                    response += f"{card['benefits']}\n"
-                response += "\n"
-            
-            return response
+            return self._format_benefits(results, keywords)
         except Exception as e:
             logger.error(f"处理权益查询时出错: {str(e)}")
             return "抱歉，查询权益信息时出现错误。请稍后再试。"
 
-    def _handle_general_query(self, message):
+    @staticmethod
+    def _benefits_keywords(message):
+        return message.replace('权益', '').replace('优惠', '').replace('好处', '').strip()
+
+    @staticmethod
+    def _format_benefits(results, keywords):
+        """构建权益信息回复"""
+        if not results:
+            return f'抱歉，没有找到与"{keywords}"相关的权益信息。'
+        
+        response = f"为您找到以下权益信息：\n\n"
+        for card in results:
+            response += f"【{card['bank_name']} {card['card_name']}】\n"
+            try:
+                benefits = _parse_benefits(card['benefits'])
+                for key, value in benefits.items():
+                    response += f"- {value}\n"
+            except:
+                response += f"{card['benefits']}\n"
+            response += "\n"
+        
+        return response
+
+    @staticmethod
+    def _handle_general_query(message):
         """处理一般性查询"""
         return "您可以问我关于信用卡的问题，比如：\n\n" + \
                "1. 推荐一些适合我的信用卡\n" + \
                "2. 查询某个银行的信用卡\n" + \
                "3. 比较不同信用卡的区别\n" + \
                "4. 查询信用卡年费政策\n" + \
-               "5. 了解信用卡的权益" 
\ No newline at end of file
+               "5. 了解信用卡的权益"
+
+    @classmethod
+    def answer_from_cards(cls, message: str, cards: List[Dict]) -> str:
+        """用已检索到的卡片按意图生成模板回答，不查询数据库也不调用模型
+
+        cards 为信用卡目录中的卡片（bank/name/level 字段），模型超时时作为降级回答
+        """
+        rows = [_catalog_row(card) for card in cards]
+        intent = cls._analyze_intent(message)
+        if intent == 'search':
+            return cls._format_search(rows, cls._search_keywords(message))
+        elif intent == 'fee':
+            return cls._format_fee(rows, cls._fee_keywords(message))
+        elif intent == 'benefits':
+            return cls._format_benefits(rows[:3], cls._benefits_keywords(message))
+        elif rows:
+            # 推荐、比较和一般问题都列出检索到的卡片
+            return cls._format_recommendation(rows[:3])
+        else:
+            return cls._handle_general_query(message)
+
+
+def _parse_benefits(benefits) -> Dict:
+    """权益可能是JSON字符串（数据库行）或已解析的字典（目录卡片）"""
+    return benefits if isinstance(benefits, dict) else json.loads(benefits)
+
+
+def _catalog_row(card: Dict) -> Dict:
+    """把目录卡片转换为格式化函数使用的字段名"""
+    return {
+        'bank_name': card.get('bank'),
+        'card_name': card.get('name'),
+        'card_level': card.get('level'),
+        'annual_fee': card.get('annual_fee'),
+        'credit_limit': card.get('credit_limit'),
+        'benefits': card.get('benefits') or {},
+    }
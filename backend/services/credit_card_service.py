@@ -54,15 +54,14 @@ class CreditCardService:
         """搜索信用卡"""
         try:
             sql = """
-            SELECT id, bank_name, card_name, card_level, annual_fee,
-                   credit_limit, points_rule, benefits, requirements
+            SELECT id, bank AS bank_name, name AS card_name, level AS card_level, annual_fee,
+                   credit_limit, points_rule, benefits, requirements,
+                   MATCH(search_text) AGAINST (%s IN NATURAL LANGUAGE MODE) AS relevance
             FROM credit_cards
-            WHERE bank_name LIKE %s 
-               OR card_name LIKE %s
-               OR card_level LIKE %s
+            WHERE MATCH(search_text) AGAINST (%s IN NATURAL LANGUAGE MODE)
+            ORDER BY relevance DESC
             """
-            search_param = f"%{keyword}%"
-            self.db.execute(sql, (search_param, search_param, search_param))
+            self.db.execute(sql, (keyword, keyword))
             cards = self.db.fetchall()
             logger.info(f"使用关键词 '{keyword}' 搜索到 {len(cards)} 张信用卡")
             return cards
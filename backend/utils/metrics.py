@@ -0,0 +1,64 @@
+"""
+运行指标
+固定分桶的直方图，用于统计首字延迟、提示词长度等分布，结果通过 /metrics 输出
+"""
+
+import bisect
+import threading
+from typing import Dict, Sequence
+
+# 默认分桶上界（毫秒）
+LATENCY_BUCKETS_MS = (50, 100, 250, 500, 750, 1000, 1500, 2000, 3000, 5000, 10000, 30000)
+
+
+class Histogram:
+    """固定分桶直方图
+
+    只保存每个桶的计数，内存占用固定；分位数按所在桶的上界估算。
+    """
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS_MS, unit: str = "ms"):
+        self.buckets = tuple(sorted(buckets))
+        self.unit = unit
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._count = 0
+        self._sum = 0.0
+        self._max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        """记录一个样本"""
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._count += 1
+            self._sum += value
+            if value > self._max:
+                self._max = value
+
+    def _quantile(self, q: float) -> float:
+        if not self._count:
+            return 0.0
+        rank = q * self._count
+        seen = 0
+        for index, count in enumerate(self._counts):
+            seen += count
+            if seen >= rank:
+                return self.buckets[index] if index < len(self.buckets) else self._max
+        return self._max
+
+    def stats(self) -> Dict:
+        """直方图指标"""
+        with self._lock:
+            buckets = {f"le_{bound:g}": count for bound, count in zip(self.buckets, self._counts)}
+            buckets["le_inf"] = self._counts[-1]
+            return {
+                "unit": self.unit,
+                "count": self._count,
+                "avg": round(self._sum / self._count, 2) if self._count else 0.0,
+                "p50": self._quantile(0.5),
+                "p90": self._quantile(0.9),
+                "p99": self._quantile(0.99),
+                "max": round(self._max, 2),
+                "buckets": buckets,
+            }
@@ -0,0 +1,77 @@
+"""
+密码哈希
+在独立的有界线程池中执行 bcrypt，排队过长时快速拒绝，避免占满事件循环
+"""
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict
+
+import bcrypt
+
+from config import settings
+
+
+class PasswordHasherBusy(Exception):
+    """等待哈希的请求过多，需要调用方稍后重试"""
+
+
+class PasswordHasher:
+    """bcrypt 哈希/校验执行器
+
+    bcrypt 在计算时会释放GIL，放到专用线程中既不会阻塞事件循环，
+    也不会与数据库线程池抢占工作线程。
+    """
+
+    def __init__(self, workers: int = 2, max_pending: int = 32):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._completed = 0
+        self._rejected = 0
+
+    async def _submit(self, func, *args):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._rejected += 1
+                raise PasswordHasherBusy("密码校验排队已满")
+            self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, func, *args)
+        finally:
+            with self._lock:
+                self._pending -= 1
+                self._completed += 1
+
+    async def hash(self, password: str) -> str:
+        """生成密码哈希"""
+        hashed = await self._submit(bcrypt.hashpw, password.encode(), bcrypt.gensalt())
+        return hashed.decode()
+
+    async def verify(self, password: str, password_hash: str) -> bool:
+        """校验密码"""
+        return await self._submit(bcrypt.checkpw, password.encode(), password_hash.encode())
+
+    def stats(self) -> Dict:
+        """执行器指标"""
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "pending": self._pending,
+                "completed": self._completed,
+                "rejected": self._rejected,
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+password_hasher = PasswordHasher(
+    workers=settings.PASSWORD_HASH_WORKERS,
+    max_pending=settings.PASSWORD_HASH_MAX_PENDING
+)
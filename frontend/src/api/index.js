@@ -68,10 +68,57 @@ export const cards = {
   compare: (ids) => authApi.post('/cards/compare', { card_ids: ids })
 }
 
+// 解析服务端事件流，token 事件交给 onToken，error 事件抛出异常
+const streamMessage = async (message, onToken) => {
+  const token = localStorage.getItem('token')
+  const response = await fetch(`${authApi.defaults.baseURL}/chat/stream`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+      ...(token ? { Authorization: `Bearer ${token}` } : {})
+    },
+    body: JSON.stringify({ message })
+  })
+  if (response.status === 401) {
+    localStorage.removeItem('token')
+    window.location.href = '/login'
+    return
+  }
+  if (!response.ok || !response.body) {
+    throw new Error(`流式请求失败: ${response.status}`)
+  }
+
+  const reader = response.body.getReader()
+  const decoder = new TextDecoder()
+  let buffer = ''
+  while (true) {
+    const { value, done } = await reader.read()
+    if (done) break
+    buffer += decoder.decode(value, { stream: true })
+
+    let boundary
+    while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+      const raw = buffer.slice(0, boundary)
+      buffer = buffer.slice(boundary + 2)
+      let event = 'message'
+      let data = ''
+      for (const line of raw.split('\n')) {
+        if (line.startsWith('event:')) event = line.slice(6).trim()
+        else if (line.startsWith('data:')) data += line.slice(5).trim()
+      }
+      if (!data) continue
+      const payload = JSON.parse(data)
+      if (event === 'token') onToken(payload.content)
+      else if (event === 'error') throw new Error(payload.detail)
+    }
+  }
+}
+
 // 聊天相关API（需要认证）
 export const chat = {
   sendMessage: (message) => authApi.post('/chat', { message }),
-  getHistory: () => authApi.get('/chat/history'),
+  streamMessage,
+  getHistory: (params) => authApi.get('/chat/history', { params }),
   newConversation: () => authApi.post('/chat/new'),
   clearHistory: () => authApi.delete('/chat/history'),
   deleteMessage: (messageId) => authApi.delete(`/chat/message/${messageId}`)